@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from django.contrib.auth import get_user_model
+        from django.db.models.signals import post_delete, post_save
+
+        from .firebase_auth import olvidar_usuario_guardado
+
+        # Los usuarios autenticados con Firebase se sirven de memoria: al cambiar, se olvidan
+        modelo = get_user_model()
+        post_save.connect(olvidar_usuario_guardado, sender=modelo, dispatch_uid='firebase_auth_usuario')
+        post_delete.connect(olvidar_usuario_guardado, sender=modelo, dispatch_uid='firebase_auth_usuario')
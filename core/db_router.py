@@ -0,0 +1,145 @@
+# core/db_router.py
+
+import contextvars
+import random
+from contextlib import contextmanager
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+
+COOKIE_PRIMARIA = 'leer_primaria'
+APPS_EN_REPLICA = {'libros'}
+
+# Se activa sólo dentro de las vistas marcadas con @lectura_en_replica
+_usar_replica = contextvars.ContextVar('usar_replica', default=False)
+
+
+def replicas():
+    return [alias for alias in settings.DATABASES if alias.startswith('replica_')]
+
+
+class ReplicaRouter:
+    """Lecturas del catálogo a réplicas en las vistas públicas; todo lo demás, a la primaria.
+
+    Sesiones, usuarios y admin nunca leen de una réplica: sólo los modelos de
+    APPS_EN_REPLICA y sólo mientras dura una vista marcada con @lectura_en_replica.
+    """
+
+    def db_for_read(self, model, **hints):
+        if _usar_replica.get() and model._meta.app_label in APPS_EN_REPLICA:
+            disponibles = replicas()
+            if disponibles:
+                return random.choice(disponibles)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Primaria y réplicas contienen los mismos datos
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+def _debe_leer_primaria(request):
+    return COOKIE_PRIMARIA in request.COOKIES
+
+
+def lectura_en_replica(vista):
+    """Decorador: las consultas de lectura de la vista van a una réplica si la hay."""
+    if iscoroutinefunction(vista):
+        @wraps(vista)
+        async def envoltura_async(request, *args, **kwargs):
+            if _debe_leer_primaria(request):
+                return await vista(request, *args, **kwargs)
+            # El ORM asíncrono copia el contexto al hilo donde ejecuta la consulta
+            token = _usar_replica.set(True)
+            try:
+                return await vista(request, *args, **kwargs)
+            finally:
+                _usar_replica.reset(token)
+        return envoltura_async
+
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        if _debe_leer_primaria(request):
+            return vista(request, *args, **kwargs)
+        token = _usar_replica.set(True)
+        try:
+            return vista(request, *args, **kwargs)
+        finally:
+            _usar_replica.reset(token)
+    return envoltura
+
+
+@contextmanager
+def lectura_en_primaria():
+    """Dentro de una vista con réplicas, devuelve las lecturas a la primaria.
+
+    Para lo que se guarda en la caché compartida: leído de una réplica con retraso, lo
+    anterior a una escritura quedaría cacheado para todos (la cookie de COOKIE_PRIMARIA
+    sólo protege a quien escribió).
+    """
+    token = _usar_replica.set(False)
+    try:
+        yield
+    finally:
+        _usar_replica.reset(token)
+
+
+class LecturaEnReplicaMixin:
+    """Equivalente de @lectura_en_replica para vistas basadas en clases."""
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return lectura_en_replica(super().as_view(**initkwargs))
+
+
+class FijarPrimariaMiddleware:
+    """Read-your-writes: tras un POST/PUT/DELETE con éxito de un usuario autenticado,
+    marca con una cookie corta que sus lecturas deben ir a la primaria.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        usuario = getattr(request, 'user', None)
+        if self._es_escritura(request, response) and usuario is not None and usuario.is_authenticated:
+            self._fijar_primaria(response)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if (
+            self._es_escritura(request, response)
+            and hasattr(request, 'auser')
+            and (await request.auser()).is_authenticated
+        ):
+            self._fijar_primaria(response)
+        return response
+
+    @staticmethod
+    def _es_escritura(request, response):
+        return (
+            request.method not in ('GET', 'HEAD', 'OPTIONS')
+            and response.status_code < 400
+            and bool(replicas())
+        )
+
+    @staticmethod
+    def _fijar_primaria(response):
+        response.set_cookie(COOKIE_PRIMARIA, '1', max_age=settings.REPLICA_RETRASO_MAXIMO,
+                            httponly=True, samesite='Lax')
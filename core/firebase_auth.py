@@ -0,0 +1,318 @@
+# core/firebase_auth.py
+#
+# Autenticación con ID tokens de Firebase Auth verificados en local: la firma se comprueba
+# con PyJWT contra los certificados públicos de Google (descargados una vez y guardados lo
+# que diga su Cache-Control), y los tokens ya verificados y los usuarios se recuerdan en
+# memoria. Una petición autenticada no hace ninguna llamada de red.
+
+import copy
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import urllib.request
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from cachetools import TLRUCache, TTLCache
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import BaseBackend
+
+
+logger = logging.getLogger(__name__)
+
+URL_CERTIFICADOS = (
+    'https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com'
+)
+PATRON_MAX_AGE = re.compile(r'max-age=(\d+)')
+
+FIREBASE_AUTH_POR_DEFECTO = {
+    # Si no se indica, el project_id de las credenciales de FIREBASE_CONFIG
+    'PROJECT_ID': None,
+    # Crear el usuario de Django la primera vez que llega un uid desconocido
+    'CREAR_USUARIOS': True,
+    # Segundos que se reutiliza un usuario ya cargado (el token dura como mucho una hora)
+    'TTL_USUARIOS': 60,
+    'MAX_TOKENS': 10_000,
+    # Segundos de tolerancia con los relojes en exp/iat
+    'MARGEN_RELOJ': 10,
+    # Tras un kid desconocido no se vuelven a pedir certificados antes de esto
+    'ESPERA_RECARGA': 60,
+}
+
+
+class TokenFirebaseInvalido(Exception):
+    """El ID token no es válido (firma, caducidad, audiencia, emisor o formato)."""
+
+
+def _config():
+    return {**FIREBASE_AUTH_POR_DEFECTO, **getattr(settings, 'FIREBASE_AUTH', {})}
+
+
+def _id_proyecto(config):
+    if config['PROJECT_ID']:
+        return config['PROJECT_ID']
+    ruta = settings.FIREBASE_CONFIG.get('CREDENTIAL_FILE')
+    if ruta and os.path.exists(ruta):
+        with open(ruta, encoding='utf-8') as f:
+            return json.load(f).get('project_id')
+    return None
+
+
+# --- CERTIFICADOS DE FIRMA ---
+
+class _Certificados:
+    """Claves públicas por `kid`, válidas hasta el max-age con que las sirvió Google."""
+
+    def __init__(self):
+        self._claves = {}
+        self._caduca = 0.0
+        self._ultima_descarga = 0.0
+        self._lock = threading.Lock()
+
+    def clave(self, kid):
+        ahora = time.time()
+        claves = self._claves
+        if ahora >= self._caduca or (
+            kid not in claves and ahora - self._ultima_descarga >= _config()['ESPERA_RECARGA']
+        ):
+            claves = self._recargar(kid)
+        return claves.get(kid)
+
+    def _recargar(self, kid):
+        with self._lock:
+            ahora = time.time()
+            # Otro hilo pudo recargarlas mientras se esperaba el lock
+            if ahora < self._caduca and (
+                kid in self._claves or ahora - self._ultima_descarga < _config()['ESPERA_RECARGA']
+            ):
+                return self._claves
+            self._ultima_descarga = ahora
+            try:
+                self._claves, max_age = _descargar_certificados()
+            except Exception as exc:
+                if not self._claves:
+                    raise TokenFirebaseInvalido(f"No se pudieron obtener los certificados: {exc}") from exc
+                # Se siguen usando las anteriores; se reintenta como pronto en ESPERA_RECARGA
+                logger.warning("Fallo al renovar los certificados de Firebase Auth: %s", exc)
+                max_age = _config()['ESPERA_RECARGA']
+            self._caduca = ahora + max_age
+            return self._claves
+
+    def olvidar(self):
+        with self._lock:
+            self._claves, self._caduca, self._ultima_descarga = {}, 0.0, 0.0
+
+
+def _descargar_certificados():
+    """({kid: clave pública}, segundos de validez) desde el endpoint público de Google."""
+    from cryptography.x509 import load_pem_x509_certificate
+
+    with urllib.request.urlopen(URL_CERTIFICADOS, timeout=5) as respuesta:
+        certificados = json.loads(respuesta.read())
+        coincidencia = PATRON_MAX_AGE.search(respuesta.headers.get('Cache-Control', ''))
+    claves = {
+        kid: load_pem_x509_certificate(pem.encode()).public_key()
+        for kid, pem in certificados.items()
+    }
+    return claves, int(coincidencia.group(1)) if coincidencia else 0
+
+
+_certificados = _Certificados()
+
+# hash del token -> claims; cada entrada caduca con el propio token (exp)
+_tokens = TLRUCache(
+    maxsize=_config()['MAX_TOKENS'],
+    ttu=lambda clave, claims, ahora: claims['exp'],
+    timer=time.time,
+)
+# uid -> usuario de Django
+_usuarios = TTLCache(maxsize=_config()['MAX_TOKENS'], ttl=_config()['TTL_USUARIOS'])
+_lock = threading.Lock()
+
+
+def reiniciar_caches():
+    """Olvida certificados, tokens y usuarios (pruebas, rotación forzada)."""
+    _certificados.olvidar()
+    with _lock:
+        _tokens.clear()
+        _usuarios.clear()
+
+
+def _clave_token(token):
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+
+def _claims_cacheados(token):
+    with _lock:
+        return _tokens.get(_clave_token(token))
+
+
+# --- VERIFICACIÓN ---
+
+def verificar_token(token):
+    """Claims de un ID token de Firebase válido; si no lo es, TokenFirebaseInvalido.
+
+    Comprueba la firma RS256 con el certificado de su `kid`, exp/iat/auth_time, la
+    audiencia (el proyecto) y el emisor, como firebase_admin.auth.verify_id_token,
+    pero sin red salvo para renovar los certificados.
+    """
+    claims = _claims_cacheados(token)
+    if claims is not None:
+        return claims
+
+    import jwt
+
+    config = _config()
+    proyecto = _id_proyecto(config)
+    if not proyecto:
+        raise TokenFirebaseInvalido("Falta FIREBASE_AUTH['PROJECT_ID'].")
+    try:
+        cabecera = jwt.get_unverified_header(token)
+    except jwt.PyJWTError as exc:
+        raise TokenFirebaseInvalido(str(exc)) from exc
+    if cabecera.get('alg') != 'RS256':
+        raise TokenFirebaseInvalido("Algoritmo no admitido.")
+    clave = _certificados.clave(cabecera.get('kid'))
+    if clave is None:
+        raise TokenFirebaseInvalido("Certificado desconocido (kid).")
+
+    try:
+        claims = jwt.decode(
+            token, clave, algorithms=['RS256'],
+            audience=proyecto, issuer=f'https://securetoken.google.com/{proyecto}',
+            leeway=config['MARGEN_RELOJ'],
+            options={'require': ['exp', 'iat', 'sub', 'aud', 'iss']},
+        )
+    except jwt.PyJWTError as exc:
+        raise TokenFirebaseInvalido(str(exc)) from exc
+    if not isinstance(claims['sub'], str) or not claims['sub'] or len(claims['sub']) > 128:
+        raise TokenFirebaseInvalido("'sub' no es un uid válido.")
+    if claims.get('auth_time', 0) > time.time() + config['MARGEN_RELOJ']:
+        raise TokenFirebaseInvalido("'auth_time' está en el futuro.")
+
+    with _lock:
+        _tokens[_clave_token(token)] = claims
+    return claims
+
+
+# --- USUARIOS ---
+
+def usuario_desde_claims(claims, crear=None):
+    """Usuario de Django cuyo username es el uid de Firebase (una consulta, y luego en memoria).
+
+    Devuelve una copia: el objeto cacheado no se comparte entre peticiones.
+    """
+    uid = claims['sub']
+    with _lock:
+        usuario = _usuarios.get(uid)
+    if usuario is None:
+        modelo = get_user_model()
+        usuario = modelo.objects.filter(**{modelo.USERNAME_FIELD: uid}).first()
+        if usuario is None:
+            if not (_config()['CREAR_USUARIOS'] if crear is None else crear):
+                return None
+            usuario = modelo(**{modelo.USERNAME_FIELD: uid}, email=claims.get('email', '') or '')
+            usuario.set_unusable_password()
+            usuario.save()
+        with _lock:
+            _usuarios[uid] = usuario
+    return copy.copy(usuario) if usuario.is_active else None
+
+
+def olvidar_usuario(uid):
+    with _lock:
+        _usuarios.pop(uid, None)
+
+
+def olvidar_usuario_guardado(sender, instance, **kwargs):
+    """Receptor de post_save/post_delete: un usuario cambiado o borrado deja de servirse de memoria."""
+    olvidar_usuario(instance.get_username())
+
+
+class FirebaseBackend(BaseBackend):
+    """authenticate(request, token_firebase=...) para iniciar una sesión con un ID token."""
+
+    def authenticate(self, request, token_firebase=None, **kwargs):
+        if not token_firebase:
+            return None
+        try:
+            return usuario_desde_claims(verificar_token(token_firebase))
+        except TokenFirebaseInvalido as exc:
+            logger.info("ID token de Firebase rechazado: %s", exc)
+            return None
+
+    def get_user(self, user_id):
+        modelo = get_user_model()
+        usuario = modelo._default_manager.filter(pk=user_id).first()
+        return usuario if usuario is not None and usuario.is_active else None
+
+
+# --- MIDDLEWARE ---
+
+def _token_de(request):
+    cabecera = request.META.get('HTTP_AUTHORIZATION', '')
+    tipo, _, token = cabecera.partition(' ')
+    return token.strip() if tipo.lower() == 'bearer' and token.strip() else None
+
+
+class FirebaseAuthMiddleware:
+    """Autentica las peticiones con "Authorization: Bearer <ID token de Firebase>".
+
+    Va después de AuthenticationMiddleware y sustituye request.user sólo si el token es
+    válido (si no, la petición sigue como anónima o con su sesión). Sin estado: no crea
+    sesión ni cookie, así que la protección CSRF no aplica a estas peticiones.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _token_de(request)
+        if token is not None:
+            self._autenticar(request, token)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        token = _token_de(request)
+        if token is not None:
+            claims = _claims_cacheados(token)
+            with _lock:
+                en_memoria = claims is not None and claims['sub'] in _usuarios
+            if en_memoria:
+                # Todo en memoria: sin saltar a un hilo
+                self._autenticar(request, token)
+            else:
+                # Puede descargar certificados o consultar la BD
+                await sync_to_async(self._autenticar)(request, token)
+        return await self.get_response(request)
+
+    @staticmethod
+    def _autenticar(request, token):
+        try:
+            claims = verificar_token(token)
+        except TokenFirebaseInvalido as exc:
+            logger.info("ID token de Firebase rechazado: %s", exc)
+            return
+        usuario = usuario_desde_claims(claims)
+        if usuario is None:
+            return
+        usuario.backend = f'{FirebaseBackend.__module__}.{FirebaseBackend.__qualname__}'
+        request.user = usuario
+        request.firebase_claims = claims
+
+        async def auser():
+            return usuario
+
+        request.auser = auser
+        request._dont_enforce_csrf_checks = True
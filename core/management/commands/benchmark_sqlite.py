@@ -0,0 +1,154 @@
+# core/management/commands/benchmark_sqlite.py
+
+import json
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.sqlite import comandos_iniciales
+
+
+MODOS = ('por_defecto', 'concurrente')
+
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+
+def _resumen(tiempos):
+    return {
+        'n': len(tiempos),
+        'p50_ms': round(_percentil(tiempos, 0.50) * 1000, 2),
+        'p95_ms': round(_percentil(tiempos, 0.95) * 1000, 2),
+        'max_ms': round(max(tiempos, default=0) * 1000, 2),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara SQLite por defecto con el modo SQLITE_CONCURRENTE (WAL + BEGIN IMMEDIATE) con "
+        "lectores continuos y escrituras como las del admin: latencias y 'database is locked'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lectores', type=int, default=8, help="Hilos leyendo sin pausa.")
+        parser.add_argument('--escritores', type=int, default=2, help="Hilos escribiendo a la vez.")
+        parser.add_argument('--segundos', type=float, default=3.0, help="Duración de cada fase.")
+        parser.add_argument('--filas', type=int, default=20_000)
+        parser.add_argument('--json', action='store_true', help="Salida en JSON.")
+
+    def handle(self, *args, **options):
+        temporal = tempfile.mkdtemp(prefix='benchmark-sqlite-')
+        try:
+            resultado = {modo: self._medir_modo(os.path.join(temporal, f'{modo}.sqlite3'), modo, options)
+                         for modo in MODOS}
+        finally:
+            shutil.rmtree(temporal, ignore_errors=True)
+
+        if options['json']:
+            self.stdout.write(json.dumps(resultado))
+            return
+        for modo, datos in resultado.items():
+            self.stdout.write(f"{modo}:")
+            for fase in ('escritura_sola', 'escritura_con_lectores', 'lectura'):
+                r = datos[fase]
+                self.stdout.write(f"  {fase:<24} n={r['n']:>6}  p50={r['p50_ms']:>8.2f} ms  "
+                                  f"p95={r['p95_ms']:>8.2f} ms  max={r['max_ms']:>8.2f} ms")
+            self.stdout.write(f"  errores 'database is locked': {datos['bloqueos']}")
+
+    # --- Medición ---
+
+    def _conectar(self, ruta, modo):
+        # Autocommit: las transacciones se abren a mano, como hace atomic() en Django
+        conexion = sqlite3.connect(ruta, timeout=5, isolation_level=None, check_same_thread=False)
+        if modo == 'concurrente':
+            for comando in comandos_iniciales():
+                conexion.execute(comando)
+        return conexion
+
+    def _preparar(self, ruta, modo, filas):
+        conexion = self._conectar(ruta, modo)
+        conexion.execute("CREATE TABLE libro (id INTEGER PRIMARY KEY, titulo TEXT, autor_id INTEGER, "
+                         "num_visitas INTEGER DEFAULT 0)")
+        conexion.execute("CREATE INDEX libro_autor ON libro (autor_id, id)")
+        conexion.execute("BEGIN")
+        conexion.executemany("INSERT INTO libro (titulo, autor_id) VALUES (?, ?)",
+                             ((f"Libro {i} " + "x" * 80, i % 500) for i in range(filas)))
+        conexion.execute("COMMIT")
+        conexion.close()
+
+    def _escribir(self, conexion, modo, i):
+        # Guardado típico del admin: lee (unicidad, contadores) y después escribe
+        conexion.execute("BEGIN IMMEDIATE" if modo == 'concurrente' else "BEGIN")
+        try:
+            conexion.execute("SELECT count(*) FROM libro WHERE autor_id = ?", (i % 500,)).fetchone()
+            conexion.execute("UPDATE libro SET num_visitas = num_visitas + 1 WHERE id = ?", (i % 1000 + 1,))
+            conexion.execute("INSERT INTO libro (titulo, autor_id) VALUES (?, ?)", (f"Nuevo {i}", i % 500))
+            conexion.execute("COMMIT")
+        except sqlite3.OperationalError:
+            conexion.execute("ROLLBACK")
+            raise
+
+    def _leer(self, conexion, i):
+        # Listado: una página por autor y el total de la tabla
+        conexion.execute("SELECT id, titulo FROM libro WHERE autor_id = ? ORDER BY id LIMIT 12",
+                         (i % 500,)).fetchall()
+        conexion.execute("SELECT count(*) FROM libro").fetchone()
+
+    def _fase(self, ruta, modo, segundos, lectores, escritores):
+        fin = time.perf_counter() + segundos
+        escrituras, lecturas, bloqueos = [], [], [0]
+        lock = threading.Lock()
+
+        def trabajar(tipo, numero):
+            conexion = self._conectar(ruta, modo)
+            tiempos, i = [], numero * 100_000
+            while time.perf_counter() < fin:
+                inicio = time.perf_counter()
+                try:
+                    if tipo == 'escritor':
+                        self._escribir(conexion, modo, i)
+                    else:
+                        self._leer(conexion, i)
+                except sqlite3.OperationalError as exc:
+                    if 'locked' not in str(exc):
+                        raise
+                    with lock:
+                        bloqueos[0] += 1
+                else:
+                    tiempos.append(time.perf_counter() - inicio)
+                i += 1
+            conexion.close()
+            with lock:
+                (escrituras if tipo == 'escritor' else lecturas).extend(tiempos)
+
+        hilos = [threading.Thread(target=trabajar, args=('lector', n)) for n in range(lectores)]
+        hilos += [threading.Thread(target=trabajar, args=('escritor', n)) for n in range(escritores)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        return escrituras, lecturas, bloqueos[0]
+
+    def _medir_modo(self, ruta, modo, options):
+        self._preparar(ruta, modo, options['filas'])
+        solas, _, bloqueos_solos = self._fase(ruta, modo, options['segundos'], 0, 1)
+        escrituras, lecturas, bloqueos = self._fase(
+            ruta, modo, options['segundos'], options['lectores'], options['escritores'])
+        return {
+            'escritura_sola': _resumen(solas),
+            'escritura_con_lectores': _resumen(escrituras),
+            'lectura': _resumen(lecturas),
+            'bloqueos': bloqueos + bloqueos_solos,
+            'escritura_p50_relativa': round(
+                statistics.median(escrituras) / statistics.median(solas), 2) if escrituras and solas else None,
+        }
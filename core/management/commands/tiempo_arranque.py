@@ -0,0 +1,80 @@
+# core/management/commands/tiempo_arranque.py
+
+import json
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+# Lo mismo que hace un worker de gunicorn al arrancar: cargar la app WSGI y las URLs.
+SCRIPT_ARRANQUE = """
+import json, os, sys, time
+inicio = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'digital_library.settings')
+from django.core.wsgi import get_wsgi_application
+get_wsgi_application()
+from django.urls import get_resolver
+get_resolver().url_patterns
+arranque = time.perf_counter() - inicio
+resultado = {
+    'arranque': arranque,
+    'firebase_importado': 'firebase_admin' in sys.modules,
+    'grpc_importado': 'grpc' in sys.modules,
+}
+if {medir_firebase}:
+    inicio = time.perf_counter()
+    try:
+        from digital_library.firebase_config import get_firebase_db
+        get_firebase_db()
+        resultado['primer_cliente_firebase'] = time.perf_counter() - inicio
+    except Exception as exc:
+        resultado['primer_cliente_firebase'] = repr(exc)
+print(json.dumps(resultado))
+"""
+
+
+class Command(BaseCommand):
+    help = "Mide en procesos nuevos el tiempo de arranque de Django (como un worker) y si carga Firebase."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticiones', type=int, default=5)
+        parser.add_argument('--firebase', action='store_true',
+                            help="Mide además el coste del primer get_firebase_db().")
+        parser.add_argument('--json', action='store_true', help="Salida en JSON.")
+
+    def handle(self, *args, **options):
+        script = SCRIPT_ARRANQUE.replace('{medir_firebase}', str(options['firebase']))
+        mediciones = []
+        for _ in range(options['repeticiones']):
+            salida = subprocess.run(
+                [sys.executable, '-c', script],
+                cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+            )
+            mediciones.append(json.loads(salida.stdout.strip().splitlines()[-1]))
+
+        tiempos = [m['arranque'] for m in mediciones]
+        resumen = {
+            'repeticiones': len(tiempos),
+            'arranque_mediana': statistics.median(tiempos),
+            'arranque_min': min(tiempos),
+            'arranque_max': max(tiempos),
+            'firebase_importado': any(m['firebase_importado'] for m in mediciones),
+            'grpc_importado': any(m['grpc_importado'] for m in mediciones),
+        }
+        if options['firebase']:
+            resumen['primer_cliente_firebase'] = mediciones[-1]['primer_cliente_firebase']
+
+        if options['json']:
+            self.stdout.write(json.dumps(resumen))
+            return
+        self.stdout.write(
+            f"Arranque (mediana de {resumen['repeticiones']}): {resumen['arranque_mediana'] * 1000:.0f} ms "
+            f"[min {resumen['arranque_min'] * 1000:.0f} ms, max {resumen['arranque_max'] * 1000:.0f} ms]"
+        )
+        self.stdout.write(f"firebase_admin importado al arrancar: {resumen['firebase_importado']}")
+        self.stdout.write(f"grpc importado al arrancar: {resumen['grpc_importado']}")
+        if options['firebase']:
+            self.stdout.write(f"Primer get_firebase_db(): {resumen['primer_cliente_firebase']}")
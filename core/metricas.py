@@ -0,0 +1,181 @@
+# core/metricas.py
+#
+# Registro de métricas en proceso (contadores e histogramas) con volcado periódico
+# a un directorio compartido, para que /metrics agregue todos los workers de
+# gunicorn/uvicorn. Formato de salida: texto de Prometheus.
+
+import atexit
+import contextvars
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from django.conf import settings
+
+
+CUBETAS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+DEFINICIONES = {
+    'django_peticiones_total': ('counter', "Peticiones atendidas por vista, método y código de estado."),
+    'django_peticion_duracion_segundos': ('histogram', "Latencia de la petición por vista."),
+    'django_consultas_bd_total': ('counter', "Consultas SQL ejecutadas por vista."),
+    'django_consultas_bd_segundos_total': ('counter', "Tiempo acumulado en consultas SQL por vista."),
+    'django_plantillas_segundos_total': ('counter', "Tiempo acumulado renderizando plantillas por vista."),
+    'firestore_llamadas_total': ('counter', "Llamadas a Firestore por operación."),
+    'firestore_errores_total': ('counter', "Llamadas a Firestore que terminaron en excepción."),
+    'firestore_duracion_segundos': ('histogram', "Latencia de las llamadas a Firestore."),
+}
+
+# Acumuladores de la petición en curso (consultas, tiempo BD, tiempo de plantillas)
+peticion_actual = contextvars.ContextVar('peticion_actual', default=None)
+
+
+def _config():
+    return getattr(settings, 'METRICAS', {})
+
+
+class Registro:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._contadores = {}
+        self._histogramas = {}
+        self._ultimo_volcado = time.monotonic()
+
+    def incrementar(self, nombre, etiquetas, valor=1.0):
+        clave = (nombre, etiquetas)
+        with self._lock:
+            self._contadores[clave] = self._contadores.get(clave, 0.0) + valor
+
+    def observar(self, nombre, etiquetas, valor):
+        clave = (nombre, etiquetas)
+        with self._lock:
+            histograma = self._histogramas.get(clave)
+            if histograma is None:
+                histograma = self._histogramas[clave] = [[0] * (len(CUBETAS) + 1), 0.0, 0]
+            histograma[0][bisect_left(CUBETAS, valor)] += 1
+            histograma[1] += valor
+            histograma[2] += 1
+
+    def instantanea(self):
+        with self._lock:
+            return {
+                'contadores': [[n, list(e), v] for (n, e), v in self._contadores.items()],
+                'histogramas': [[n, list(e), list(h[0]), h[1], h[2]] for (n, e), h in self._histogramas.items()],
+            }
+
+    # --- Agregación entre procesos ---
+
+    def volcar(self):
+        """Escribe la instantánea de este proceso en METRICAS['DIRECTORIO'] (reemplazo atómico)."""
+        directorio = _config().get('DIRECTORIO')
+        self._ultimo_volcado = time.monotonic()
+        if not directorio:
+            return
+        os.makedirs(directorio, exist_ok=True)
+        descriptor, temporal = tempfile.mkstemp(dir=directorio, suffix='.tmp')
+        with os.fdopen(descriptor, 'w') as archivo:
+            json.dump(self.instantanea(), archivo)
+        os.replace(temporal, os.path.join(directorio, f"{os.getpid()}.json"))
+
+    def volcar_si_toca(self):
+        if time.monotonic() - self._ultimo_volcado >= _config().get('INTERVALO_VOLCADO', 5):
+            self.volcar()
+
+
+registro = Registro()
+atexit.register(registro.volcar)
+
+# Colectores adicionales: funciones que devuelven [(nombre, ayuda, etiquetas, valor)] como gauges
+_colectores = []
+
+
+def registrar_colector(funcion):
+    _colectores.append(funcion)
+    return funcion
+
+
+@contextmanager
+def medir_firestore(operacion):
+    """Cuenta y cronometra una llamada a Firestore (y sus errores)."""
+    etiquetas = (('operacion', operacion),)
+    inicio = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        registro.incrementar('firestore_errores_total', etiquetas)
+        raise
+    finally:
+        registro.incrementar('firestore_llamadas_total', etiquetas)
+        registro.observar('firestore_duracion_segundos', etiquetas, time.perf_counter() - inicio)
+
+
+def _combinar(instantaneas):
+    contadores, histogramas = {}, {}
+    for datos in instantaneas:
+        for nombre, etiquetas, valor in datos['contadores']:
+            clave = (nombre, tuple(map(tuple, etiquetas)))
+            contadores[clave] = contadores.get(clave, 0.0) + valor
+        for nombre, etiquetas, cubetas, suma, cuenta in datos['histogramas']:
+            clave = (nombre, tuple(map(tuple, etiquetas)))
+            acumulado = histogramas.setdefault(clave, [[0] * (len(CUBETAS) + 1), 0.0, 0])
+            acumulado[0] = [a + b for a, b in zip(acumulado[0], cubetas)]
+            acumulado[1] += suma
+            acumulado[2] += cuenta
+    return contadores, histogramas
+
+
+def _etiquetas_texto(etiquetas):
+    if not etiquetas:
+        return ''
+    partes = []
+    for clave, valor in etiquetas:
+        valor = str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        partes.append(f'{clave}="{valor}"')
+    return '{' + ','.join(partes) + '}'
+
+
+def exponer():
+    """Texto de Prometheus con las métricas de todos los procesos que comparten DIRECTORIO."""
+    instantaneas = [registro.instantanea()]
+    directorio = _config().get('DIRECTORIO')
+    if directorio and os.path.isdir(directorio):
+        propio = f"{os.getpid()}.json"
+        for nombre in os.listdir(directorio):
+            if nombre.endswith('.json') and nombre != propio:
+                try:
+                    with open(os.path.join(directorio, nombre)) as archivo:
+                        instantaneas.append(json.load(archivo))
+                except (OSError, ValueError):
+                    continue
+    contadores, histogramas = _combinar(instantaneas)
+
+    lineas = []
+    for nombre, (tipo, ayuda) in DEFINICIONES.items():
+        lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} {tipo}"]
+        if tipo == 'counter':
+            for (n, etiquetas), valor in sorted(contadores.items()):
+                if n == nombre:
+                    lineas.append(f"{nombre}{_etiquetas_texto(etiquetas)} {valor:g}")
+            continue
+        for (n, etiquetas), (cubetas, suma, cuenta) in sorted(histogramas.items()):
+            if n != nombre:
+                continue
+            acumulado = 0
+            for limite, veces in zip(CUBETAS + ('+Inf',), cubetas):
+                acumulado += veces
+                lineas.append(f"{nombre}_bucket{_etiquetas_texto(etiquetas + (('le', limite),))} {acumulado}")
+            lineas.append(f"{nombre}_sum{_etiquetas_texto(etiquetas)} {suma:g}")
+            lineas.append(f"{nombre}_count{_etiquetas_texto(etiquetas)} {cuenta}")
+
+    for colector in _colectores:
+        vistos = set()
+        for nombre, ayuda, etiquetas, valor in colector():
+            if nombre not in vistos:
+                lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} gauge"]
+                vistos.add(nombre)
+            lineas.append(f"{nombre}{_etiquetas_texto(etiquetas)} {valor:g}")
+    return '\n'.join(lineas) + '\n'
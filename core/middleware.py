@@ -0,0 +1,242 @@
+# core/middleware.py
+
+import hashlib
+import re
+import threading
+import time
+import zlib
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from cachetools import LRUCache
+from django.conf import settings
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+
+from .metricas import peticion_actual, registro
+
+try:
+    import brotli
+except ImportError:  # sin brotli sólo se ofrece gzip
+    brotli = None
+
+
+class MetricasMiddleware:
+    """Mide cada petición: latencia por vista, consultas SQL y su tiempo, y tiempo de plantillas.
+
+    Debe ir el primero en MIDDLEWARE. No escribe en la BD ni en la caché: sólo
+    actualiza contadores en memoria que se vuelcan cada pocos segundos.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        acumulado = {'consultas': 0, 'tiempo_bd': 0.0, 'tiempo_plantillas': 0.0}
+        token = peticion_actual.set(acumulado)
+        inicio = time.perf_counter()
+        try:
+            with ExitStack() as pila:
+                self._instalar_medidores(pila)
+                response = self.get_response(request)
+        finally:
+            peticion_actual.reset(token)
+        self._registrar(request, response, acumulado, time.perf_counter() - inicio)
+        return response
+
+    async def __acall__(self, request):
+        acumulado = {'consultas': 0, 'tiempo_bd': 0.0, 'tiempo_plantillas': 0.0}
+        token = peticion_actual.set(acumulado)
+        inicio = time.perf_counter()
+        # El ORM asíncrono ejecuta las consultas en el hilo de sync_to_async de la petición:
+        # los medidores se instalan y se retiran en ese mismo hilo.
+        pila = ExitStack()
+        try:
+            await sync_to_async(self._instalar_medidores)(pila)
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(pila.close)()
+            peticion_actual.reset(token)
+        self._registrar(request, response, acumulado, time.perf_counter() - inicio)
+        return response
+
+    def _instalar_medidores(self, pila):
+        for alias in connections:
+            pila.enter_context(connections[alias].execute_wrapper(self._medir_consulta))
+
+    @staticmethod
+    def _registrar(request, response, acumulado, duracion):
+        coincidencia = getattr(request, 'resolver_match', None)
+        vista = coincidencia.view_name if coincidencia else 'sin_ruta'
+        etiquetas = (('vista', vista),)
+        registro.incrementar('django_peticiones_total',
+                             etiquetas + (('metodo', request.method), ('estado', response.status_code)))
+        registro.observar('django_peticion_duracion_segundos', etiquetas, duracion)
+        registro.incrementar('django_consultas_bd_total', etiquetas, acumulado['consultas'])
+        registro.incrementar('django_consultas_bd_segundos_total', etiquetas, acumulado['tiempo_bd'])
+        registro.incrementar('django_plantillas_segundos_total', etiquetas, acumulado['tiempo_plantillas'])
+        registro.volcar_si_toca()
+
+    @staticmethod
+    def _medir_consulta(execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            acumulado = peticion_actual.get()
+            if acumulado is not None:
+                acumulado['consultas'] += 1
+                acumulado['tiempo_bd'] += time.perf_counter() - inicio
+
+
+# --- COMPRESIÓN DE RESPUESTAS (br / gzip) ---
+
+COMPRESION_POR_DEFECTO = {
+    'TIPOS': ('text/html', 'application/json', 'application/x-ndjson', 'text/csv', 'text/plain'),
+    'MIN_BYTES': 200,          # por debajo, las cabeceras se comen lo ahorrado
+    'NIVEL_BROTLI': 5,         # buen equilibrio CPU/tamaño para contenido dinámico
+    'NIVEL_GZIP': 6,
+    'CACHE_BYTES': 16 * 1024 * 1024,  # cuerpos comprimidos guardados (LRU, por proceso)
+}
+PATRON_Q_CERO = re.compile(r'^\s*q\s*=\s*0(\.0*)?\s*$')
+
+
+def _config_compresion():
+    return {**COMPRESION_POR_DEFECTO, **getattr(settings, 'COMPRESION', {})}
+
+
+def elegir_codificacion(accept_encoding):
+    """'br' o 'gzip' según Accept-Encoding (se prefiere br), o None."""
+    aceptadas = set()
+    for parte in accept_encoding.lower().split(','):
+        nombre, _, parametros = parte.strip().partition(';')
+        if nombre and not PATRON_Q_CERO.match(parametros):
+            aceptadas.add(nombre.strip())
+    if brotli is not None and 'br' in aceptadas:
+        return 'br'
+    if 'gzip' in aceptadas:
+        return 'gzip'
+    return None
+
+
+def _comprimir(contenido, codificacion, config):
+    if codificacion == 'br':
+        return brotli.compress(contenido, quality=config['NIVEL_BROTLI'])
+    return zlib.compress(contenido, config['NIVEL_GZIP'], wbits=31)
+
+
+class _CompresorFlujo:
+    """Compresión incremental: cada trozo sale comprimido en cuanto llega (NDJSON en streaming)."""
+
+    def __init__(self, codificacion, config):
+        self._br = codificacion == 'br'
+        if self._br:
+            self._compresor = brotli.Compressor(quality=config['NIVEL_BROTLI'])
+        else:
+            self._compresor = zlib.compressobj(config['NIVEL_GZIP'], zlib.DEFLATED, 31)
+
+    def trozo(self, datos):
+        if self._br:
+            return self._compresor.process(datos) + self._compresor.flush()
+        return self._compresor.compress(datos) + self._compresor.flush(zlib.Z_SYNC_FLUSH)
+
+    def fin(self):
+        return self._compresor.finish() if self._br else self._compresor.flush()
+
+
+class CompresionMiddleware:
+    """Comprime con Brotli o gzip (según Accept-Encoding) el HTML, JSON, NDJSON y CSV.
+
+    Las respuestas cacheables (GET 200 sin cookies ni Cache-Control private/no-store)
+    guardan el cuerpo ya comprimido en un LRU indexado por el hash del contenido: una
+    página que sale de la caché de plantillas tampoco se vuelve a comprimir.
+    Los estáticos no pasan por aquí: WhiteNoise sirve los .br/.gz de collectstatic.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = _config_compresion()
+        self._cache = LRUCache(maxsize=self.config['CACHE_BYTES'], getsizeof=len)
+        self._lock = threading.Lock()
+        self.aciertos = self.fallos = 0
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self._procesar(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self._procesar(request, await self.get_response(request))
+
+    def _procesar(self, request, response):
+        tipo = response.get('Content-Type', '').split(';')[0].strip().lower()
+        if (tipo not in self.config['TIPOS'] or response.has_header('Content-Encoding')
+                or not 200 <= response.status_code < 300 or response.status_code == 206):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        codificacion = elegir_codificacion(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if codificacion is None:
+            return response
+
+        if response.streaming:
+            compresor = _CompresorFlujo(codificacion, self.config)
+            if response.is_async:
+                async def flujo(original=response.streaming_content):
+                    async for datos in original:
+                        yield compresor.trozo(datos)
+                    yield compresor.fin()
+            else:
+                def flujo(original=response.streaming_content):
+                    for datos in original:
+                        yield compresor.trozo(datos)
+                    yield compresor.fin()
+            response.streaming_content = flujo()
+            del response.headers['Content-Length']
+        else:
+            if len(response.content) < self.config['MIN_BYTES']:
+                return response
+            comprimido = self._comprimido(request, response, codificacion)
+            if len(comprimido) >= len(response.content):
+                return response
+            response.content = comprimido
+            response.headers['Content-Length'] = str(len(comprimido))
+
+        # El ETag del cuerpo sin comprimir deja de ser exacto (como en GZipMiddleware)
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = codificacion
+        return response
+
+    def _cacheable(self, request, response):
+        control = response.get('Cache-Control', '').lower()
+        return (request.method in ('GET', 'HEAD') and response.status_code == 200
+                and not response.cookies and 'private' not in control and 'no-store' not in control)
+
+    def _comprimido(self, request, response, codificacion):
+        if not self._cacheable(request, response):
+            return _comprimir(response.content, codificacion, self.config)
+        clave = (codificacion, hashlib.blake2b(response.content, digest_size=16).digest())
+        with self._lock:
+            comprimido = self._cache.get(clave)
+        if comprimido is not None:
+            self.aciertos += 1
+            return comprimido
+        self.fallos += 1
+        comprimido = _comprimir(response.content, codificacion, self.config)
+        with self._lock:
+            if len(comprimido) <= self._cache.maxsize:
+                self._cache[clave] = comprimido
+        return comprimido
@@ -0,0 +1,31 @@
+# core/plantillas.py
+
+import time
+
+from django.template.backends.django import DjangoTemplates, Template
+
+from .metricas import peticion_actual
+
+
+class PlantillaMedida(Template):
+    """Plantilla que suma su tiempo de render a la petición en curso (ver MetricasMiddleware)."""
+
+    def render(self, context=None, request=None):
+        inicio = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            acumulado = peticion_actual.get()
+            if acumulado is not None:
+                acumulado['tiempo_plantillas'] += time.perf_counter() - inicio
+
+
+class DjangoTemplatesMedidas(DjangoTemplates):
+    """Backend DjangoTemplates que devuelve plantillas cronometradas."""
+
+    def from_string(self, template_code):
+        return PlantillaMedida(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        plantilla = super().get_template(template_name)
+        return PlantillaMedida(plantilla.template, self)
@@ -1,3 +1,370 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+from unittest import mock
+
+import brotli
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.management import call_command
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from digital_library import firebase_config
+
+from libros.models import Libro
+
+from . import firebase_auth
+from .db_router import (
+    COOKIE_PRIMARIA, FijarPrimariaMiddleware, ReplicaRouter, lectura_en_primaria, lectura_en_replica,
+)
+from .metricas import medir_firestore, registro
+from .middleware import CompresionMiddleware, MetricasMiddleware, elegir_codificacion
+from .sqlite import opciones_concurrentes
+
+
+class ArranquePerezosoTest(SimpleTestCase):
+    def test_arrancar_no_importa_firebase(self):
+        salida = StringIO()
+        call_command('tiempo_arranque', repeticiones=1, json=True, stdout=salida)
+        resumen = json.loads(salida.getvalue())
+        self.assertFalse(resumen['firebase_importado'])
+        self.assertFalse(resumen['grpc_importado'])
+
+    @override_settings(FIREBASE_CONFIG={'CREDENTIAL_FILE': '/no/existe/firebase_key.json'})
+    def test_sin_credenciales_falla_al_usarlo(self):
+        with self.assertRaises(FileNotFoundError):
+            firebase_config.get_firebase_db()
+
+
+class MetricasTest(TestCase):
+    def test_metrics_expone_latencia_y_consultas_por_vista(self):
+        self.client.get(reverse('home'))
+        texto = self.client.get(reverse('metricas')).content.decode()
+        self.assertIn('django_peticiones_total{vista="home",metodo="GET",estado="200"}', texto)
+        self.assertIn('django_peticion_duracion_segundos_bucket{vista="home",le="+Inf"}', texto)
+        self.assertIn('django_consultas_bd_total{vista="home"}', texto)
+        self.assertIn('django_plantillas_segundos_total{vista="home"}', texto)
+        self.assertIn('libros_outbox_pendientes 0', texto)
+
+    def test_errores_de_firestore(self):
+        with self.assertRaises(RuntimeError):
+            with medir_firestore('prueba_error'):
+                raise RuntimeError("sin red")
+        texto = self.client.get(reverse('metricas')).content.decode()
+        self.assertIn('firestore_errores_total{operacion="prueba_error"} 1', texto)
+
+    def test_agrega_otros_procesos(self):
+        with tempfile.TemporaryDirectory() as directorio:
+            with open(os.path.join(directorio, '999999.json'), 'w') as archivo:
+                json.dump({'contadores': [['firestore_llamadas_total', [['operacion', 'otro_worker']], 7]],
+                           'histogramas': []}, archivo)
+            with override_settings(METRICAS={'DIRECTORIO': directorio}):
+                registro.volcar()
+                texto = self.client.get(reverse('metricas')).content.decode()
+        self.assertIn('firestore_llamadas_total{operacion="otro_worker"} 7', texto)
+
+    async def test_middleware_asincrono_cuenta_consultas_del_orm_async(self):
+        async def vista(request):
+            await Libro.objects.acount()
+            await Libro.objects.acount()
+            return HttpResponse()
+
+        antes = registro.instantanea()['contadores']
+        await MetricasMiddleware(vista)(AsyncRequestFactory().get('/'))
+        despues = registro.instantanea()['contadores']
+        consultas = {tuple(map(tuple, e)): v for n, e, v in despues if n == 'django_consultas_bd_total'}
+        previas = {tuple(map(tuple, e)): v for n, e, v in antes if n == 'django_consultas_bd_total'}
+        clave = (('vista', 'sin_ruta'),)
+        self.assertEqual(consultas[clave] - previas.get(clave, 0), 2)
+
+    @override_settings(METRICAS={'TOKEN': 'secreto'})
+    def test_token(self):
+        self.assertEqual(self.client.get(reverse('metricas')).status_code, 403)
+        response = self.client.get(reverse('metricas'), HTTP_AUTHORIZATION='Bearer secreto')
+        self.assertEqual(response.status_code, 200)
+
+
+@mock.patch('core.db_router.replicas', return_value=['replica_0'])
+class ReplicaRouterTest(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def _leer_en_vista(self, request, modelo):
+        @lectura_en_replica
+        def vista(request):
+            return self.router.db_for_read(modelo)
+        return vista(request)
+
+    def test_vistas_marcadas_leen_de_replica(self, _replicas):
+        self.assertEqual(self._leer_en_vista(self.factory.get('/'), Libro), 'replica_0')
+        self.assertEqual(self.router.db_for_read(Libro), 'default')
+        self.assertEqual(self.router.db_for_write(Libro), 'default')
+
+    def test_usuarios_y_sesiones_siempre_en_primaria(self, _replicas):
+        self.assertEqual(self._leer_en_vista(self.factory.get('/'), User), 'default')
+
+    def test_cookie_de_escritura_reciente_fija_la_primaria(self, _replicas):
+        request = self.factory.get('/')
+        request.COOKIES[COOKIE_PRIMARIA] = '1'
+        self.assertEqual(self._leer_en_vista(request, Libro), 'default')
+
+    def test_lo_que_se_cachea_se_lee_de_la_primaria(self, _replicas):
+        @lectura_en_replica
+        def vista(request):
+            with lectura_en_primaria():
+                dentro = self.router.db_for_read(Libro)
+            return dentro, self.router.db_for_read(Libro)
+        self.assertEqual(vista(self.factory.get('/')), ('default', 'replica_0'))
+
+    def test_post_de_usuario_autenticado_pone_la_cookie(self, _replicas):
+        middleware = FijarPrimariaMiddleware(lambda request: HttpResponse(status=302))
+        request = self.factory.post('/libros/crear/')
+        request.user = mock.Mock(is_authenticated=True)
+        self.assertIn(COOKIE_PRIMARIA, middleware(request).cookies)
+
+        request = self.factory.post('/libros/crear/')
+        request.user = AnonymousUser()
+        self.assertNotIn(COOKIE_PRIMARIA, middleware(request).cookies)
+
+
+class CompresionTest(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.html = ("<html><body>" + "<p>Cien años de soledad</p>" * 200 + "</body></html>").encode()
+
+    def _middleware(self, response):
+        return CompresionMiddleware(lambda request: response() if callable(response) else response)
+
+    def test_elige_brotli_y_luego_gzip(self):
+        self.assertEqual(elegir_codificacion('gzip, deflate, br'), 'br')
+        self.assertEqual(elegir_codificacion('gzip;q=1.0, br;q=0'), 'gzip')
+        self.assertIsNone(elegir_codificacion('identity'))
+
+    def test_html_comprimido_y_cacheado(self):
+        middleware = self._middleware(lambda: HttpResponse(self.html))
+        for _ in range(2):
+            response = middleware(self.factory.get('/', HTTP_ACCEPT_ENCODING='br'))
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(brotli.decompress(response.content), self.html)
+        self.assertEqual((middleware.fallos, middleware.aciertos), (1, 1))
+
+        response = middleware(self.factory.get('/', HTTP_ACCEPT_ENCODING='gzip'))
+        self.assertEqual(gzip.decompress(response.content), self.html)
+
+    def test_respuesta_privada_no_se_cachea_y_tipos_binarios_no_se_tocan(self):
+        def privada():
+            response = HttpResponse(self.html)
+            response.set_cookie('sessionid', 'x')
+            return response
+        middleware = self._middleware(privada)
+        middleware(self.factory.get('/', HTTP_ACCEPT_ENCODING='br'))
+        self.assertEqual(len(middleware._cache), 0)
+
+        response = self._middleware(HttpResponse(self.html, content_type='image/png'))(
+            self.factory.get('/', HTTP_ACCEPT_ENCODING='br'))
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_ndjson_en_streaming(self):
+        lineas = [json.dumps({'n': i}).encode() + b"\n" for i in range(500)]
+        response = self._middleware(StreamingHttpResponse(iter(lineas), content_type='application/x-ndjson'))(
+            self.factory.get('/', HTTP_ACCEPT_ENCODING='gzip'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b"".join(response.streaming_content)), b"".join(lineas))
+
+
+def _certificado_autofirmado():
+    """Clave RSA y su certificado X.509 en PEM, como los que publica Google."""
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.x509.oid import NameOID
+
+    clave = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    nombre = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "securetoken.system.gserviceaccount.com")])
+    ahora = datetime.now(timezone.utc)
+    certificado = (
+        x509.CertificateBuilder().subject_name(nombre).issuer_name(nombre)
+        .public_key(clave.public_key()).serial_number(x509.random_serial_number())
+        .not_valid_before(ahora - timedelta(days=1)).not_valid_after(ahora + timedelta(days=1))
+        .sign(clave, hashes.SHA256())
+    )
+    return clave, certificado.public_bytes(serialization.Encoding.PEM).decode()
+
+
+class _RespuestaCertificados:
+    def __init__(self, certificados, max_age):
+        self._cuerpo = json.dumps(certificados).encode()
+        self.headers = {'Cache-Control': f'public, max-age={max_age}, must-revalidate, no-transform'}
+
+    def read(self):
+        return self._cuerpo
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+@override_settings(FIREBASE_AUTH={'PROJECT_ID': 'biblioteca-test'})
+class FirebaseAuthTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.clave, cls.pem = _certificado_autofirmado()
+
+    def setUp(self):
+        firebase_auth.reiniciar_caches()
+        self.addCleanup(firebase_auth.reiniciar_caches)
+        patcher = mock.patch('core.firebase_auth.urllib.request.urlopen',
+                             return_value=_RespuestaCertificados({'k1': self.pem}, 3600))
+        self.urlopen = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _token(self, kid='k1', **cambios):
+        import jwt
+
+        ahora = int(time.time())
+        claims = {
+            'iss': 'https://securetoken.google.com/biblioteca-test', 'aud': 'biblioteca-test',
+            'sub': 'uid-lectora', 'auth_time': ahora - 5, 'iat': ahora - 5, 'exp': ahora + 3600,
+            'email': 'lectora@example.com',
+        }
+        claims.update(cambios)
+        return jwt.encode(claims, self.clave, algorithm='RS256', headers={'kid': kid})
+
+    def test_verifica_en_local_con_certificados_cacheados(self):
+        self.assertEqual(firebase_auth.verificar_token(self._token())['sub'], 'uid-lectora')
+        self.assertEqual(firebase_auth.verificar_token(self._token(sub='otro'))['sub'], 'otro')
+        # Una sola descarga mientras dure el max-age
+        self.assertEqual(self.urlopen.call_count, 1)
+
+    def test_rechaza_tokens_invalidos(self):
+        invalidos = [
+            self._token(aud='otro-proyecto'),
+            self._token(iss='https://securetoken.google.com/otro-proyecto'),
+            self._token(exp=int(time.time()) - 120),
+            self._token(sub=''),
+            self._token(kid='desconocido'),
+            self._token()[:-4] + 'AAAA',
+            'no-es-un-jwt',
+        ]
+        for token in invalidos:
+            with self.assertRaises(firebase_auth.TokenFirebaseInvalido):
+                firebase_auth.verificar_token(token)
+        # El kid desconocido no vuelve a descargar los certificados en cada intento
+        with self.assertRaises(firebase_auth.TokenFirebaseInvalido):
+            firebase_auth.verificar_token(self._token(kid='desconocido'))
+        self.assertEqual(self.urlopen.call_count, 1)
+
+    def test_certificados_caducados_se_renuevan(self):
+        self.urlopen.return_value = _RespuestaCertificados({'k1': self.pem}, 0)
+        firebase_auth.verificar_token(self._token())
+        firebase_auth.verificar_token(self._token(sub='otro'))
+        self.assertEqual(self.urlopen.call_count, 2)
+
+    def test_middleware_autentica_bearer_sin_consultas_en_caliente(self):
+        token = self._token()
+        response = self.client.get(reverse('home'), HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertTrue(response.wsgi_request.user.is_authenticated)
+        usuario = User.objects.get(username='uid-lectora')
+        self.assertEqual(usuario.email, 'lectora@example.com')
+        self.assertFalse(usuario.has_usable_password())
+
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        request.user = AnonymousUser()
+        with self.assertNumQueries(0):
+            firebase_auth.FirebaseAuthMiddleware(lambda r: HttpResponse())(request)
+        self.assertEqual(request.user.pk, usuario.pk)
+        self.assertEqual(request.firebase_claims['email'], 'lectora@example.com')
+
+        # Desactivar al usuario lo saca de la caché en el acto
+        usuario.is_active = False
+        usuario.save()
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        request.user = AnonymousUser()
+        firebase_auth.FirebaseAuthMiddleware(lambda r: HttpResponse())(request)
+        self.assertFalse(request.user.is_authenticated)
+
+    def test_token_invalido_deja_la_peticion_anonima(self):
+        response = self.client.get(reverse('home'), HTTP_AUTHORIZATION='Bearer basura')
+        self.assertFalse(response.wsgi_request.user.is_authenticated)
+
+    def test_backend_inicia_sesion(self):
+        from django.contrib.auth import authenticate
+
+        usuario = authenticate(None, token_firebase=self._token())
+        self.assertEqual(usuario.username, 'uid-lectora')
+        self.assertIsNone(authenticate(None, token_firebase='basura'))
+
+    def test_middleware_asincrono(self):
+        token = self._token()
+        request = AsyncRequestFactory().get('/', headers={'Authorization': f'Bearer {token}'})
+        request.user = AnonymousUser()
+
+        async def vista(request):
+            return HttpResponse((await request.auser()).username)
+
+        middleware = firebase_auth.FirebaseAuthMiddleware(vista)
+        response = async_to_sync(middleware)(request)
+        self.assertEqual(response.content, b'uid-lectora')
+
+
+class SqliteConcurrenteTest(SimpleTestCase):
+    def setUp(self):
+        from django.db import connection
+        from django.db.backends.sqlite3.base import DatabaseWrapper
+
+        temporal = tempfile.mkdtemp(prefix='sqlite-concurrente-')
+        self.addCleanup(shutil.rmtree, temporal, True)
+        self.ruta = os.path.join(temporal, 'db.sqlite3')
+        self.bd = DatabaseWrapper({
+            **connection.settings_dict, 'NAME': self.ruta, 'OPTIONS': opciones_concurrentes(), 'CONN_MAX_AGE': 0,
+        }, alias='sqlite_concurrente')
+        self.addCleanup(self.bd.close)
+
+    def test_pragmas_al_abrir_la_conexion(self):
+        with self.bd.cursor() as cursor:
+            valores = {}
+            for pragma in ('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size', 'cache_size'):
+                cursor.execute(f"PRAGMA {pragma}")
+                valores[pragma] = cursor.fetchone()[0]
+        self.assertEqual(valores['journal_mode'], 'wal')
+        self.assertEqual(valores['synchronous'], 1)  # NORMAL
+        self.assertEqual(valores['busy_timeout'], 20_000)
+        self.assertEqual(valores['mmap_size'], 256 * 1024 * 1024)
+        self.assertEqual(valores['cache_size'], -64 * 1024)
+
+    def test_atomic_toma_el_bloqueo_de_escritura_al_empezar(self):
+        from django.db import connections, transaction
+
+        connections[self.bd.alias] = self.bd
+        self.addCleanup(connections.__delitem__, self.bd.alias)
+        with self.bd.cursor() as cursor:
+            cursor.execute("CREATE TABLE t (n INTEGER)")
+        otra = sqlite3.connect(self.ruta, timeout=0, isolation_level=None)
+        self.addCleanup(otra.close)
+        with transaction.atomic(using=self.bd.alias):
+            # BEGIN IMMEDIATE: nadie más puede empezar a escribir, pero sí leer (WAL)
+            with self.assertRaisesMessage(sqlite3.OperationalError, 'locked'):
+                otra.execute("BEGIN IMMEDIATE")
+            self.assertEqual(otra.execute("SELECT count(*) FROM t").fetchone(), (0,))
+
+    def test_benchmark_sin_bloqueos_en_modo_concurrente(self):
+        salida = StringIO()
+        call_command('benchmark_sqlite', '--segundos', '0.2', '--filas', '200', '--lectores', '2', '--json',
+                     stdout=salida)
+        resultado = json.loads(salida.getvalue())
+        self.assertEqual(resultado['concurrente']['bloqueos'], 0)
+        self.assertGreater(resultado['concurrente']['escritura_con_lectores']['n'], 0)
 
-# Create your tests here.
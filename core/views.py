@@ -1,11 +1,22 @@
 # core/views.py
 
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
 from django.shortcuts import render
 
+from .metricas import exponer
+
 def home_view(request):
     # Vista para la página de inicio
     return render(request, 'base.html') 
 
 def custom_404(request, exception):
     # Vista personalizada para el error 404
-    return render(request, '404.html', {}, status=404)
\ No newline at end of file
+    return render(request, '404.html', {}, status=404)
+
+def metricas(request):
+    # Métricas de todos los workers en formato de texto de Prometheus
+    token = settings.METRICAS.get('TOKEN')
+    if token and request.headers.get('Authorization') != f"Bearer {token}":
+        return HttpResponseForbidden()
+    return HttpResponse(exponer(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'digital_library.settings')
+# Bajo ASGI se enrutan las vistas de lectura asíncronas (ver VISTAS_ASINCRONAS en settings.py)
+os.environ.setdefault('VISTAS_ASINCRONAS', '1')
 
 application = get_asgi_application()
@@ -1,25 +1,113 @@
 # digital_library/firebase_config.py
 
-import firebase_admin
-from firebase_admin import credentials, firestore
-from digital_library.settings import FIREBASE_KEY_PATH 
-import os # <-- Importamos os
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-# Inicializa las credenciales
-# 💥 VERIFICACIÓN DE EXISTENCIA ANTES DE INTENTAR CARGAR 💥
-if os.path.exists(FIREBASE_KEY_PATH):
-    cred = credentials.Certificate(FIREBASE_KEY_PATH)
+from django.conf import settings
 
-    # Inicializa la aplicación de Firebase
+
+# 💤 INICIALIZACIÓN PEREZOSA: firebase_admin (y con él gRPC y google-cloud) sólo se
+# importa la primera vez que alguien pide el cliente, no al arrancar cada proceso.
+_db = None
+_db_async = None
+# Reentrante: el cliente asíncrono en memoria se construye sobre el síncrono
+_lock = threading.RLock()
+
+
+def _inicializar_app():
+    ruta = settings.FIREBASE_CONFIG['CREDENTIAL_FILE']
+    # 💥 VERIFICACIÓN DE EXISTENCIA ANTES DE INTENTAR CARGAR 💥
+    if not os.path.exists(ruta):
+        raise FileNotFoundError("firebase_key.json no encontrado. Verifique la ruta en settings.py.")
+
+    import firebase_admin
+    from firebase_admin import credentials
+
+    # Inicializa la aplicación de Firebase (una sola vez por proceso)
     if not firebase_admin._apps:
-        firebase_admin.initialize_app(cred)
-        db = firestore.client()
-        
-    def get_firebase_db():
-        """Retorna la instancia del cliente de Firestore."""
-        return db
-else:
-    # Definir una función de fallback si el archivo no se encuentra
-    print("ADVERTENCIA: Archivo firebase_key.json no encontrado. Las vistas de Firebase no funcionarán.")
-    def get_firebase_db():
-        raise FileNotFoundError("firebase_key.json no encontrado. Verifique la ruta en settings.py.")
\ No newline at end of file
+        firebase_admin.initialize_app(credentials.Certificate(ruta))
+
+
+def _backend_memoria():
+    return settings.FIREBASE_CONFIG.get('BACKEND', 'firebase') == 'memoria'
+
+
+def _crear_cliente_memoria():
+    """Firestore en proceso (sin red ni credenciales) con la latencia y fallos configurados."""
+    from libros.services.firestore_memoria import ClienteFirestoreMemoria
+
+    config = settings.FIREBASE_CONFIG
+    cliente = ClienteFirestoreMemoria(
+        latencia=config.get('LATENCIA', 0),
+        probabilidad_fallo=config.get('PROBABILIDAD_FALLO', 0.0),
+        semilla=config.get('SEMILLA'),
+    )
+    if config.get('MEMORIA_DESDE_SQL', False):
+        # Cada proceso arranca con una copia del catálogo (p. ej. los servidores del benchmark)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            _cargar_catalogo(cliente)
+        else:
+            # Primera petición de una vista async: el ORM no puede usarse en el event loop
+            with ThreadPoolExecutor(max_workers=1) as hilo:
+                hilo.submit(_cargar_catalogo, cliente).result()
+    return cliente
+
+
+def _cargar_catalogo(cliente):
+    from libros.models import Libro
+    from libros.services.reconciliacion import paginas_por_pk
+
+    for pagina in paginas_por_pk(Libro.objects.select_related('autor', 'categoria'), 500):
+        cliente.cargar('libros', {str(libro.pk): libro.datos_firestore() for libro in pagina})
+
+
+def _crear_cliente():
+    if _backend_memoria():
+        return _crear_cliente_memoria()
+    _inicializar_app()
+    from firebase_admin import firestore
+    return firestore.client()
+
+
+def _crear_cliente_async():
+    if _backend_memoria():
+        from libros.services.firestore_memoria import ClienteFirestoreMemoriaAsync
+        # Mismos datos que el cliente síncrono: lo que envía sync_firestore lo leen las vistas async
+        return ClienteFirestoreMemoriaAsync(get_firebase_db())
+    _inicializar_app()
+    from firebase_admin import firestore_async
+    return firestore_async.client()
+
+
+def get_firebase_db():
+    """Retorna la instancia del cliente de Firestore, creándola en el primer uso (thread-safe)."""
+    global _db
+    if _db is None:
+        with _lock:
+            if _db is None:
+                _db = _crear_cliente()
+    return _db
+
+
+def get_firebase_db_async():
+    """Como get_firebase_db(), pero con el AsyncClient de Firestore (vistas asíncronas bajo ASGI).
+
+    El canal gRPC asíncrono queda ligado al event loop del proceso (el de uvicorn).
+    """
+    global _db_async
+    if _db_async is None:
+        with _lock:
+            if _db_async is None:
+                _db_async = _crear_cliente_async()
+    return _db_async
+
+
+def reiniciar_clientes():
+    """Olvida los clientes creados (pruebas que cambian FIREBASE_CONFIG)."""
+    global _db, _db_async
+    with _lock:
+        _db = _db_async = None
@@ -16,6 +16,7 @@ Including another URLconf
 """
 # digital_library/urls.py
 
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 
@@ -23,13 +24,19 @@ from django.urls import path, include
 # para poder nombrar la ruta raíz como 'home' directamente.
 # Suponiendo que LibroListView está en libros.views
 from libros.views import LibroListView 
+from libros.views_async import lista_libros
+from core.views import metricas
+
+# ⚡ Con VISTAS_ASINCRONAS (ASGI) la raíz la sirve la versión asíncrona
+vista_home = lista_libros if settings.VISTAS_ASINCRONAS else LibroListView.as_view()
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metricas, name='metricas'),
     
     # 🚨 CORRECCIÓN 1: Definir explícitamente la raíz como 'home'.
     # Apuntamos la ruta base ('') directamente a la vista, dándole el nombre 'home'.
-    path('', LibroListView.as_view(), name='home'),
+    path('', vista_home, name='home'),
     
     # 🚨 CORRECCIÓN 2: Incluir las URLs de 'libros/' bajo un prefijo,
     # para que las rutas CRUD/Detalle no colisionen con 'home'.
@@ -1,7 +1,62 @@
 # libros/admin.py
 
-from django.contrib import admin
-from .models import Autor, Categoria, Libro 
+from django.contrib import admin, messages
+from digital_library.firebase_config import get_firebase_db
+from .busqueda import filtrar_libros
+from .models import Autor, Categoria, Libro, PropagacionPendiente, SincronizacionPendiente
+from .paginacion import ConteoEstimadoPaginator
+from .services import acciones_masivas
+
+MAX_AUTORES_FILTRO = 20
+
+
+class FiltroAutor(admin.SimpleListFilter):
+    """Filtro por autor con buscador: nunca lista todos los autores.
+
+    Sin búsqueda muestra los autores con más libros; con ?autor_q= los que empiezan
+    por ese texto. Siempre como mucho MAX_AUTORES_FILTRO opciones.
+    """
+    title = 'autor'
+    parameter_name = 'autor'
+    parametro_busqueda = 'autor_q'
+    template = 'admin/libros/filtro_autor.html'
+
+    def __init__(self, request, params, model, model_admin):
+        self.busqueda = ''
+        if self.parametro_busqueda in params:
+            self.busqueda = params.pop(self.parametro_busqueda)[-1].strip()
+        # Parámetros del resto del changelist que el formulario de búsqueda debe conservar
+        self.parametros_ocultos = [
+            (clave, valor) for clave, valor in request.GET.items()
+            if clave not in (self.parameter_name, self.parametro_busqueda, 'p')
+        ]
+        super().__init__(request, params, model, model_admin)
+
+    def lookups(self, request, model_admin):
+        autores = Autor.objects.order_by('-num_libros', 'nombre')
+        if self.busqueda:
+            autores = autores.filter(nombre__istartswith=self.busqueda)
+        opciones = list(autores.values_list('pk', 'nombre')[:MAX_AUTORES_FILTRO])
+        # El autor elegido se muestra aunque no esté entre los resultados
+        valor = self.value()
+        if valor and valor.isdigit() and all(str(pk) != valor for pk, _ in opciones):
+            opciones[:0] = Autor.objects.filter(pk=valor).values_list('pk', 'nombre')
+        return [(str(pk), nombre) for pk, nombre in opciones]
+
+    def has_output(self):
+        return True
+
+    def expected_parameters(self):
+        return [self.parameter_name, self.parametro_busqueda]
+
+    def queryset(self, request, queryset):
+        valor = self.value()
+        if valor is None:
+            return queryset
+        if not valor.isdigit():
+            return queryset.none()
+        return queryset.filter(autor_id=valor)
+
 
 # --- REGISTRO DE MODELOS ---
 
@@ -9,25 +64,99 @@ from .models import Autor, Categoria, Libro
 @admin.register(Categoria)
 class CategoriaAdmin(admin.ModelAdmin):
     # Los campos de list_display son correctos según tu modelo
-    list_display = ('nombre',)
+    list_display = ('nombre', 'num_libros')
     search_fields = ('nombre',)
 
+    def delete_queryset(self, request, queryset):
+        # QuerySet.delete() no pasa por Categoria.delete(): sin esto sus libros quedarían
+        # con el `actualizado` de antes y las tarjetas cacheadas con la categoría borrada
+        acciones_masivas.eliminar_categorias(queryset)
+
 # 2. Registrar Autor
 @admin.register(Autor)
 class AutorAdmin(admin.ModelAdmin):
     # Los campos de list_display son correctos según tu modelo
-    list_display = ('nombre', 'fecha_nacimiento')
+    list_display = ('nombre', 'fecha_nacimiento', 'num_libros')
+    # search_fields también lo usa el autocompletado del campo autor en LibroAdmin
     search_fields = ('nombre',)
+    ordering = ('nombre',)
+    paginator = ConteoEstimadoPaginator
+    show_full_result_count = False
+
+    def delete_queryset(self, request, queryset):
+        # QuerySet.delete() no pasa por Autor.delete(): sin esto las categorías seguirían
+        # contando los libros borrados en cascada
+        acciones_masivas.eliminar_autores(queryset)
 
 # 3. Registrar Libro
 @admin.register(Libro)
 class LibroAdmin(admin.ModelAdmin):
     list_display = ('titulo', 'autor', 'categoria', 'isbn', 'fecha_publicacion') 
-    list_filter = ('categoria', 'autor')
+    # 🚀 Tablas grandes: un JOIN en lugar de una consulta por fila y sin <select> con todos los autores
+    list_select_related = ('autor', 'categoria')
+    autocomplete_fields = ('autor', 'categoria')
+    list_filter = ('categoria', FiltroAutor)
+    # Sin COUNT(*) del total sin filtrar ni recuentos por faceta en cada carga
+    paginator = ConteoEstimadoPaginator
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+    # search_fields activa la caja de búsqueda; get_search_results usa el índice de texto completo
     search_fields = ('titulo', 'autor__nombre', 'isbn')
     
     # Genera automáticamente el slug basado en el título
     prepopulated_fields = {'slug': ('titulo',)} 
     
     # Lista de inlines vacía ya que ReseñaInline fue eliminado
-    inlines = []
\ No newline at end of file
+    inlines = []
+
+    # ⚡ Acciones masivas: SQL por páginas y Firestore en WriteBatch de 500 operaciones
+    actions = ['enviar_a_firestore', 'eliminar_de_firestore', 'reasignar_slugs']
+
+    @admin.action(description="Enviar los libros seleccionados a Firestore")
+    def enviar_a_firestore(self, request, queryset):
+        resumen = acciones_masivas.enviar_a_firestore(get_firebase_db(), queryset)
+        self.message_user(request, f"{resumen['enviados']} libros enviados a Firestore "
+                                   f"en {resumen['commits']} commits.", messages.SUCCESS)
+        self._avisar_encolados(request, resumen)
+
+    @admin.action(description="Eliminar de Firestore los libros seleccionados")
+    def eliminar_de_firestore(self, request, queryset):
+        resumen = acciones_masivas.eliminar_de_firestore(get_firebase_db(), queryset)
+        self.message_user(request, f"{resumen['eliminados']} documentos eliminados de Firestore "
+                                   f"en {resumen['commits']} commits.", messages.SUCCESS)
+        self._avisar_encolados(request, resumen)
+
+    @admin.action(description="Regenerar el slug de los libros seleccionados")
+    def reasignar_slugs(self, request, queryset):
+        resumen = acciones_masivas.reasignar_slugs(queryset)
+        self.message_user(request, f"{resumen['cambiados']} de {resumen['revisados']} slugs regenerados.",
+                          messages.SUCCESS)
+
+    def _avisar_encolados(self, request, resumen):
+        if resumen['encolados']:
+            self.message_user(request, f"Firestore falló: {resumen['encolados']} libros quedan en la "
+                                       "outbox y los enviará sync_firestore.", messages.WARNING)
+
+    def delete_queryset(self, request, queryset):
+        # QuerySet.delete() no pasa por Libro.delete(): contadores, caché y Firestore por páginas
+        acciones_masivas.eliminar_libros(queryset)
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return filtrar_libros(queryset, search_term), False
+
+# 4. Outbox de sincronización con Firestore (sólo lectura, para vigilar errores)
+@admin.register(SincronizacionPendiente)
+class SincronizacionPendienteAdmin(admin.ModelAdmin):
+    list_display = ('libro_pk', 'operacion', 'intentos', 'siguiente_intento', 'creado')
+    list_filter = ('operacion',)
+    readonly_fields = ('libro_pk', 'operacion', 'creado', 'actualizado', 'intentos',
+                       'siguiente_intento', 'ultimo_error')
+
+# 5. Renombrados pendientes de propagar a Firestore (sólo lectura)
+@admin.register(PropagacionPendiente)
+class PropagacionPendienteAdmin(admin.ModelAdmin):
+    list_display = ('campo', 'objeto_pk', 'ultimo_libro_pk', 'creado', 'actualizado')
+    list_filter = ('campo',)
+    readonly_fields = ('campo', 'objeto_pk', 'ultimo_libro_pk', 'creado', 'actualizado')
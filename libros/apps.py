@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class LibrosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'libros'
+
+    def ready(self):
+        from core.metricas import registrar_colector
+        from .metricas import metricas_libros
+
+        registrar_colector(metricas_libros)
@@ -0,0 +1,96 @@
+# libros/busqueda.py
+
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Libro
+
+
+# Sólo letras y dígitos: la consulta del usuario nunca llega cruda al motor FTS
+PATRON_TERMINO = re.compile(r'\w+', re.UNICODE)
+
+
+def _terminos(consulta):
+    return PATRON_TERMINO.findall(consulta or '')[:10]
+
+
+def _consulta_indice(terminos):
+    """SQL (sobre el índice de texto completo) y parámetros de los ids que coinciden."""
+    if connection.vendor == 'sqlite':
+        # Cada término como prefijo entre comillas: "cien"* "sole"*
+        match = ' '.join(f'"{termino}"*' for termino in terminos)
+        return (
+            "SELECT rowid AS libro_id, bm25(libros_busqueda, 10.0, 5.0, 1.0) AS rango "
+            "FROM libros_busqueda WHERE libros_busqueda MATCH %s",
+            [match],
+        )
+    if connection.vendor == 'postgresql':
+        tsquery = ' & '.join(f'{termino}:*' for termino in terminos)
+        return (
+            "SELECT libro_id, -ts_rank(documento, q) AS rango "
+            "FROM libros_busqueda, to_tsquery('simple', unaccent(%s)) q WHERE documento @@ q",
+            [tsquery],
+        )
+    return None, None
+
+
+def filtrar_libros(queryset, consulta):
+    """Restringe `queryset` a los libros que coinciden con `consulta` usando el índice."""
+    terminos = _terminos(consulta)
+    if not terminos:
+        return queryset.none()
+    sql, params = _consulta_indice(terminos)
+    if sql is None:
+        # Motor sin índice de texto completo: se recurre a LIKE
+        for termino in terminos:
+            queryset = queryset.filter(
+                Q(titulo__icontains=termino) | Q(autor__nombre__icontains=termino) | Q(isbn__icontains=termino)
+            )
+        return queryset
+    return queryset.filter(pk__in=RawSQL(f"SELECT libro_id FROM ({sql}) coincidencias", params))
+
+
+class ResultadosBusqueda:
+    """Resultados ordenados por relevancia; se pagina con el Paginator de Django.
+
+    Cada página es una consulta LIMIT/OFFSET sobre el índice más un `in_bulk` de
+    los libros de esa página, nunca un recorrido de la tabla de libros.
+    """
+
+    def __init__(self, consulta):
+        self.terminos = _terminos(consulta)
+        self.sql, self.params = _consulta_indice(self.terminos) if self.terminos else (None, None)
+
+    def count(self):
+        if not self.terminos:
+            return 0
+        if self.sql is None:
+            return filtrar_libros(Libro.objects.all(), ' '.join(self.terminos)).count()
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM ({self.sql}) coincidencias", self.params)
+            return cursor.fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, rebanada):
+        if not isinstance(rebanada, slice):
+            raise TypeError("ResultadosBusqueda sólo admite rebanadas.")
+        inicio = rebanada.start or 0
+        limite = rebanada.stop - inicio
+        if not self.terminos or limite <= 0:
+            return []
+        libros = Libro.objects.select_related('autor', 'categoria')
+        if self.sql is None:
+            return list(filtrar_libros(libros, ' '.join(self.terminos)).order_by('titulo')[inicio:rebanada.stop])
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT libro_id FROM ({self.sql}) coincidencias ORDER BY rango LIMIT %s OFFSET %s",
+                [*self.params, limite, inicio],
+            )
+            ids = [fila[0] for fila in cursor.fetchall()]
+        por_id = libros.in_bulk(ids)
+        return [por_id[pk] for pk in ids if pk in por_id]
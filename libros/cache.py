@@ -0,0 +1,104 @@
+# libros/cache.py
+
+import hashlib
+import uuid
+
+from django.core.cache import cache
+
+
+TIEMPO_DETALLE = 24 * 60 * 60
+VARIANTES_DETALLE = ('publico', 'admin')
+CLAVE_ACIERTOS = 'libros:detalle:aciertos'
+CLAVE_FALLOS = 'libros:detalle:fallos'
+
+
+def _clave_detalle(slug, variante):
+    return f"libros:detalle:{variante}:{slug}"
+
+
+def _clave_version(modelo, pk):
+    return f"libros:version:{modelo}:{pk}"
+
+
+def _incrementar(clave):
+    try:
+        cache.incr(clave)
+    except ValueError:
+        cache.add(clave, 0, None)
+        cache.incr(clave)
+
+
+# --- VERSIONES DE AUTOR/CATEGORÍA ---
+# Renombrar un autor no recorre sus libros: basta con cambiar su versión y las
+# páginas cacheadas que la guardaron dejan de ser válidas.
+
+def _versiones(autor_id, categoria_id):
+    claves = [_clave_version('autor', autor_id), _clave_version('categoria', categoria_id)]
+    versiones = cache.get_many(claves)
+    faltantes = {clave: uuid.uuid4().hex for clave in claves if clave not in versiones}
+    if faltantes:
+        cache.set_many(faltantes, None)
+        versiones.update(faltantes)
+    return [versiones[clave] for clave in claves]
+
+
+def invalidar_autor(pk):
+    cache.set(_clave_version('autor', pk), uuid.uuid4().hex, None)
+
+
+def invalidar_categoria(pk):
+    cache.set(_clave_version('categoria', pk), uuid.uuid4().hex, None)
+
+
+# --- PÁGINA DE DETALLE ---
+
+def obtener_detalle(slug, variante):
+    """Devuelve el detalle cacheado (dict con 'titulo' y 'contenido') o None."""
+    entrada = cache.get(_clave_detalle(slug, variante))
+    if entrada is not None:
+        claves = [_clave_version('autor', entrada['autor_id']),
+                  _clave_version('categoria', entrada['categoria_id'])]
+        versiones = cache.get_many(claves)
+        if [versiones.get(clave) for clave in claves] == entrada['versiones']:
+            _incrementar(CLAVE_ACIERTOS)
+            return entrada
+    _incrementar(CLAVE_FALLOS)
+    return None
+
+
+def guardar_detalle(slug, variante, libro, contenido):
+    cache.set(_clave_detalle(slug, variante), {
+        'titulo': libro.titulo,
+        'contenido': contenido,
+        'autor_id': libro.autor_id,
+        'categoria_id': libro.categoria_id,
+        'versiones': _versiones(libro.autor_id, libro.categoria_id),
+    }, TIEMPO_DETALLE)
+
+
+def invalidar_detalle(*slugs):
+    cache.delete_many([_clave_detalle(slug, variante)
+                       for slug in slugs if slug for variante in VARIANTES_DETALLE])
+
+
+def estadisticas_detalle():
+    """Aciertos y fallos acumulados de la caché de detalle."""
+    valores = cache.get_many([CLAVE_ACIERTOS, CLAVE_FALLOS])
+    return {
+        'aciertos': valores.get(CLAVE_ACIERTOS, 0),
+        'fallos': valores.get(CLAVE_FALLOS, 0),
+    }
+
+
+# --- LISTADO (home.html) ---
+# Las tarjetas se cachean con {% cache %} por (pk, actualizado); para anónimos, además,
+# la página completa con una clave que agrega las versiones de todos sus libros.
+
+def clave_pagina_listado(libros, *estado):
+    """Clave de una página del listado: cambia en cuanto cambia cualquiera de sus libros.
+
+    `estado` añade lo que pinta la paginación (número de página, cursor, total…).
+    """
+    partes = [f"{libro.pk}:{libro.actualizado.isoformat()}" for libro in libros]
+    partes += [str(valor) for valor in estado]
+    return hashlib.md5('|'.join(partes).encode()).hexdigest()
@@ -0,0 +1,417 @@
+# libros/catalogo.py
+#
+# Snapshot del catálogo completo en msgpack para apps móviles e integraciones: se genera
+# con `manage.py generar_catalogo` (y tras las escrituras, en un solo proceso) y se sirve
+# como fichero, sin consultas. Formato: un único mapa msgpack
+#
+#   {'formato': 1, 'version': <ms>, 'generado': <ISO 8601>, 'campos': [...],
+#    'autores': [[nombre, slug], ...], 'categorias': [[nombre, slug], ...],
+#    'indice': <bin>, 'libros': [[id, titulo, isbn, slug, fecha, autor, categoria, actualizado], ...]}
+#
+# Los libros van ordenados por slug y referencian autor y categoría por su posición en
+# las tablas. `indice` son los desplazamientos (uint32) de cada libro dentro de 'libros':
+# con el fichero mapeado en memoria, buscar un slug desempaqueta sólo ~log2(n) libros.
+
+import fcntl
+import logging
+import mmap
+import os
+import re
+import tempfile
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager
+from operator import itemgetter
+
+import msgpack
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+FORMATO = 1
+NOMBRE_ARCHIVO = 'catalogo.msgpack'
+# Junto al snapshot: cerrojo entre procesos y marca de la última escritura (su mtime)
+NOMBRE_CERROJO = '.catalogo.lock'
+NOMBRE_MARCA = '.catalogo.obsoleto'
+CAMPOS = ['id', 'titulo', 'isbn', 'slug', 'fecha_publicacion', 'autor', 'categoria', 'actualizado']
+POSICION_SLUG = CAMPOS.index('slug')
+TAMANO_CURSOR = 2000
+CONTENT_TYPE = 'application/x-msgpack'
+PATRON_RANGO = re.compile(r'^bytes=(\d*)-(\d*)$')
+# Retry-After (segundos) del 503 mientras no existe ningún snapshot
+ESPERA_NO_GENERADO = 30
+
+
+def _config():
+    return {
+        'DIRECTORIO': os.path.join(settings.MEDIA_ROOT, 'catalogo'),
+        'REGENERAR': False,
+        'ESPERA': 5,
+        **getattr(settings, 'CATALOGO', {}),
+    }
+
+
+def ruta_catalogo():
+    return os.path.join(_config()['DIRECTORIO'], NOMBRE_ARCHIVO)
+
+
+def _ruta(nombre):
+    directorio = _config()['DIRECTORIO']
+    os.makedirs(directorio, exist_ok=True)
+    return os.path.join(directorio, nombre)
+
+
+@contextmanager
+def _cerrojo(esperar=True):
+    """flock exclusivo sobre NOMBRE_CERROJO: un solo proceso genera a la vez.
+
+    Devuelve True con el cerrojo tomado, o False si otro proceso lo tiene y no se espera.
+    """
+    with open(_ruta(NOMBRE_CERROJO), 'a') as cerrojo:
+        try:
+            fcntl.flock(cerrojo, fcntl.LOCK_EX if esperar else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(cerrojo, fcntl.LOCK_UN)
+
+
+# --- GENERACIÓN ---
+
+def generar_catalogo():
+    """Escribe el snapshot en un temporal del mismo directorio y lo publica con os.replace().
+
+    Quien esté leyendo (o sirviendo) el anterior sigue con su fichero hasta terminar; si
+    otro proceso lo está generando, se espera a que termine. Devuelve un resumen con la
+    versión, el número de libros y el tamaño en bytes.
+    """
+    with _cerrojo():
+        return _generar()
+
+
+@contextmanager
+def _instantanea(alias):
+    """Transacción de lectura en la que todas las consultas ven el mismo estado de la BD.
+
+    En SQLite basta la transacción (la instantánea se fija en la primera lectura); en
+    PostgreSQL, con READ COMMITTED, cada consulta vería su propio momento.
+    """
+    conexion = connections[alias]
+    exterior = not conexion.in_atomic_block
+    with transaction.atomic(using=alias):
+        # Sólo la primera sentencia de la transacción puede fijar el aislamiento
+        if exterior and conexion.vendor == 'postgresql':
+            with conexion.cursor() as cursor:
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+        yield
+
+
+def _generar():
+    from .models import Autor, Categoria, Libro
+
+    # El mtime del snapshot es el momento en que se empezó a leer: lo escrito después
+    # (con una marca más reciente) no está dentro
+    inicio = time.time_ns()
+    # Las tres lecturas en una instantánea: un libro nunca apunta a un autor que no se leyó
+    with _instantanea(DEFAULT_DB_ALIAS):
+        autores, posicion_autor = [], {}
+        for pk, nombre, slug in (Autor.objects.using(DEFAULT_DB_ALIAS).order_by('pk')
+                                 .values_list('pk', 'nombre', 'slug')):
+            posicion_autor[pk] = len(autores)
+            autores.append([nombre, slug])
+        categorias, posicion_categoria = [], {}
+        for pk, nombre, slug in (Categoria.objects.using(DEFAULT_DB_ALIAS).order_by('pk')
+                                 .values_list('pk', 'nombre', 'slug')):
+            posicion_categoria[pk] = len(categorias)
+            categorias.append([nombre, slug])
+
+        filas = Libro.objects.using(DEFAULT_DB_ALIAS).order_by().values_list(
+            'id', 'titulo', 'isbn', 'slug', 'fecha_publicacion', 'autor_id', 'categoria_id', 'actualizado',
+        ).iterator(chunk_size=TAMANO_CURSOR)
+        # Orden de Python (por código), no la collation de la base de datos: es el que usa la búsqueda
+        filas = sorted(filas, key=itemgetter(POSICION_SLUG))
+
+    packer = msgpack.Packer()
+    cuerpo, indice = bytearray(), array('I')
+    for pk, titulo, isbn, slug, fecha, autor_id, categoria_id, actualizado in filas:
+        indice.append(len(cuerpo))
+        cuerpo += packer.pack([
+            pk, titulo, isbn, slug, fecha.isoformat(),
+            posicion_autor[autor_id], posicion_categoria.get(categoria_id),
+            int(actualizado.timestamp() * 1000),
+        ])
+    indice.append(len(cuerpo))
+    if len(cuerpo) >= 2 ** 32:
+        raise ValueError("El catálogo no cabe en un índice de 32 bits.")
+
+    version = int(time.time() * 1000)
+    cabecera = {
+        'formato': FORMATO,
+        'version': version,
+        'generado': timezone.now().isoformat(),
+        'campos': CAMPOS,
+        'autores': autores,
+        'categorias': categorias,
+        'indice': indice.tobytes(),
+    }
+    directorio = _config()['DIRECTORIO']
+    os.makedirs(directorio, exist_ok=True)
+    descriptor, temporal = tempfile.mkstemp(prefix='.catalogo-', dir=directorio)
+    try:
+        with os.fdopen(descriptor, 'wb') as archivo:
+            # 'libros' va el último: su contenido se escribe tal cual detrás de la cabecera
+            archivo.write(packer.pack_map_header(len(cabecera) + 1))
+            for clave, valor in cabecera.items():
+                archivo.write(packer.pack(clave))
+                archivo.write(packer.pack(valor))
+            archivo.write(packer.pack('libros'))
+            archivo.write(packer.pack_array_header(len(indice) - 1))
+            archivo.write(cuerpo)
+            archivo.flush()
+            os.fsync(archivo.fileno())
+        # mkstemp crea el fichero sólo legible por su dueño; nginx (X-Accel) también lo lee
+        os.chmod(temporal, 0o644)
+        os.utime(temporal, ns=(inicio, inicio))
+        os.replace(temporal, os.path.join(directorio, NOMBRE_ARCHIVO))
+    except BaseException:
+        os.unlink(temporal)
+        raise
+    return {'version': version, 'libros': len(indice) - 1, 'bytes': os.path.getsize(ruta_catalogo())}
+
+
+# --- REGENERACIÓN TRAS LAS ESCRITURAS ---
+# Cada escritura confirmada actualiza el mtime de NOMBRE_MARCA. En los workers web, un
+# temporizador por proceso agrupa las escrituras de ESPERA segundos; al saltar, sólo
+# regenera quien consigue el cerrojo y sólo si la marca es posterior al snapshot, así
+# que una ráfaga de escrituras repartida entre varios workers cuesta una regeneración.
+# Los comandos (import_libros) terminan antes de que salte: regeneran en el momento.
+
+_temporizador = None
+_temporizador_lock = threading.Lock()
+
+
+def catalogo_obsoleto(inmediato=False):
+    """Llamar tras escribir libros, autores o categorías (se aplica al confirmar la transacción).
+
+    Con inmediato=True se regenera en este proceso y sin temporizador, esperando si otro
+    proceso lo está generando: para los comandos de gestión, que salen antes de que salte.
+    """
+    if _config()['REGENERAR']:
+        transaction.on_commit(_regenerar_ahora if inmediato else _programar_regeneracion)
+
+
+def _marcar_obsoleto():
+    marca = _ruta(NOMBRE_MARCA)
+    with open(marca, 'a'):
+        pass
+    os.utime(marca)
+
+
+def _al_dia():
+    try:
+        generado = os.stat(ruta_catalogo()).st_mtime_ns
+    except FileNotFoundError:
+        return False
+    try:
+        return os.stat(_ruta(NOMBRE_MARCA)).st_mtime_ns <= generado
+    except FileNotFoundError:
+        return True
+
+
+def regenerar_si_obsoleto(esperar=True):
+    """Regenera el snapshot si hay escrituras posteriores a él.
+
+    Devuelve el resumen de generar_catalogo(), None si ya estaba al día o False si otro
+    proceso tiene el cerrojo y no se espera.
+    """
+    with _cerrojo(esperar) as tomado:
+        if not tomado:
+            return False
+        if _al_dia():
+            return None
+        return _generar()
+
+
+def _regenerar_ahora():
+    _marcar_obsoleto()
+    resumen = regenerar_si_obsoleto()
+    if resumen:
+        logger.info("Catálogo regenerado: %s", resumen)
+
+
+def _programar_regeneracion():
+    _marcar_obsoleto()
+    _programar_temporizador()
+
+
+def _programar_temporizador():
+    global _temporizador
+    with _temporizador_lock:
+        if _temporizador is not None:
+            return
+        _temporizador = threading.Timer(_config()['ESPERA'], _regenerar)
+        _temporizador.daemon = True
+        _temporizador.start()
+
+
+def _regenerar():
+    global _temporizador
+    with _temporizador_lock:
+        _temporizador = None
+    try:
+        resumen = regenerar_si_obsoleto(esperar=False)
+        if resumen is False:
+            # Otro proceso está generando, quizá con lo leído antes de estas escrituras:
+            # se vuelve a mirar después (si su snapshot ya las incluye, no se hace nada)
+            _programar_temporizador()
+        elif resumen is not None:
+            logger.info("Catálogo regenerado: %s", resumen)
+    except Exception:
+        logger.exception("Fallo al regenerar el catálogo")
+    finally:
+        # Las conexiones de este hilo no las cierra nadie más
+        connections.close_all()
+
+
+# --- LECTURA CON MMAP ---
+
+class Catalogo:
+    """Snapshot mapeado en memoria: cabecera y tablas cargadas, libros leídos bajo demanda."""
+
+    def __init__(self, archivo):
+        estado = os.fstat(archivo.fileno())
+        self.identidad = (estado.st_ino, estado.st_mtime_ns, estado.st_size)
+        self.modificado = estado.st_mtime
+        self.tamano = estado.st_size
+        # mmap duplica el descriptor: el fichero puede cerrarse o sustituirse después
+        self._mm = mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ)
+
+        unpacker = msgpack.Unpacker(self._mm, raw=False)
+        cabecera = {}
+        for _ in range(unpacker.read_map_header()):
+            clave = unpacker.unpack()
+            if clave == 'libros':
+                self._total = unpacker.read_array_header()
+                self._inicio = unpacker.tell()
+                break
+            cabecera[clave] = unpacker.unpack()
+        self.version = cabecera['version']
+        self.autores = cabecera['autores']
+        self.categorias = cabecera['categorias']
+        self._indice = array('I')
+        self._indice.frombytes(cabecera['indice'])
+
+    def __len__(self):
+        return self._total
+
+    def _fila(self, posicion):
+        inicio = self._inicio + self._indice[posicion]
+        return msgpack.unpackb(self._mm[inicio:self._inicio + self._indice[posicion + 1]], raw=False)
+
+    def libro(self, slug):
+        """El libro con ese slug (dict con autor y categoría resueltos) o None."""
+        posicion = bisect_left(range(self._total), slug, key=lambda i: self._fila(i)[POSICION_SLUG])
+        if posicion == self._total:
+            return None
+        fila = self._fila(posicion)
+        if fila[POSICION_SLUG] != slug:
+            return None
+        libro = dict(zip(CAMPOS, fila))
+        nombre, slug_autor = self.autores[libro['autor']]
+        libro['autor'] = {'nombre': nombre, 'slug': slug_autor}
+        if libro['categoria'] is not None:
+            nombre, slug_categoria = self.categorias[libro['categoria']]
+            libro['categoria'] = {'nombre': nombre, 'slug': slug_categoria}
+        return libro
+
+
+_catalogo = None
+_catalogo_lock = threading.Lock()
+
+
+def abrir_catalogo(archivo=None):
+    """Catálogo del proceso para `archivo` (ya abierto) o para el fichero publicado ahora.
+
+    Se reutiliza mientras el fichero no cambie; si se sustituyó, se mapea el nuevo.
+    Lanza FileNotFoundError si aún no se ha generado.
+    """
+    global _catalogo
+    propio = archivo is None
+    if propio:
+        archivo = open(ruta_catalogo(), 'rb')
+    try:
+        estado = os.fstat(archivo.fileno())
+        identidad = (estado.st_ino, estado.st_mtime_ns, estado.st_size)
+        with _catalogo_lock:
+            if _catalogo is None or _catalogo.identidad != identidad:
+                _catalogo = Catalogo(archivo)
+            return _catalogo
+    finally:
+        if propio:
+            archivo.close()
+
+
+def buscar_libros(slugs):
+    """{slug: libro o None} leídos del snapshot, sin consultas a la base de datos."""
+    catalogo = abrir_catalogo()
+    return {slug: catalogo.libro(slug) for slug in slugs}
+
+
+# --- ENVÍO POR TRAMOS (Range) ---
+
+def parsear_rango(cabecera, tamano):
+    """(inicio, fin) inclusivo de "Range: bytes=a-b", None sin rango útil o ValueError si no cabe.
+
+    Sólo se atiende un rango; varios (multipart/byteranges) se responden con el fichero entero.
+    """
+    coincidencia = PATRON_RANGO.match(cabecera.strip())
+    if coincidencia is None:
+        return None
+    desde, hasta = coincidencia.groups()
+    if not desde:
+        if not hasta or int(hasta) == 0:
+            raise ValueError(cabecera)
+        # bytes=-N: los últimos N bytes
+        return max(tamano - int(hasta), 0), tamano - 1
+    inicio = int(desde)
+    fin = min(int(hasta), tamano - 1) if hasta else tamano - 1
+    if inicio >= tamano or (hasta and int(hasta) < inicio):
+        raise ValueError(cabecera)
+    return inicio, fin
+
+
+class TramoArchivo:
+    """Fichero limitado a `longitud` bytes desde su posición actual.
+
+    Conserva fileno() y tell(): con gunicorn, wsgi.file_wrapper usa sendfile() desde
+    esa posición y con el Content-Length de la respuesta; si no, read() corta a tiempo.
+    """
+
+    def __init__(self, archivo, longitud):
+        self._archivo = archivo
+        self._restante = longitud
+
+    def read(self, tamano=-1):
+        if tamano is None or tamano < 0 or tamano > self._restante:
+            tamano = self._restante
+        datos = self._archivo.read(tamano)
+        self._restante -= len(datos)
+        return datos
+
+    def fileno(self):
+        return self._archivo.fileno()
+
+    def tell(self):
+        return self._archivo.tell()
+
+    def close(self):
+        self._archivo.close()
+
@@ -0,0 +1,107 @@
+# libros/facetas.py
+#
+# Navegación por facetas en home: ?categoria=<slug>&autor=<slug>&desde=<año>&hasta=<año>.
+# Los recuentos por faceta salen de Autor.num_libros / Categoria.num_libros (contadores
+# desnormalizados), no de un COUNT ... GROUP BY en cada petición.
+
+from datetime import date
+
+from django.core.cache import cache
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils.http import urlencode
+
+from core.db_router import lectura_en_primaria
+
+from .models import Autor, Categoria, Libro
+from .paginacion import CLAVE_VERSION_CONTEO
+
+
+PARAMETROS = ('categoria', 'autor', 'desde', 'hasta')
+MAX_AUTORES_FACETA = 20
+TIEMPO_FACETAS = 10 * 60
+
+
+def recalcular_contadores(autor_ids=None, categoria_ids=None):
+    """Recalcula num_libros desde SQL (tras bulk_create, QuerySet.delete() o cascadas).
+
+    Sin argumentos recalcula todos; un UPDATE con subconsulta por modelo.
+    """
+    for modelo, campo, ids in ((Autor, 'autor', autor_ids), (Categoria, 'categoria', categoria_ids)):
+        destino = modelo.objects.all() if ids is None else modelo.objects.filter(pk__in=ids)
+        conteo = (
+            Libro.objects.filter(**{campo: OuterRef('pk')}).order_by()
+            .values(campo).annotate(n=Count('pk')).values('n')
+        )
+        destino.update(num_libros=Coalesce(Subquery(conteo), 0))
+
+
+def parsear_filtros(parametros):
+    """Filtros válidos de la querystring; los años que no son números se ignoran."""
+    filtros = {}
+    for clave in ('categoria', 'autor'):
+        valor = parametros.get(clave, '').strip()
+        if valor:
+            filtros[clave] = valor
+    for clave in ('desde', 'hasta'):
+        valor = parametros.get(clave, '').strip()
+        if valor.isdigit() and 1 <= int(valor) <= 9999:
+            filtros[clave] = int(valor)
+    return filtros
+
+
+def aplicar_filtros(queryset, filtros):
+    """Filtra el listado y lo ordena por (fecha_publicacion, pk) para usar los índices compuestos.
+
+    Devuelve (queryset, seleccion, total): `seleccion` tiene el Autor/Categoria elegidos
+    y `total` el número de libros cuando un contador lo da sin COUNT (si no, None).
+    """
+    seleccion = {}
+    for clave, modelo in (('categoria', Categoria), ('autor', Autor)):
+        if clave in filtros:
+            # Se resuelve el slug a id: el filtro queda en la columna indexada, sin JOIN
+            seleccion[clave] = modelo.objects.only('nombre', 'slug', 'num_libros').filter(
+                slug=filtros[clave]).first()
+            if seleccion[clave] is None:
+                return queryset.none(), seleccion, 0
+            queryset = queryset.filter(**{f'{clave}_id': seleccion[clave].pk})
+    if 'desde' in filtros:
+        queryset = queryset.filter(fecha_publicacion__gte=date(filtros['desde'], 1, 1))
+    if 'hasta' in filtros:
+        queryset = queryset.filter(fecha_publicacion__lte=date(filtros['hasta'], 12, 31))
+
+    total = None
+    if len(filtros) == 1 and len(seleccion) == 1:
+        total = next(iter(seleccion.values())).num_libros
+    return queryset.order_by('fecha_publicacion', 'pk'), seleccion, total
+
+
+def querystring_filtros(filtros):
+    """Filtros activos listos para añadir a los enlaces de paginación."""
+    return urlencode([(clave, filtros[clave]) for clave in PARAMETROS if clave in filtros])
+
+
+def version_facetas():
+    """Cambia con los contadores o al renombrar un autor o categoría (la versión del COUNT cacheado)."""
+    return cache.get(CLAVE_VERSION_CONTEO, 0)
+
+
+def obtener_facetas():
+    """Categorías y autores más numerosos con su recuento (cacheado hasta el próximo cambio)."""
+    clave = f"libros:facetas:{version_facetas()}"
+    facetas = cache.get(clave)
+    if facetas is None:
+        # Se cachean para todos: de la primaria, no de una réplica que quizá va con retraso
+        with lectura_en_primaria():
+            facetas = {
+                'categorias': list(
+                    Categoria.objects.filter(num_libros__gt=0).order_by('nombre')
+                    .values('nombre', 'slug', 'num_libros')
+                ),
+                'autores': list(
+                    Autor.objects.filter(num_libros__gt=0).order_by('-num_libros', 'nombre')
+                    .values('nombre', 'slug', 'num_libros')[:MAX_AUTORES_FACETA]
+                ),
+            }
+        cache.set(clave, facetas, TIEMPO_FACETAS)
+    return facetas
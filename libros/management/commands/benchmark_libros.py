@@ -0,0 +1,412 @@
+# libros/management/commands/benchmark_libros.py
+
+import asyncio
+import importlib.util
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+from urllib.parse import quote
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_databases, teardown_databases
+from django.urls import reverse
+from django.utils import timezone
+
+from libros.cache import invalidar_detalle
+from libros.facetas import recalcular_contadores
+from libros.models import Autor, Categoria, Libro
+from libros.paginacion import codificar_cursor
+from digital_library.firebase_config import get_firebase_db, reiniciar_clientes
+from libros.services.sincronizacion import procesar_pendientes
+from libros.views_firebase import invalidar_paginas
+from libros.slugs import asignar_slugs
+
+
+CACHE_AISLADA = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                             'LOCATION': 'benchmark-libros'}}
+MUESTRAS_MEMORIA = 20  # peticiones extra medidas con tracemalloc (lo ralentiza)
+ESPERA_ARRANQUE = 30   # segundos máximos para que gunicorn/uvicorn acepten conexiones
+
+
+def _resumen(tiempos, consultas, memoria):
+    if not tiempos:
+        # Escenario sin muestras (p. ej. la outbox ya estaba vacía): mismas claves, a cero
+        return {'n': 0, 'p50_ms': 0.0, 'p95_ms': 0.0, 'media_ms': 0.0,
+                'consultas_media': 0.0, 'consultas_max': 0, 'memoria_pico_kib': None}
+    percentiles = statistics.quantiles(tiempos, n=100) if len(tiempos) > 1 else tiempos * 99
+    return {
+        'n': len(tiempos),
+        'p50_ms': round(percentiles[49] * 1000, 3),
+        'p95_ms': round(percentiles[94] * 1000, 3),
+        'media_ms': round(statistics.fmean(tiempos) * 1000, 3),
+        'consultas_media': round(statistics.fmean(consultas), 2),
+        'consultas_max': max(consultas),
+        'memoria_pico_kib': round(max(memoria) / 1024, 1) if memoria else None,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Siembra un catálogo de prueba en una BD temporal y mide latencia (p50/p95), "
+        "consultas y memoria de las vistas de libros. Firestore se sustituye por un cliente en memoria. "
+        "Con --servidores compara también las RPS sostenidas bajo gunicorn (WSGI) y uvicorn (ASGI)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--autores', type=int, default=200)
+        parser.add_argument('--categorias', type=int, default=20)
+        parser.add_argument('--libros', type=int, default=10000)
+        parser.add_argument('--peticiones', type=int, default=200, help="Peticiones medidas por escenario.")
+        parser.add_argument('--semilla', type=int, default=1234)
+        parser.add_argument('--salida', help="Archivo JSON de resultados (por defecto, stdout).")
+        parser.add_argument('--bd-actual', action='store_true',
+                            help="Usa la BD configurada en lugar de una temporal (¡la modifica!).")
+        parser.add_argument('--servidores', action='store_true',
+                            help="Compara además las RPS sostenidas con gunicorn (WSGI) y uvicorn (ASGI).")
+        parser.add_argument('--concurrencia', type=int, default=32,
+                            help="Peticiones simultáneas contra cada servidor (--servidores).")
+        parser.add_argument('--duracion', type=float, default=5.0,
+                            help="Segundos de carga sostenida por ruta y servidor (--servidores).")
+        parser.add_argument('--latencia-firestore', type=float, default=20.0,
+                            help="Milisegundos por llamada del Firestore en memoria (simula el RPC).")
+
+    def handle(self, *args, **options):
+        if options['servidores']:
+            faltan = [m for m in ('gunicorn', 'uvicorn', 'httpx') if importlib.util.find_spec(m) is None]
+            if faltan:
+                raise CommandError(f"--servidores necesita {', '.join(faltan)} (ver requirements.txt).")
+
+        # Firestore en memoria con latencia: se carga con el catálogo sembrado en el primer uso
+        firebase = {**settings.FIREBASE_CONFIG, 'SYNC_ENABLED': True, 'BACKEND': 'memoria',
+                    'LATENCIA': options['latencia_firestore'] / 1000, 'PROBABILIDAD_FALLO': 0.0,
+                    'MEMORIA_DESDE_SQL': True}
+        reiniciar_clientes()
+        temporal = tempfile.mkdtemp(prefix='benchmark-libros-')
+        try:
+            with override_settings(DEBUG=False, ALLOWED_HOSTS=['testserver'],
+                                   CACHES=CACHE_AISLADA, FIREBASE_CONFIG=firebase):
+                if options['bd_actual']:
+                    resultado = self._ejecutar(options)
+                else:
+                    if options['servidores'] and connection.vendor == 'sqlite':
+                        # Los servidores son otros procesos: la BD temporal no puede estar en memoria
+                        connection.settings_dict['TEST']['NAME'] = os.path.join(temporal, 'benchmark.sqlite3')
+                    config = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+                    try:
+                        resultado = self._ejecutar(options)
+                    finally:
+                        teardown_databases(config, verbosity=0)
+        finally:
+            reiniciar_clientes()
+            shutil.rmtree(temporal, ignore_errors=True)
+
+        salida = json.dumps(resultado, indent=2, ensure_ascii=False)
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                archivo.write(salida)
+            for nombre, datos in resultado['escenarios'].items():
+                self.stdout.write(
+                    f"{nombre:<24} p50={datos['p50_ms']:>8.2f} ms  p95={datos['p95_ms']:>8.2f} ms  "
+                    f"consultas={datos['consultas_media']:>5}"
+                )
+            for servidor, rutas in resultado.get('servidores', {}).items():
+                for nombre, datos in rutas.items():
+                    self.stdout.write(
+                        f"{servidor}:{nombre:<19} rps={datos['rps']:>8.1f}  p50={datos['p50_ms']:>8.2f} ms  "
+                        f"p95={datos['p95_ms']:>8.2f} ms  errores={datos['errores']}"
+                    )
+        else:
+            self.stdout.write(salida)
+
+    # --- SIEMBRA ---
+
+    def _sembrar(self, options):
+        rnd = random.Random(options['semilla'])
+        nombres = [f"Autor {i}" for i in range(options['autores'])]
+        autores = Autor.objects.bulk_create(
+            [Autor(nombre=n, slug=s) for n, s in zip(nombres, asignar_slugs(Autor, nombres))]
+        )
+        nombres = [f"Categoría {i}" for i in range(options['categorias'])]
+        categorias = Categoria.objects.bulk_create(
+            [Categoria(nombre=n, slug=s) for n, s in zip(nombres, asignar_slugs(Categoria, nombres))]
+        )
+        for inicio in range(0, options['libros'], 1000):
+            titulos = [f"Libro {i}" for i in range(inicio, min(inicio + 1000, options['libros']))]
+            Libro.objects.bulk_create([
+                Libro(
+                    titulo=titulo, slug=slug, isbn=f"97{inicio + i:011d}",
+                    fecha_publicacion=date(1900 + rnd.randrange(125), 1 + rnd.randrange(12), 1),
+                    autor=rnd.choice(autores), categoria=rnd.choice(categorias),
+                )
+                for i, (titulo, slug) in enumerate(zip(titulos, asignar_slugs(Libro, titulos)))
+            ])
+        recalcular_contadores()
+        return rnd, autores, categorias
+
+    # --- MEDICIÓN ---
+
+    def _medir(self, peticion, n, preparar=None):
+        """Mide `peticion(i)` n veces; `preparar(i)` se ejecuta antes, fuera del tiempo medido."""
+        tiempos, consultas = [], []
+        for i in range(n):
+            if preparar:
+                preparar(i)
+            with CaptureQueriesContext(connection) as capturadas:
+                inicio = time.perf_counter()
+                peticion(i)
+                tiempos.append(time.perf_counter() - inicio)
+            consultas.append(len(capturadas))
+
+        memoria = []
+        tracemalloc.start()
+        try:
+            for i in range(n, n + min(n, MUESTRAS_MEMORIA)):
+                if preparar:
+                    preparar(i)
+                tracemalloc.reset_peak()
+                base = tracemalloc.get_traced_memory()[0]
+                peticion(i)
+                memoria.append(tracemalloc.get_traced_memory()[1] - base)
+        finally:
+            tracemalloc.stop()
+        return _resumen(tiempos, consultas, memoria)
+
+    def _medir_vaciado(self, firestore):
+        """Mide cada lote de `procesar_pendientes` hasta que la outbox queda vacía.
+
+        La consulta vacía que confirma el final no cuenta: con --peticiones grandes
+        las rondas sin nada que enviar dominarían los percentiles.
+        """
+        tiempos, consultas = [], []
+        while True:
+            with CaptureQueriesContext(connection) as capturadas:
+                inicio = time.perf_counter()
+                enviadas = procesar_pendientes(firestore)
+                duracion = time.perf_counter() - inicio
+            if not enviadas:
+                break
+            tiempos.append(duracion)
+            consultas.append(len(capturadas))
+        return _resumen(tiempos, consultas, [])
+
+    def _ejecutar(self, options):
+        inicio_siembra = time.perf_counter()
+        rnd, autores, categorias = self._sembrar(options)
+        siembra = time.perf_counter() - inicio_siembra
+        n = options['peticiones']
+
+        anonimo = Client()
+        admin = Client()
+        admin.force_login(User.objects.create_superuser(
+            username=f"benchmark-{timezone.now():%Y%m%d%H%M%S%f}", password=None,
+        ))
+        slugs = list(Libro.objects.values_list('slug', flat=True)[:max(n, 1) * 2])
+        ultimo_pk = Libro.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        muestra = [rnd.choice(slugs) for _ in range(n + MUESTRAS_MEMORIA)] if slugs else []
+        home = reverse('home')
+
+        def comprobar(response, esperado=200):
+            if response.status_code != esperado:
+                raise RuntimeError(f"{response.request['PATH_INFO']} devolvió {response.status_code}")
+
+        def datos_libro(i, prefijo):
+            return {
+                'titulo': f"Libro nuevo {i}", 'isbn': f"{prefijo}{i:011d}",
+                'fecha_publicacion': '2024-01-01',
+                'autor': rnd.choice(autores).pk, 'categoria': rnd.choice(categorias).pk,
+            }
+
+        escenarios = {}
+        escenarios['home'] = self._medir(lambda i: comprobar(anonimo.get(home)), n)
+        escenarios['home']['bytes'] = len(anonimo.get(home).content)
+        # Mismo listado pidiendo compresión: coste de CompresionMiddleware y bytes ahorrados
+        escenarios['home_br'] = self._medir(lambda i: comprobar(anonimo.get(home, HTTP_ACCEPT_ENCODING='br, gzip')), n)
+        escenarios['home_br']['bytes'] = len(anonimo.get(home, HTTP_ACCEPT_ENCODING='br, gzip').content)
+        escenarios['home_pagina_profunda'] = self._medir(
+            lambda i: comprobar(anonimo.get(home, {'after': codificar_cursor(max(ultimo_pk - 20, 0))})), n,
+        )
+        escenarios['home_filtrado'] = self._medir(
+            lambda i: comprobar(anonimo.get(home, {'categoria': categorias[i % len(categorias)].slug,
+                                                   'desde': 1950, 'hasta': 2000})), n,
+        )
+        # La muestra repite slugs: se borra su entrada antes de cada petición para que todas sean frías
+        cache.clear()
+        escenarios['detalle_libro_frio'] = self._medir(
+            lambda i: comprobar(anonimo.get(reverse('libros:detalle_libro', args=[muestra[i]]))), n,
+            preparar=lambda i: invalidar_detalle(muestra[i]),
+        )
+        escenarios['detalle_libro_caliente'] = self._medir(
+            lambda i: comprobar(anonimo.get(reverse('libros:detalle_libro', args=[muestra[i]]))), n,
+        )
+        escenarios['crear_libro'] = self._medir(
+            lambda i: comprobar(admin.post(reverse('libros:crear_libro'), datos_libro(i, '98')), 302), n,
+        )
+        escenarios['editar_libro'] = self._medir(
+            lambda i: comprobar(admin.post(reverse('libros:editar_libro', args=[muestra[i]]),
+                                           datos_libro(i, '99')), 302), n,
+        )
+
+        # Vaciado de la outbox generada por las escrituras, contra el Firestore en memoria
+        firestore = get_firebase_db()
+        escrituras, commits = firestore.escrituras, firestore.commits
+        lotes = self._medir_vaciado(firestore)
+        lotes['operaciones'] = firestore.escrituras - escrituras
+        lotes['commits'] = firestore.commits - commits
+        escenarios['sync_firestore_lote'] = lotes
+
+        # Listado desde Firestore sin la caché de páginas: una consulta (y su latencia) por petición
+        firebase = reverse('libros:lista_libros_firebase')
+        llamadas = firestore.llamadas
+
+        def listado_firebase(i):
+            invalidar_paginas()
+            comprobar(anonimo.get(firebase, {'after': muestra[i]} if i % 2 else {}))
+        escenarios['lista_firebase_fria'] = self._medir(listado_firebase, n)
+        escenarios['lista_firebase_fria']['llamadas_firestore'] = firestore.llamadas - llamadas
+
+        resultado = {
+            'meta': {
+                'fecha': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'motor_bd': connection.vendor,
+                'autores': options['autores'],
+                'categorias': options['categorias'],
+                'libros': options['libros'],
+                'peticiones': n,
+                'siembra_s': round(siembra, 3),
+            },
+            'escenarios': escenarios,
+        }
+        if options['servidores']:
+            rutas = {
+                'home': [home],
+                'detalle_libro': [reverse('libros:detalle_libro', args=[slug]) for slug in slugs[:100]],
+                # Firestore en memoria con la latencia de --latencia-firestore y sin caché de páginas
+                'lista_firebase': [firebase] + [f"{firebase}?after={quote(slug)}" for slug in slugs[:99]],
+            }
+            resultado['servidores'] = self._comparar_servidores(rutas, options)
+        return resultado
+
+    # --- RPS SOSTENIDAS: WSGI (gunicorn, vistas síncronas) vs ASGI (uvicorn, vistas async) ---
+
+    def _url_bd(self):
+        """DATABASE_URL con la que los servidores abren la misma BD que acaba de sembrarse."""
+        datos = connection.settings_dict
+        if connection.vendor == 'sqlite':
+            return f"sqlite:///{datos['NAME']}"
+        if connection.vendor != 'postgresql':
+            raise CommandError("--servidores sólo admite SQLite y PostgreSQL.")
+        credenciales = f"{quote(datos['USER'] or '')}:{quote(datos['PASSWORD'] or '')}@"
+        return f"postgres://{credenciales}{datos['HOST'] or 'localhost'}:{datos['PORT'] or 5432}/{datos['NAME']}"
+
+    def _comparar_servidores(self, rutas, options):
+        with socket.socket() as libre:
+            libre.bind(('127.0.0.1', 0))
+            puerto = libre.getsockname()[1]
+        entorno = {
+            **os.environ, 'DATABASE_URL': self._url_bd(),
+            'FIRESTORE_BACKEND': 'memoria', 'FIRESTORE_MEMORIA_SQL': '1', 'FIRESTORE_TTL_PAGINAS': '0',
+            'FIRESTORE_LATENCIA': str(options['latencia_firestore'] / 1000),
+        }
+        entorno.pop('DATABASE_REPLICA_URLS', None)
+        comandos = {
+            # Un worker con un hilo por petición simultánea: lo que hace falta para no encolar
+            'wsgi': ([sys.executable, '-m', 'gunicorn', 'digital_library.wsgi:application',
+                      '--bind', f"127.0.0.1:{puerto}", '--workers', '1',
+                      '--threads', str(options['concurrencia']), '--log-level', 'warning'],
+                     {'VISTAS_ASINCRONAS': '0'}),
+            # Un solo worker y un solo hilo de event loop
+            'asgi': ([sys.executable, '-m', 'uvicorn', 'digital_library.asgi:application',
+                      '--host', '127.0.0.1', '--port', str(puerto), '--workers', '1',
+                      '--log-level', 'warning', '--no-access-log'],
+                     {'VISTAS_ASINCRONAS': '1'}),
+        }
+
+        resultados = {}
+        for servidor, (comando, extra) in comandos.items():
+            proceso = subprocess.Popen(comando, env={**entorno, **extra}, cwd=settings.BASE_DIR,
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                base = f"http://127.0.0.1:{puerto}"
+                self._esperar_servidor(proceso, base)
+                resultados[servidor] = {
+                    nombre: asyncio.run(self._carga(base, caminos, options['concurrencia'], options['duracion']))
+                    for nombre, caminos in rutas.items()
+                }
+            finally:
+                proceso.terminate()
+                proceso.wait(timeout=ESPERA_ARRANQUE)
+        return resultados
+
+    @staticmethod
+    def _esperar_servidor(proceso, base):
+        import httpx
+
+        limite = time.monotonic() + ESPERA_ARRANQUE
+        while time.monotonic() < limite:
+            if proceso.poll() is not None:
+                raise CommandError(f"El servidor terminó al arrancar (código {proceso.returncode}).")
+            try:
+                httpx.get(base + '/', timeout=1)
+                return
+            except httpx.TransportError:
+                time.sleep(0.1)
+        raise CommandError(f"El servidor no respondió en {ESPERA_ARRANQUE} s.")
+
+    @staticmethod
+    async def _carga(base, caminos, concurrencia, duracion):
+        """Mantiene `concurrencia` peticiones en vuelo durante `duracion` segundos."""
+        import httpx
+
+        tiempos, errores = [], 0
+        limites = httpx.Limits(max_connections=concurrencia, max_keepalive_connections=concurrencia)
+        async with httpx.AsyncClient(base_url=base, limits=limites, timeout=30) as cliente:
+            for camino in caminos:  # calentamiento: cachés de detalle y del COUNT
+                await cliente.get(camino)
+
+            async def trabajador(indice):
+                nonlocal errores
+                i = indice
+                while time.perf_counter() < fin:
+                    inicio = time.perf_counter()
+                    try:
+                        response = await cliente.get(caminos[i % len(caminos)])
+                        correcta = response.status_code == 200
+                    except httpx.HTTPError:
+                        correcta = False
+                    if correcta:
+                        tiempos.append(time.perf_counter() - inicio)
+                    else:
+                        errores += 1
+                    i += concurrencia
+
+            inicio_carga = time.perf_counter()
+            fin = inicio_carga + duracion
+            await asyncio.gather(*(trabajador(i) for i in range(concurrencia)))
+            transcurrido = time.perf_counter() - inicio_carga
+
+        percentiles = statistics.quantiles(tiempos, n=100) if len(tiempos) > 1 else (tiempos or [0.0]) * 99
+        return {
+            'rps': round(len(tiempos) / transcurrido, 1),
+            'peticiones': len(tiempos),
+            'errores': errores,
+            'p50_ms': round(percentiles[49] * 1000, 3),
+            'p95_ms': round(percentiles[94] * 1000, 3),
+        }
@@ -0,0 +1,28 @@
+# libros/management/commands/exportar_libros.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from libros.exportacion import FORMATOS, exportar, libros_para_exportar, parsear_desde
+
+
+class Command(BaseCommand):
+    help = "Exporta el catálogo en NDJSON o CSV con memoria constante (mismo formato que /libros/exportar/)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--formato', choices=sorted(FORMATOS), default='ndjson')
+        parser.add_argument('--desde', help="Sólo libros modificados después de esta fecha (ISO 8601).")
+        parser.add_argument('--salida', help="Archivo de destino (por defecto, stdout).")
+
+    def handle(self, *args, **options):
+        try:
+            desde = parsear_desde(options['desde']) if options['desde'] else None
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        bloques = exportar(options['formato'], libros_para_exportar(desde))
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8', newline='') as salida:
+                salida.writelines(bloques)
+        else:
+            for bloque in bloques:
+                self.stdout.write(bloque, ending='')
@@ -0,0 +1,22 @@
+# libros/management/commands/generar_catalogo.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from libros.catalogo import generar_catalogo, ruta_catalogo
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera el snapshot msgpack del catálogo (libros con autores y categorías por índice) "
+        "y lo publica de forma atómica en CATALOGO['DIRECTORIO']."
+    )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        resumen = generar_catalogo()
+        self.stdout.write(self.style.SUCCESS(
+            f"Catálogo v{resumen['version']} con {resumen['libros']} libros "
+            f"({resumen['bytes'] / 1024:.1f} KiB) en {time.perf_counter() - inicio:.2f}s: {ruta_catalogo()}"
+        ))
@@ -0,0 +1,164 @@
+# libros/management/commands/import_libros.py
+
+import csv
+import json
+import sys
+import time
+from datetime import date
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from libros.facetas import recalcular_contadores
+from libros.models import Autor, Categoria, Libro, SincronizacionPendiente
+from libros.catalogo import catalogo_obsoleto
+from libros.paginacion import invalidar_conteos
+from libros.slugs import asignar_slugs
+
+
+CAMPOS_ACTUALIZABLES = ['titulo', 'fecha_publicacion', 'autor', 'categoria', 'actualizado']
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa libros desde CSV o JSONL en bloques de tamaño fijo "
+        "(upsert por ISBN con bulk_create) y los encola para Firestore."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help="Ruta del archivo o '-' para leer de stdin.")
+        parser.add_argument('--formato', choices=['csv', 'jsonl'],
+                            help="Por defecto se deduce de la extensión del archivo.")
+        parser.add_argument('--lote', type=int, default=1000,
+                            help="Filas por transacción y por bulk_create.")
+        parser.add_argument('--sync', action='store_true',
+                            help="Al terminar, vacía la outbox enviando los lotes a Firestore.")
+
+    def handle(self, *args, **options):
+        formato = options['formato'] or Path(options['archivo']).suffix.lstrip('.').lower()
+        if formato not in ('csv', 'jsonl'):
+            raise CommandError("Formato desconocido: use --formato csv|jsonl.")
+
+        # Mapas nombre -> pk: crecen con autores/categorías distintos, no con las filas
+        self.autores = {}
+        self.categorias = {}
+        self.sync_habilitado = settings.FIREBASE_CONFIG.get('SYNC_ENABLED', False)
+
+        if options['archivo'] == '-':
+            total, errores, duracion = self._importar(sys.stdin, formato, options['lote'])
+        else:
+            with open(options['archivo'], encoding='utf-8', newline='') as archivo:
+                total, errores, duracion = self._importar(archivo, formato, options['lote'])
+        # bulk_create no pasa por Libro.save(): los contadores de las facetas se recalculan
+        # (una actualización puede mover libros a autores que no aparecen en el archivo)
+        recalcular_contadores()
+        invalidar_conteos()
+        # El proceso sale enseguida: sin temporizador, se regenera aquí mismo
+        catalogo_obsoleto(inmediato=True)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Importadas {total} filas en {duracion:.2f}s "
+            f"({total / duracion if duracion else 0:.0f} filas/s), {errores} con errores."
+        ))
+
+        if options['sync']:
+            from django.core.management import call_command
+            call_command('sync_firestore', una_vez=True, stdout=self.stdout)
+
+    def _importar(self, archivo, formato, tamano_lote):
+        filas = csv.DictReader(archivo) if formato == 'csv' else (
+            json.loads(linea) for linea in archivo if linea.strip()
+        )
+        inicio = time.perf_counter()
+        total = errores = 0
+        while True:
+            bloque = list(islice(filas, tamano_lote))
+            if not bloque:
+                break
+            importadas, invalidas = self._importar_bloque(bloque)
+            total += importadas
+            errores += invalidas
+            duracion = time.perf_counter() - inicio
+            self.stdout.write(f"  {total} filas ({total / duracion if duracion else 0:.0f} filas/s)")
+        return total, errores, time.perf_counter() - inicio
+
+    def _importar_bloque(self, bloque):
+        # 1. Normalizar y validar; si un ISBN se repite en el bloque gana la última fila
+        validas = {}
+        errores = 0
+        for fila in bloque:
+            try:
+                isbn = fila['isbn'].strip()
+                validas[isbn] = {
+                    'titulo': fila['titulo'].strip(),
+                    'isbn': isbn,
+                    'fecha_publicacion': date.fromisoformat(fila['fecha_publicacion'].strip()),
+                    'autor': fila['autor'].strip(),
+                    'categoria': (fila.get('categoria') or '').strip(),
+                }
+            except (KeyError, AttributeError, ValueError):
+                errores += 1
+                continue
+            if not (isbn and validas[isbn]['titulo'] and validas[isbn]['autor']):
+                del validas[isbn]
+                errores += 1
+        if not validas:
+            return 0, errores
+
+        with transaction.atomic():
+            self._resolver(Autor, self.autores, {f['autor'] for f in validas.values()})
+            self._resolver(Categoria, self.categorias,
+                           {f['categoria'] for f in validas.values() if f['categoria']})
+
+            # 2. Los libros existentes conservan su slug; los nuevos lo reciben en bloque
+            slugs = dict(
+                Libro.objects.filter(isbn__in=validas).values_list('isbn', 'slug')
+            )
+            nuevos = [isbn for isbn in validas if isbn not in slugs]
+            slugs.update(zip(nuevos, asignar_slugs(Libro, [validas[isbn]['titulo'] for isbn in nuevos])))
+
+            libros = []
+            for isbn, fila in validas.items():
+                libros.append(Libro(
+                    titulo=fila['titulo'],
+                    isbn=isbn,
+                    fecha_publicacion=fila['fecha_publicacion'],
+                    autor_id=self.autores[fila['autor']],
+                    categoria_id=self.categorias.get(fila['categoria']),
+                    slug=slugs[isbn],
+                ))
+
+            # 3. Upsert por ISBN: un único INSERT ... ON CONFLICT por bloque
+            Libro.objects.bulk_create(
+                libros,
+                update_conflicts=True,
+                unique_fields=['isbn'],
+                update_fields=CAMPOS_ACTUALIZABLES,
+            )
+
+            # 4. Encolar la sincronización (bulk_create no pasa por Libro.save())
+            if self.sync_habilitado:
+                pks = Libro.objects.filter(isbn__in=validas).values_list('pk', flat=True)
+                SincronizacionPendiente.encolar(list(pks), SincronizacionPendiente.GUARDAR)
+
+        return len(libros), errores
+
+    def _resolver(self, modelo, mapa, nombres):
+        """Completa `mapa` (nombre -> pk) buscando o creando en bloque los nombres que falten."""
+        faltantes = nombres - mapa.keys()
+        if not faltantes:
+            return
+        for pk, nombre in modelo.objects.filter(nombre__in=faltantes).values_list('pk', 'nombre'):
+            mapa.setdefault(nombre, pk)
+        faltantes -= mapa.keys()
+        if faltantes:
+            faltantes = sorted(faltantes)
+            creados = modelo.objects.bulk_create([
+                modelo(nombre=nombre, slug=slug)
+                for nombre, slug in zip(faltantes, asignar_slugs(modelo, faltantes))
+            ])
+            for objeto in creados:
+                mapa[objeto.nombre] = objeto.pk
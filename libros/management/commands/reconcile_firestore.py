@@ -0,0 +1,52 @@
+# libros/management/commands/reconcile_firestore.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from digital_library.firebase_config import get_firebase_db
+from libros.services.reconciliacion import reconciliar
+from libros.services.sincronizacion import LIMITE_LOTE_FIRESTORE
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara la colección 'libros' de Firestore con SQL por hash de contenido, reescribe "
+        "los documentos distintos y borra los huérfanos. Incremental desde la última marca."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--completo', action='store_true',
+                            help="Revisa todo el catálogo (y los huérfanos), no sólo lo cambiado desde la marca.")
+        parser.add_argument('--huerfanos', action='store_true',
+                            help="Busca documentos huérfanos también en una pasada incremental.")
+        parser.add_argument('--lote', type=int, default=LIMITE_LOTE_FIRESTORE,
+                            help="Libros por página y operaciones por WriteBatch (máximo 500).")
+        parser.add_argument('--simulacro', action='store_true',
+                            help="Sólo informa de las diferencias: no escribe ni mueve la marca.")
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        paginas = 0
+
+        def progreso(resumen):
+            nonlocal paginas
+            paginas += 1
+            if options['verbosity'] > 1 or paginas % 20 == 0:
+                self.stdout.write(f"  revisados={resumen['revisados']} reescritos={resumen['reescritos']}")
+
+        resumen = reconciliar(
+            get_firebase_db(),
+            completo=options['completo'],
+            huerfanos=True if options['huerfanos'] else None,
+            tamano=options['lote'],
+            simulacro=options['simulacro'],
+            progreso=progreso,
+        )
+        modo = 'completa' if resumen['completo'] else 'incremental'
+        accion = "Diferencias encontradas" if options['simulacro'] else "Reconciliación"
+        self.stdout.write(self.style.SUCCESS(
+            f"{accion} ({modo}) en {time.perf_counter() - inicio:.2f}s: "
+            f"revisados={resumen['revisados']} reescritos={resumen['reescritos']} "
+            f"eliminados={resumen['eliminados']} commits={resumen['commits']}"
+        ))
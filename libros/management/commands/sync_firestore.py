@@ -0,0 +1,52 @@
+# libros/management/commands/sync_firestore.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from digital_library.firebase_config import get_firebase_db
+from libros.services.sincronizacion import (
+    LIMITE_LOTE_FIRESTORE, estado_cola, procesar_pendientes, procesar_propagaciones,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Vacía la outbox de sincronización enviando los cambios a Firestore por lotes y "
+        "propaga a los documentos de sus libros los renombrados de autores y categorías."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=LIMITE_LOTE_FIRESTORE,
+                            help="Operaciones por WriteBatch (máximo 500).")
+        parser.add_argument('--intervalo', type=float, default=2.0,
+                            help="Segundos de espera cuando la cola está vacía.")
+        parser.add_argument('--una-vez', action='store_true',
+                            help="Vacía la cola una vez y termina (útil en cron).")
+
+    def handle(self, *args, **options):
+        db = get_firebase_db()
+        while True:
+            inicio = time.perf_counter()
+            enviadas = propagadas = 0
+            while True:
+                # Primero la outbox (crea los documentos); después una página de propagación
+                procesadas = procesar_pendientes(db, options['lote'])
+                actualizados = procesar_propagaciones(db, options['lote'])
+                if not procesadas and actualizados is None:
+                    break
+                enviadas += procesadas
+                propagadas += actualizados or 0
+
+            estado = estado_cola()
+            if enviadas or propagadas or estado['pendientes'] or estado['propagaciones']:
+                duracion = time.perf_counter() - inicio
+                self.stdout.write(
+                    f"Enviadas {enviadas} operaciones y {propagadas} renombrados en {duracion:.2f}s "
+                    f"({(enviadas + propagadas) / duracion if duracion else 0:.0f} ops/s) | "
+                    f"pendientes={estado['pendientes']} con_errores={estado['con_errores']} "
+                    f"retraso={estado['retraso']:.1f}s propagaciones={estado['propagaciones']}"
+                )
+            if options['una_vez']:
+                return
+            time.sleep(options['intervalo'])
@@ -0,0 +1,26 @@
+# libros/metricas.py
+
+from .cache import estadisticas_detalle
+
+
+def metricas_libros():
+    """Gauges de libros para /metrics: cachés de detalle y de Firestore, y estado de la outbox."""
+    from .services.firebase_db import estadisticas_libros
+    from .services.sincronizacion import estado_cola
+
+    detalle = estadisticas_detalle()
+    firestore = estadisticas_libros()
+    cola = estado_cola()
+    return [
+        ('libros_detalle_cache_aciertos', "Aciertos acumulados de la caché de detalle_libro.", (), detalle['aciertos']),
+        ('libros_detalle_cache_fallos', "Fallos acumulados de la caché de detalle_libro.", (), detalle['fallos']),
+        ('libros_firestore_cache_aciertos', "Documentos de Firestore servidos desde la caché del proceso.",
+         (), firestore['aciertos']),
+        ('libros_firestore_cache_fallos', "Documentos pedidos a Firestore por no estar en caché.",
+         (), firestore['fallos']),
+        ('libros_outbox_pendientes', "Filas pendientes de enviar a Firestore.", (), cola['pendientes']),
+        ('libros_outbox_con_errores', "Filas de la outbox con al menos un fallo.", (), cola['con_errores']),
+        ('libros_outbox_retraso_segundos', "Antigüedad de la fila pendiente más vieja.", (), cola['retraso']),
+        ('libros_propagaciones_pendientes', "Renombrados de autor/categoría pendientes de copiar a Firestore.",
+         (), cola['propagaciones']),
+    ]
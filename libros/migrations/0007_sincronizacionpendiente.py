@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libros', '0006_auto_20251127_1847'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SincronizacionPendiente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('libro_pk', models.BigIntegerField(unique=True)),
+                ('operacion', models.CharField(choices=[('guardar', 'Guardar'), ('eliminar', 'Eliminar')], default='guardar', max_length=10)),
+                ('creado', models.DateTimeField(default=django.utils.timezone.now)),
+                ('actualizado', models.DateTimeField(default=django.utils.timezone.now)),
+                ('intentos', models.PositiveIntegerField(default=0)),
+                ('siguiente_intento', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('ultimo_error', models.TextField(blank=True)),
+            ],
+            options={
+                'verbose_name': 'Sincronización pendiente',
+                'verbose_name_plural': 'Sincronizaciones pendientes',
+            },
+        ),
+    ]
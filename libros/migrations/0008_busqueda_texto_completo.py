@@ -0,0 +1,115 @@
+# Índice de texto completo para títulos, autores e ISBN.
+# SQLite: tabla virtual FTS5 (rowid = id del libro). PostgreSQL: tabla con tsvector + GIN.
+# En ambos casos los triggers la mantienen al día, incluso con bulk_create/update().
+
+from django.db import migrations
+
+from ._busqueda_sql import SQLITE_ELIMINAR_TRIGGERS, SQLITE_TRIGGERS
+
+
+SQLITE_CREAR = [
+    """
+    CREATE VIRTUAL TABLE libros_busqueda USING fts5(
+        titulo, autor, isbn,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    *SQLITE_TRIGGERS,
+    """
+    INSERT INTO libros_busqueda(rowid, titulo, autor, isbn)
+    SELECT l.id, l.titulo, a.nombre, l.isbn
+    FROM libros_libro l JOIN libros_autor a ON a.id = l.autor_id
+    """,
+]
+
+SQLITE_ELIMINAR = [
+    *SQLITE_ELIMINAR_TRIGGERS,
+    "DROP TABLE IF EXISTS libros_busqueda",
+]
+
+POSTGRES_CREAR = [
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    """
+    CREATE TABLE libros_busqueda (
+        libro_id bigint PRIMARY KEY REFERENCES libros_libro(id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+        documento tsvector NOT NULL
+    )
+    """,
+    "CREATE INDEX libros_busqueda_documento_gin ON libros_busqueda USING GIN (documento)",
+    """
+    CREATE FUNCTION libros_busqueda_documento(titulo text, autor text, isbn text) RETURNS tsvector AS $$
+        SELECT setweight(to_tsvector('simple', unaccent(coalesce(titulo, ''))), 'A')
+            || setweight(to_tsvector('simple', unaccent(coalesce(autor, ''))), 'B')
+            || setweight(to_tsvector('simple', coalesce(isbn, '')), 'C')
+    $$ LANGUAGE sql STABLE
+    """,
+    """
+    CREATE FUNCTION libros_busqueda_libro() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO libros_busqueda(libro_id, documento)
+        VALUES (NEW.id, libros_busqueda_documento(
+            NEW.titulo, (SELECT nombre FROM libros_autor WHERE id = NEW.autor_id), NEW.isbn))
+        ON CONFLICT (libro_id) DO UPDATE SET documento = EXCLUDED.documento;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER libros_busqueda_libro AFTER INSERT OR UPDATE OF titulo, isbn, autor_id
+    ON libros_libro FOR EACH ROW EXECUTE FUNCTION libros_busqueda_libro()
+    """,
+    """
+    CREATE FUNCTION libros_busqueda_autor() RETURNS trigger AS $$
+    BEGIN
+        UPDATE libros_busqueda b
+        SET documento = libros_busqueda_documento(l.titulo, NEW.nombre, l.isbn)
+        FROM libros_libro l
+        WHERE l.autor_id = NEW.id AND b.libro_id = l.id;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER libros_busqueda_autor AFTER UPDATE OF nombre ON libros_autor
+    FOR EACH ROW WHEN (OLD.nombre IS DISTINCT FROM NEW.nombre)
+    EXECUTE FUNCTION libros_busqueda_autor()
+    """,
+    """
+    INSERT INTO libros_busqueda(libro_id, documento)
+    SELECT l.id, libros_busqueda_documento(l.titulo, a.nombre, l.isbn)
+    FROM libros_libro l JOIN libros_autor a ON a.id = l.autor_id
+    """,
+]
+
+POSTGRES_ELIMINAR = [
+    "DROP TRIGGER IF EXISTS libros_busqueda_autor ON libros_autor",
+    "DROP TRIGGER IF EXISTS libros_busqueda_libro ON libros_libro",
+    "DROP FUNCTION IF EXISTS libros_busqueda_autor()",
+    "DROP FUNCTION IF EXISTS libros_busqueda_libro()",
+    "DROP TABLE IF EXISTS libros_busqueda",
+    "DROP FUNCTION IF EXISTS libros_busqueda_documento(text, text, text)",
+]
+
+
+def _ejecutar(schema_editor, sentencias_por_motor):
+    for sentencia in sentencias_por_motor.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sentencia)
+
+
+def crear_indice(apps, schema_editor):
+    _ejecutar(schema_editor, {'sqlite': SQLITE_CREAR, 'postgresql': POSTGRES_CREAR})
+
+
+def eliminar_indice(apps, schema_editor):
+    _ejecutar(schema_editor, {'sqlite': SQLITE_ELIMINAR, 'postgresql': POSTGRES_ELIMINAR})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libros', '0007_sincronizacionpendiente'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, eliminar_indice),
+    ]
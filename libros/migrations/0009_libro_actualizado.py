@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:47
+
+from django.db import migrations, models
+
+from ._busqueda_sql import crear_triggers, eliminar_triggers
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libros', '0008_busqueda_texto_completo'),
+    ]
+
+    operations = [
+        # SQLite rehace libros_libro: los triggers de búsqueda se quitan y se vuelven a crear
+        migrations.RunPython(eliminar_triggers, crear_triggers),
+        migrations.AddField(
+            model_name='libro',
+            name='actualizado',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.RunPython(crear_triggers, eliminar_triggers),
+    ]
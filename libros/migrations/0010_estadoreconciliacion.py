@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libros', '0009_libro_actualizado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadoReconciliacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=50, unique=True)),
+                ('marca', models.DateTimeField(blank=True, null=True)),
+                ('ultima_completa', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Estado de reconciliación',
+                'verbose_name_plural': 'Estados de reconciliación',
+            },
+        ),
+    ]
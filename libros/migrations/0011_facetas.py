@@ -0,0 +1,53 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:05
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from ._busqueda_sql import crear_triggers, eliminar_triggers
+
+
+def calcular_contadores(apps, schema_editor):
+    Libro = apps.get_model('libros', 'Libro')
+    for modelo, campo in (('Autor', 'autor'), ('Categoria', 'categoria')):
+        conteo = (
+            Libro.objects.filter(**{campo: OuterRef('pk')}).order_by()
+            .values(campo).annotate(n=Count('pk')).values('n')
+        )
+        apps.get_model('libros', modelo).objects.update(num_libros=Coalesce(Subquery(conteo), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libros', '0010_estadoreconciliacion'),
+    ]
+
+    operations = [
+        # SQLite rehace libros_autor (y los triggers de búsqueda dependen de ella)
+        migrations.RunPython(eliminar_triggers, crear_triggers),
+        migrations.AddField(
+            model_name='autor',
+            name='num_libros',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='categoria',
+            name='num_libros',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='libro',
+            index=models.Index(fields=['categoria', 'fecha_publicacion'], name='libro_categoria_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='libro',
+            index=models.Index(fields=['autor', 'fecha_publicacion'], name='libro_autor_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='libro',
+            index=models.Index(fields=['fecha_publicacion'], name='libro_fecha_idx'),
+        ),
+        migrations.RunPython(crear_triggers, eliminar_triggers),
+        migrations.RunPython(calcular_contadores, migrations.RunPython.noop),
+    ]
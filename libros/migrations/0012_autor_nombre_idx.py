@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libros', '0011_facetas'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='autor',
+            index=models.Index(fields=['nombre'], name='autor_nombre_idx'),
+        ),
+    ]
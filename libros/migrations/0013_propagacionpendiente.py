@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:24
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libros', '0012_autor_nombre_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PropagacionPendiente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('campo', models.CharField(choices=[('autor', 'Autor'), ('categoria', 'Categoría')], max_length=10)),
+                ('objeto_pk', models.BigIntegerField()),
+                ('ultimo_libro_pk', models.BigIntegerField(default=0)),
+                ('creado', models.DateTimeField(default=django.utils.timezone.now)),
+                ('actualizado', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Propagación pendiente',
+                'verbose_name_plural': 'Propagaciones pendientes',
+                'constraints': [models.UniqueConstraint(fields=('campo', 'objeto_pk'), name='propagacion_unica')],
+            },
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Triggers del índice de texto completo en SQLite (ver 0008_busqueda_texto_completo).
+#
+# En SQLite, AddField/AlterField rehacen la tabla (CREATE nueva, copiar, DROP, RENAME):
+# los triggers de libros_libro se pierden y el de libros_autor impide el RENAME.
+# Toda migración que rehaga libros_libro o libros_autor debe ir entre
+# RunPython(eliminar_triggers, crear_triggers) y RunPython(crear_triggers, eliminar_triggers).
+# (Este módulo empieza por "_", así que el cargador de migraciones lo ignora.)
+
+SQLITE_TRIGGERS = [
+    """
+    CREATE TRIGGER libros_busqueda_libro_ai AFTER INSERT ON libros_libro BEGIN
+        INSERT INTO libros_busqueda(rowid, titulo, autor, isbn)
+        VALUES (new.id, new.titulo,
+                (SELECT nombre FROM libros_autor WHERE id = new.autor_id), new.isbn);
+    END
+    """,
+    """
+    CREATE TRIGGER libros_busqueda_libro_au AFTER UPDATE OF titulo, isbn, autor_id ON libros_libro BEGIN
+        DELETE FROM libros_busqueda WHERE rowid = old.id;
+        INSERT INTO libros_busqueda(rowid, titulo, autor, isbn)
+        VALUES (new.id, new.titulo,
+                (SELECT nombre FROM libros_autor WHERE id = new.autor_id), new.isbn);
+    END
+    """,
+    """
+    CREATE TRIGGER libros_busqueda_libro_ad AFTER DELETE ON libros_libro BEGIN
+        DELETE FROM libros_busqueda WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER libros_busqueda_autor_au AFTER UPDATE OF nombre ON libros_autor BEGIN
+        UPDATE libros_busqueda SET autor = new.nombre
+        WHERE rowid IN (SELECT id FROM libros_libro WHERE autor_id = new.id);
+    END
+    """,
+]
+
+SQLITE_ELIMINAR_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS libros_busqueda_autor_au",
+    "DROP TRIGGER IF EXISTS libros_busqueda_libro_ad",
+    "DROP TRIGGER IF EXISTS libros_busqueda_libro_au",
+    "DROP TRIGGER IF EXISTS libros_busqueda_libro_ai",
+]
+
+
+def crear_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for sentencia in SQLITE_TRIGGERS:
+            schema_editor.execute(sentencia)
+
+
+def eliminar_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for sentencia in SQLITE_ELIMINAR_TRIGGERS:
+            schema_editor.execute(sentencia)
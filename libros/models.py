@@ -1,9 +1,38 @@
-from django.db import models
+import hashlib
+import json
+from functools import partial
+
+from django.db import models, transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
 from django.urls import reverse 
-from django.utils.text import slugify 
+from django.utils import timezone
 from django.conf import settings
-# 🟢 IMPORTACIÓN NECESARIA PARA FIREBASE/FIRESTORE 🟢
-from firebase_admin import firestore 
+
+from .cache import invalidar_autor, invalidar_categoria, invalidar_detalle
+from .catalogo import catalogo_obsoleto
+from .paginacion import invalidar_conteos
+from .slugs import guardar_con_slug_unico
+
+
+def al_confirmar(instancia, funcion, *args):
+    """Ejecuta funcion(*args) cuando se confirme la transacción de `instancia` (en autocommit, ya).
+
+    Las invalidaciones de caché van aquí: si se hicieran antes del COMMIT, una lectura
+    concurrente volvería a cachear la fila antigua (en WAL los lectores no esperan).
+    """
+    transaction.on_commit(partial(funcion, *args), using=instancia._state.db)
+
+
+def ajustar_contador(modelo, pk, delta):
+    """Suma `delta` a num_libros de un autor o categoría con un UPDATE atómico (F()).
+
+    Nunca baja de 0: si el contador se desvió (p. ej. tras un bulk_create sin
+    recalcular_contadores), se corrige en la siguiente importación, no aquí.
+    """
+    if pk is not None:
+        modelo.objects.filter(pk=pk).update(num_libros=Greatest(F('num_libros') + delta, 0))
+
 
 # --- 1. MODELO AUTOR (Slug y lógica de generación añadidos) ---
 class Autor(models.Model):
@@ -12,30 +41,89 @@ class Autor(models.Model):
     fecha_nacimiento = models.DateField(null=True, blank=True)
     # 🚨 CORRECCIÓN: Agregar el campo slug
     slug = models.SlugField(max_length=100, unique=True, blank=True) 
+    # 📊 Faceta de home: número de libros, mantenido por Libro.save()/delete()
+    num_libros = models.PositiveIntegerField(default=0, db_index=True, editable=False)
 
     def save(self, *args, **kwargs):
-        # 🚨 CORRECCIÓN: Generar el slug antes de guardar si no existe
-        if not self.slug:
-            self.slug = slugify(self.nombre)
-        super().save(*args, **kwargs)
+        # 🚨 CORRECCIÓN: Generar el slug antes de guardar si no existe (único: -2, -3, …)
+        guardar_con_slug_unico(self, self.nombre, lambda: super(Autor, self).save(*args, **kwargs))
+        # Las páginas de detalle de sus libros muestran el nombre
+        al_confirmar(self, invalidar_autor, self.pk)
+        # Un cambio de nombre cambia lo que se exporta de sus libros
+        if getattr(self, '_nombre_original', self.nombre) != self.nombre:
+            self.libros.update(actualizado=timezone.now())
+            # Y el nombre copiado en sus documentos de Firestore: lo reescribe sync_firestore
+            PropagacionPendiente.encolar(PropagacionPendiente.AUTOR, self.pk)
+            # Las facetas cacheadas (con el nombre) van con la versión de los conteos
+            al_confirmar(self, invalidar_conteos)
+            catalogo_obsoleto()
+        self._nombre_original = self.nombre
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        instancia._nombre_original = instancia.__dict__.get('nombre')
+        return instancia
+
+    def delete(self, *args, **kwargs):
+        pk = self.pk
+        # El borrado en cascada de sus libros no pasa por Libro.delete(): se descuentan aquí
+        por_categoria = (
+            self.libros.exclude(categoria=None).order_by()
+            .values('categoria').annotate(n=Count('pk')).values_list('categoria', 'n')
+        )
+        for categoria_id, n in por_categoria:
+            ajustar_contador(Categoria, categoria_id, -n)
+        resultado = super().delete(*args, **kwargs)
+        al_confirmar(self, invalidar_autor, pk)
+        al_confirmar(self, invalidar_conteos)
+        catalogo_obsoleto()
+        return resultado
 
     def __str__(self):
         return self.nombre
     
     class Meta:
         verbose_name_plural = "Autores"
+        indexes = [
+            # Admin: listado y autocompletado de autores ordenados por nombre
+            models.Index(fields=['nombre'], name='autor_nombre_idx'),
+        ]
 
 # --- 2. MODELO CATEGORIA (Slug y lógica de generación añadidos) ---
 class Categoria(models.Model):
     nombre = models.CharField(max_length=50, unique=True)
     # 🚨 CORRECCIÓN: Agregar el campo slug
     slug = models.SlugField(max_length=50, unique=True, blank=True)
+    # 📊 Faceta de home: número de libros, mantenido por Libro.save()/delete()
+    num_libros = models.PositiveIntegerField(default=0, editable=False)
 
     def save(self, *args, **kwargs):
-        # 🚨 CORRECCIÓN: Generar el slug antes de guardar si no existe
-        if not self.slug:
-            self.slug = slugify(self.nombre)
-        super().save(*args, **kwargs)
+        # 🚨 CORRECCIÓN: Generar el slug antes de guardar si no existe (único: -2, -3, …)
+        guardar_con_slug_unico(self, self.nombre, lambda: super(Categoria, self).save(*args, **kwargs))
+        al_confirmar(self, invalidar_categoria, self.pk)
+        if getattr(self, '_nombre_original', self.nombre) != self.nombre:
+            self.libros.update(actualizado=timezone.now())
+            PropagacionPendiente.encolar(PropagacionPendiente.CATEGORIA, self.pk)
+            al_confirmar(self, invalidar_conteos)
+            catalogo_obsoleto()
+        self._nombre_original = self.nombre
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        instancia._nombre_original = instancia.__dict__.get('nombre')
+        return instancia
+
+    def delete(self, *args, **kwargs):
+        pk = self.pk
+        # SET_NULL no pasa por Libro.save(): se marca a mano que sus libros cambiaron
+        self.libros.update(actualizado=timezone.now())
+        resultado = super().delete(*args, **kwargs)
+        al_confirmar(self, invalidar_categoria, pk)
+        al_confirmar(self, invalidar_conteos)
+        catalogo_obsoleto()
+        return resultado
 
     def __str__(self):
         return self.nombre
@@ -56,6 +144,8 @@ class Libro(models.Model):
     # 🚨 CORRECCIÓN: El slug del libro DEBE ser único si se usa para URL detalladas.
     # También permitimos blank=True para que se autogenere.
     slug = models.SlugField(max_length=200, unique=True, blank=True) 
+    # Última modificación (también cuando cambia el nombre de su autor o categoría)
+    actualizado = models.DateTimeField(auto_now=True, db_index=True)
 
     def get_absolute_url(self):
         # Asegúrate de que esta URL exista en tu urls.py
@@ -63,43 +153,186 @@ class Libro(models.Model):
 
     def __str__(self):
         return self.titulo
+
+    class Meta:
+        indexes = [
+            # 📊 Facetas de home: filtro por categoría/autor + rango de años, ordenado por fecha
+            models.Index(fields=['categoria', 'fecha_publicacion'], name='libro_categoria_fecha_idx'),
+            models.Index(fields=['autor', 'fecha_publicacion'], name='libro_autor_fecha_idx'),
+            models.Index(fields=['fecha_publicacion'], name='libro_fecha_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Slug con el que se leyó: si se edita, hay que invalidar también la página antigua
+        instancia._slug_original = instancia.__dict__.get('slug')
+        # Autor y categoría con los que se leyó: para mover los contadores si cambian
+        instancia._autor_id_original = instancia.__dict__.get('autor_id')
+        instancia._categoria_id_original = instancia.__dict__.get('categoria_id')
+        return instancia
+
+    def _mover_contadores(self, es_nuevo):
+        """Ajusta num_libros de autor y categoría; devuelve True si cambió alguno."""
+        cambiado = False
+        for modelo, campo in ((Autor, 'autor_id'), (Categoria, 'categoria_id')):
+            actual = getattr(self, campo)
+            anterior = None if es_nuevo else getattr(self, f'_{campo}_original', actual)
+            if anterior != actual:
+                ajustar_contador(modelo, anterior, -1)
+                ajustar_contador(modelo, actual, 1)
+                cambiado = True
+            setattr(self, f'_{campo}_original', actual)
+        return cambiado
     
     def save(self, *args, **kwargs):
-        # 1. Generación del slug (asegurando unicidad y autogeneración)
-        if not self.slug:
-            self.slug = slugify(self.titulo)
-        
-        # 2. Guardar el objeto Django primero
-        super().save(*args, **kwargs)
+        # 1 y 2. Generación del slug único (una consulta de prefijo) y guardado en Django;
+        # si otro proceso ocupa el mismo slug a la vez, se reintenta con el siguiente sufijo
+        es_nuevo = self._state.adding
+        guardar_con_slug_unico(self, self.titulo, lambda: super(Libro, self).save(*args, **kwargs))
+        if self._mover_contadores(es_nuevo):
+            # Cambian el total o las facetas
+            al_confirmar(self, invalidar_conteos)
+        al_confirmar(self, invalidar_detalle, self.slug, getattr(self, '_slug_original', None))
+        self._slug_original = self.slug
+        catalogo_obsoleto()
         
-        # 3. Sincronización con Firestore
+        # 3. Sincronización con Firestore: se encola en la outbox y el worker
+        # `manage.py sync_firestore` la envía por lotes (sin RPC en la petición).
         if settings.FIREBASE_CONFIG.get('SYNC_ENABLED', False):
-            try:
-                db = firestore.client()
-                doc_ref = db.collection('libros').document(str(self.pk))
-                
-                data = {
-                    'titulo': self.titulo,
-                    'autor': self.autor.nombre,
-                    'categoria': self.categoria.nombre if self.categoria else None,
-                    'fecha_publicacion': self.fecha_publicacion.isoformat(),
-                    'slug': self.slug,
-                }
-                doc_ref.set(data)
-                
-            except Exception:
-                # 🚨 CORRECCIÓN: Silenciar el print para evitar warnings en tests
-                pass 
-                
+            SincronizacionPendiente.encolar([self.pk], SincronizacionPendiente.GUARDAR)
+
     def delete(self, *args, **kwargs):
-        # Lógica de eliminación de Firestore
-        if self.pk and settings.FIREBASE_CONFIG.get('SYNC_ENABLED', False):
-            try:
-                db = firestore.client()
-                doc_ref = db.collection('libros').document(str(self.pk))
-                doc_ref.delete()
-            except Exception:
-                # 🚨 CORRECCIÓN: Silenciar el print para evitar warnings en tests
-                pass
-                
-        super().delete(*args, **kwargs)
\ No newline at end of file
+        # La eliminación en Firestore también pasa por la outbox
+        pk = self.pk
+        super().delete(*args, **kwargs)
+        ajustar_contador(Autor, getattr(self, '_autor_id_original', self.autor_id), -1)
+        ajustar_contador(Categoria, getattr(self, '_categoria_id_original', self.categoria_id), -1)
+        al_confirmar(self, invalidar_conteos)
+        al_confirmar(self, invalidar_detalle, self.slug, getattr(self, '_slug_original', None))
+        catalogo_obsoleto()
+        if pk and settings.FIREBASE_CONFIG.get('SYNC_ENABLED', False):
+            SincronizacionPendiente.encolar([pk], SincronizacionPendiente.ELIMINAR)
+
+    def datos_firestore(self):
+        """Documento que se escribe en la colección 'libros' de Firestore."""
+        datos = {
+            'titulo': self.titulo,
+            'autor': self.autor.nombre,
+            'categoria': self.categoria.nombre if self.categoria else None,
+            'fecha_publicacion': self.fecha_publicacion.isoformat(),
+            'slug': self.slug,
+        }
+        # Huella del contenido: reconcile_firestore compara sólo este campo
+        datos['hash'] = hash_documento(datos)
+        return datos
+
+
+def hash_documento(datos):
+    """Hash estable (independiente del orden de las claves) del contenido de un documento."""
+    canonico = json.dumps(datos, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(canonico.encode()).hexdigest()[:32]
+
+
+# --- 4. OUTBOX DE SINCRONIZACIÓN CON FIRESTORE ---
+class SincronizacionPendiente(models.Model):
+    """Escritura pendiente hacia Firestore (una fila por libro, las repetidas se fusionan)."""
+    GUARDAR = 'guardar'
+    ELIMINAR = 'eliminar'
+    OPERACIONES = [
+        (GUARDAR, 'Guardar'),
+        (ELIMINAR, 'Eliminar'),
+    ]
+
+    # No es ForeignKey: la fila debe sobrevivir al borrado del libro
+    libro_pk = models.BigIntegerField(unique=True)
+    operacion = models.CharField(max_length=10, choices=OPERACIONES, default=GUARDAR)
+    creado = models.DateTimeField(default=timezone.now)
+    # Marca de versión: el worker sólo borra la fila si no cambió mientras se enviaba
+    actualizado = models.DateTimeField(default=timezone.now)
+    intentos = models.PositiveIntegerField(default=0)
+    siguiente_intento = models.DateTimeField(default=timezone.now, db_index=True)
+    ultimo_error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"{self.operacion} libro {self.libro_pk}"
+
+    class Meta:
+        verbose_name = "Sincronización pendiente"
+        verbose_name_plural = "Sincronizaciones pendientes"
+
+    @classmethod
+    def encolar(cls, pks, operacion):
+        """Encola (o fusiona) la operación para cada pk con un único INSERT ... ON CONFLICT."""
+        ahora = timezone.now()
+        filas = [
+            cls(libro_pk=pk, operacion=operacion, creado=ahora, actualizado=ahora, siguiente_intento=ahora)
+            for pk in pks
+        ]
+        cls.objects.bulk_create(
+            filas,
+            update_conflicts=True,
+            unique_fields=['libro_pk'],
+            update_fields=['operacion', 'actualizado', 'intentos', 'siguiente_intento', 'ultimo_error'],
+        )
+
+
+# --- 5. PROPAGACIÓN DE RENOMBRADOS A FIRESTORE ---
+class PropagacionPendiente(models.Model):
+    """Autor o categoría renombrados cuyo nombre falta copiar a los documentos de sus libros.
+
+    Una fila por objeto (los renombrados repetidos se fusionan y vuelven a empezar).
+    sync_firestore la recorre por páginas de libros; `ultimo_libro_pk` es el cursor.
+    """
+    AUTOR = 'autor'
+    CATEGORIA = 'categoria'
+    CAMPOS = [
+        (AUTOR, 'Autor'),
+        (CATEGORIA, 'Categoría'),
+    ]
+
+    campo = models.CharField(max_length=10, choices=CAMPOS)
+    objeto_pk = models.BigIntegerField()
+    ultimo_libro_pk = models.BigIntegerField(default=0)
+    creado = models.DateTimeField(default=timezone.now)
+    # Marca de versión: el worker sólo avanza el cursor si nadie volvió a encolar la fila
+    actualizado = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.campo} {self.objeto_pk} (desde libro {self.ultimo_libro_pk})"
+
+    class Meta:
+        verbose_name = "Propagación pendiente"
+        verbose_name_plural = "Propagaciones pendientes"
+        constraints = [
+            models.UniqueConstraint(fields=['campo', 'objeto_pk'], name='propagacion_unica'),
+        ]
+
+    @classmethod
+    def encolar(cls, campo, pk):
+        """Encola la propagación (un INSERT ... ON CONFLICT); no hace nada sin sincronización."""
+        if not settings.FIREBASE_CONFIG.get('SYNC_ENABLED', False):
+            return
+        ahora = timezone.now()
+        cls.objects.bulk_create(
+            [cls(campo=campo, objeto_pk=pk, ultimo_libro_pk=0, creado=ahora, actualizado=ahora)],
+            update_conflicts=True,
+            unique_fields=['campo', 'objeto_pk'],
+            update_fields=['ultimo_libro_pk', 'actualizado'],
+        )
+
+
+# --- 6. ESTADO DE LA RECONCILIACIÓN CON FIRESTORE ---
+class EstadoReconciliacion(models.Model):
+    """Marca de agua de reconcile_firestore: hasta dónde se ha comparado SQL con Firestore."""
+    nombre = models.CharField(max_length=50, unique=True)
+    # Los libros con `actualizado` anterior a la marca ya se compararon
+    marca = models.DateTimeField(null=True, blank=True)
+    ultima_completa = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.nombre} (marca {self.marca})"
+
+    class Meta:
+        verbose_name = "Estado de reconciliación"
+        verbose_name_plural = "Estados de reconciliación"
@@ -0,0 +1,147 @@
+# libros/paginacion.py
+
+import base64
+import hashlib
+
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from django.utils.dateparse import parse_date
+from django.utils.functional import cached_property
+
+from core.db_router import lectura_en_primaria
+
+
+CLAVE_VERSION_CONTEO = 'libros:conteo:version'
+TIEMPO_CONTEO = 5 * 60  # segundos que se reutiliza un COUNT(*)
+
+
+# --- CURSORES OPACOS PARA PAGINACIÓN KEYSET (?after=) ---
+
+def _codificar(texto):
+    return base64.urlsafe_b64encode(texto.encode()).decode().rstrip('=')
+
+
+def _decodificar(token):
+    relleno = '=' * (-len(token) % 4)
+    return base64.urlsafe_b64decode(token + relleno).decode()
+
+
+def codificar_cursor(pk, fecha=None):
+    """Convierte el pk del último libro de la página en un token opaco para la URL.
+
+    Con `fecha`, el cursor es (fecha_publicacion, pk): el orden de los listados filtrados.
+    """
+    return _codificar(f"{fecha.isoformat()}|{pk}" if fecha else str(pk))
+
+
+def decodificar_cursor(token):
+    """Devuelve el pk codificado en `token`, o None si el token no es válido."""
+    try:
+        return int(_decodificar(token))
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def decodificar_cursor_fecha(token):
+    """Devuelve (fecha, pk) de un cursor de listado filtrado, o None si no es válido."""
+    try:
+        fecha, pk = _decodificar(token).split('|')
+        fecha = parse_date(fecha)
+        return (fecha, int(pk)) if fecha else None
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def despues_del_cursor(queryset, token, por_fecha=False):
+    """Filtra el queryset a lo que va detrás del cursor; None si el token no es válido."""
+    if not por_fecha:
+        pk = decodificar_cursor(token)
+        return None if pk is None else queryset.filter(pk__gt=pk)
+    valor = decodificar_cursor_fecha(token)
+    if valor is None:
+        return None
+    fecha, pk = valor
+    # (fecha, pk) > (f, p) escrito con un rango sobre fecha: aprovecha los índices compuestos
+    return queryset.filter(fecha_publicacion__gte=fecha).filter(
+        Q(fecha_publicacion__gt=fecha) | Q(pk__gt=pk),
+    )
+
+
+def cursor_siguiente(libro, por_fecha=False):
+    return codificar_cursor(libro.pk, libro.fecha_publicacion if por_fecha else None)
+
+
+# --- CONTEO CACHEADO ---
+
+def invalidar_conteos():
+    """Descarta los COUNT(*) y las facetas cacheados (al crear o eliminar libros, o al renombrar)."""
+    try:
+        cache.incr(CLAVE_VERSION_CONTEO)
+    except ValueError:
+        cache.set(CLAVE_VERSION_CONTEO, 1, None)
+
+
+class ConteoCacheadoPaginator(Paginator):
+    """Paginator que guarda el COUNT(*) en la caché en lugar de repetirlo en cada petición."""
+
+    @cached_property
+    def count(self):
+        try:
+            sql = str(self.object_list.query)
+        except (AttributeError, EmptyResultSet):
+            return super().count
+        version = cache.get(CLAVE_VERSION_CONTEO, 0)
+        clave = f"libros:conteo:{version}:{hashlib.md5(sql.encode()).hexdigest()}"
+        return cache.get_or_set(clave, self._contar_en_primaria, TIEMPO_CONTEO)
+
+    def _contar_en_primaria(self):
+        # Lo comparten todos: una réplica con retraso dejaría cacheado el total anterior
+        with lectura_en_primaria():
+            return super().count
+
+
+# --- CONTEO ESTIMADO (ADMIN CON TABLAS GRANDES) ---
+
+UMBRAL_ESTIMACION = 100_000  # por debajo, el COUNT(*) exacto es barato
+
+
+def estimar_filas(modelo, using='default'):
+    """Número aproximado de filas según las estadísticas del motor (None si no hay).
+
+    PostgreSQL: pg_class.reltuples (lo mantienen ANALYZE/autovacuum).
+    SQLite: sqlite_stat1, que sólo existe tras ejecutar ANALYZE.
+    """
+    conexion = connections[using]
+    tabla = modelo._meta.db_table
+    if conexion.vendor == 'postgresql':
+        sql, parametros = "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [tabla]
+    elif conexion.vendor == 'sqlite':
+        sql, parametros = "SELECT MAX(CAST(stat AS INTEGER)) FROM sqlite_stat1 WHERE tbl = %s", [tabla]
+    else:
+        return None
+    try:
+        with conexion.cursor() as cursor:
+            cursor.execute(sql, parametros)
+            fila = cursor.fetchone()
+    except DatabaseError:
+        return None
+    return fila[0] if fila and fila[0] is not None and fila[0] >= 0 else None
+
+
+class ConteoEstimadoPaginator(ConteoCacheadoPaginator):
+    """Sin filtros y con una tabla grande, usa la estimación del motor en vez de COUNT(*).
+
+    Con filtros (o en tablas pequeñas) el conteo es exacto, pero cacheado.
+    """
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            estimacion = estimar_filas(self.object_list.model, self.object_list.db)
+            if estimacion is not None and estimacion >= UMBRAL_ESTIMACION:
+                return estimacion
+        return super().count
@@ -0,0 +1,221 @@
+# libros/services/acciones_masivas.py
+#
+# Operaciones del admin sobre miles de libros seleccionados: el SQL va por páginas de pk
+# y Firestore por WriteBatch de hasta 500 operaciones (un commit por página en lugar de
+# un RPC por libro). Cada página se registra en el log para seguir el progreso.
+
+import logging
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from libros.cache import invalidar_autor, invalidar_categoria, invalidar_detalle
+from libros.catalogo import catalogo_obsoleto
+from libros.facetas import recalcular_contadores
+from libros.models import Autor, Categoria, Libro, SincronizacionPendiente
+from libros.paginacion import invalidar_conteos
+from libros.services.reconciliacion import EscritorPorLotes, paginas_por_pk
+from libros.services.sincronizacion import LIMITE_LOTE_FIRESTORE
+from libros.slugs import asignar_slugs
+
+
+logger = logging.getLogger(__name__)
+
+
+def _pks_por_pagina(queryset, tamano):
+    """Como paginas_por_pk, pero sólo con los pk (sin cargar los libros)."""
+    ultimo_pk = 0
+    while True:
+        pks = list(queryset.filter(pk__gt=ultimo_pk).order_by('pk').values_list('pk', flat=True)[:tamano])
+        if not pks:
+            return
+        yield pks
+        ultimo_pk = pks[-1]
+
+
+def _avisar(operacion, resumen, progreso):
+    logger.info("%s: %s", operacion, resumen)
+    if progreso:
+        progreso(resumen)
+
+
+def _sincronizacion_habilitada():
+    return settings.FIREBASE_CONFIG.get('SYNC_ENABLED', False)
+
+
+def encolar(queryset, operacion, tamano=LIMITE_LOTE_FIRESTORE):
+    """Deja en la outbox la operación para cada libro del queryset. Devuelve cuántos."""
+    total = 0
+    for pks in _pks_por_pagina(queryset, tamano):
+        SincronizacionPendiente.encolar(pks, operacion)
+        total += len(pks)
+    return total
+
+
+def enviar_a_firestore(db, queryset, tamano=LIMITE_LOTE_FIRESTORE, progreso=None):
+    """Escribe en Firestore los libros del queryset, un WriteBatch por página.
+
+    Si un commit falla, lo que faltaba por enviar queda en la outbox para que lo
+    reintente sync_firestore (resumen['encolados']).
+    """
+    tamano = min(tamano, LIMITE_LOTE_FIRESTORE)
+    coleccion = db.collection('libros')
+    escritor = EscritorPorLotes(db)
+    resumen = {'enviados': 0, 'commits': 0, 'encolados': 0}
+    ultimo_pk = 0
+    try:
+        for pagina in paginas_por_pk(queryset.select_related('autor', 'categoria'), tamano):
+            for libro in pagina:
+                escritor.set(coleccion.document(str(libro.pk)), libro.datos_firestore())
+            escritor.confirmar()
+            ultimo_pk = pagina[-1].pk
+            resumen['enviados'] += len(pagina)
+            resumen['commits'] = escritor.commits
+            _avisar('envío a Firestore', resumen, progreso)
+    except Exception as exc:
+        logger.warning("Fallo al enviar libros a Firestore tras %d: %s", resumen['enviados'], exc)
+        resumen['encolados'] = encolar(queryset.filter(pk__gt=ultimo_pk), SincronizacionPendiente.GUARDAR)
+    return resumen
+
+
+def eliminar_de_firestore(db, queryset, tamano=LIMITE_LOTE_FIRESTORE, progreso=None):
+    """Borra de Firestore los documentos de los libros del queryset (los libros siguen en SQL).
+
+    Como en enviar_a_firestore, si un commit falla el resto se deja en la outbox.
+    """
+    tamano = min(tamano, LIMITE_LOTE_FIRESTORE)
+    coleccion = db.collection('libros')
+    escritor = EscritorPorLotes(db)
+    resumen = {'eliminados': 0, 'commits': 0, 'encolados': 0}
+    ultimo_pk = 0
+    try:
+        for pks in _pks_por_pagina(queryset, tamano):
+            for pk in pks:
+                escritor.delete(coleccion.document(str(pk)))
+            escritor.confirmar()
+            ultimo_pk = pks[-1]
+            resumen['eliminados'] += len(pks)
+            resumen['commits'] = escritor.commits
+            _avisar('borrado en Firestore', resumen, progreso)
+    except Exception as exc:
+        logger.warning("Fallo al borrar libros de Firestore tras %d: %s", resumen['eliminados'], exc)
+        resumen['encolados'] = encolar(queryset.filter(pk__gt=ultimo_pk), SincronizacionPendiente.ELIMINAR)
+    return resumen
+
+
+def eliminar_libros(queryset, tamano=LIMITE_LOTE_FIRESTORE, progreso=None):
+    """Borra los libros por páginas haciendo lo que QuerySet.delete() se salta de Libro.delete().
+
+    Por página: un DELETE, recálculo de los contadores afectados, invalidación del
+    detalle y, con la sincronización activa, borrado en Firestore vía la outbox.
+    """
+    resumen = {'eliminados': 0}
+    ultimo_pk = 0
+    while True:
+        filas = list(
+            queryset.filter(pk__gt=ultimo_pk).order_by('pk')
+            .values_list('pk', 'slug', 'autor_id', 'categoria_id')[:tamano]
+        )
+        if not filas:
+            break
+        pks, slugs, autor_ids, categoria_ids = zip(*filas)
+        with transaction.atomic():
+            Libro.objects.filter(pk__in=pks).delete()
+            recalcular_contadores(
+                autor_ids=set(autor_ids),
+                categoria_ids={pk for pk in categoria_ids if pk is not None},
+            )
+            if _sincronizacion_habilitada():
+                SincronizacionPendiente.encolar(pks, SincronizacionPendiente.ELIMINAR)
+        # Tras el COMMIT (si quien llama abrió una transacción, al confirmarla)
+        transaction.on_commit(partial(invalidar_detalle, *slugs))
+        ultimo_pk = pks[-1]
+        resumen['eliminados'] += len(pks)
+        _avisar('borrado de libros', resumen, progreso)
+    if resumen['eliminados']:
+        transaction.on_commit(invalidar_conteos)
+        catalogo_obsoleto()
+    return resumen
+
+
+def eliminar_autores(queryset):
+    """Borra autores haciendo lo que QuerySet.delete() se salta de Autor.delete().
+
+    Sus libros se van en cascada: se recalculan las categorías que los contaban
+    y, tras el COMMIT, se invalidan sus páginas y los conteos cacheados.
+    """
+    autor_ids = list(queryset.values_list('pk', flat=True))
+    if not autor_ids:
+        return {'eliminados': 0}
+    with transaction.atomic():
+        categoria_ids = set(
+            Libro.objects.filter(autor_id__in=autor_ids).exclude(categoria=None)
+            .order_by().values_list('categoria_id', flat=True).distinct()
+        )
+        Autor.objects.filter(pk__in=autor_ids).delete()
+        recalcular_contadores(autor_ids=(), categoria_ids=categoria_ids)
+    for pk in autor_ids:
+        transaction.on_commit(partial(invalidar_autor, pk))
+    transaction.on_commit(invalidar_conteos)
+    catalogo_obsoleto()
+    resumen = {'eliminados': len(autor_ids)}
+    _avisar('borrado de autores', resumen, None)
+    return resumen
+
+
+def eliminar_categorias(queryset):
+    """Borra categorías haciendo lo que QuerySet.delete() se salta de Categoria.delete().
+
+    SET_NULL no pasa por Libro.save(): se marca `actualizado` en sus libros para que
+    los fragmentos cacheados y la reconciliación incremental vean el cambio.
+    """
+    categoria_ids = list(queryset.values_list('pk', flat=True))
+    if not categoria_ids:
+        return {'eliminados': 0}
+    with transaction.atomic():
+        Libro.objects.filter(categoria_id__in=categoria_ids).update(actualizado=timezone.now())
+        Categoria.objects.filter(pk__in=categoria_ids).delete()
+    for pk in categoria_ids:
+        transaction.on_commit(partial(invalidar_categoria, pk))
+    transaction.on_commit(invalidar_conteos)
+    catalogo_obsoleto()
+    resumen = {'eliminados': len(categoria_ids)}
+    _avisar('borrado de categorías', resumen, None)
+    return resumen
+
+
+def reasignar_slugs(queryset, tamano=LIMITE_LOTE_FIRESTORE, progreso=None):
+    """Recalcula el slug de cada libro a partir de su título actual (dos UPDATE por página).
+
+    Los slugs de la propia página no cuentan como ocupados: un libro puede conservar
+    el suyo o quedarse con el que deja libre otro libro de la misma página.
+    """
+    resumen = {'revisados': 0, 'cambiados': 0}
+    for pagina in paginas_por_pk(queryset.select_related(None).only('pk', 'titulo', 'slug'), tamano):
+        nuevos = asignar_slugs(Libro, [libro.titulo for libro in pagina],
+                               excluir_pks=[libro.pk for libro in pagina])
+        cambiados = [(libro, slug) for libro, slug in zip(pagina, nuevos) if libro.slug != slug]
+        resumen['revisados'] += len(pagina)
+        if cambiados:
+            anteriores = [libro.slug for libro, _ in cambiados]
+            ahora = timezone.now()
+            with transaction.atomic():
+                # Slugs provisionales primero: dos libros de la página pueden intercambiarse
+                # el slug y la restricción UNIQUE se comprueba fila a fila
+                for libro, _ in cambiados:
+                    libro.slug = f"~{libro.pk}"
+                Libro.objects.bulk_update([libro for libro, _ in cambiados], ['slug'])
+                for libro, slug in cambiados:
+                    libro.slug, libro.actualizado = slug, ahora
+                Libro.objects.bulk_update([libro for libro, _ in cambiados], ['slug', 'actualizado'])
+                if _sincronizacion_habilitada():
+                    SincronizacionPendiente.encolar([libro.pk for libro, _ in cambiados],
+                                                    SincronizacionPendiente.GUARDAR)
+            transaction.on_commit(partial(invalidar_detalle, *anteriores, *(slug for _, slug in cambiados)))
+            resumen['cambiados'] += len(cambiados)
+        _avisar('reasignación de slugs', resumen, progreso)
+    if resumen['cambiados']:
+        catalogo_obsoleto()
+    return resumen
@@ -1,28 +1,139 @@
 # libros/services/firebase_db.py
+#
+# Lecturas de libros sueltos en Firestore con una caché en proceso delante. Los documentos
+# de 'libros' se identifican por el pk (como los escribe sync_firestore), así que los slugs
+# se resuelven antes en SQL y lo que no está en caché se pide junto en un único get_all.
+#
+# La caché es de cada proceso, pero quien escribe en Firestore (sync_firestore, reconcile)
+# es otro: invalidar_libros() cambia además la versión de cada documento en la caché de
+# Django, y una entrada sólo vale si se leyó con la versión actual. Con una caché de
+# Django compartida (Redis, Memcached) eso llega a todos los workers; con la LocMemCache
+# por defecto no, y un documento reescrito por otro proceso se sirve hasta TTL_LIBROS
+# (salvo con FIREBASE_CONFIG['LISTENER_LIBROS']).
 
-from firebase_admin import firestore
+import logging
+import threading
+import uuid
 
+from cachetools import TLRUCache
+from django.conf import settings
+from django.core.cache import cache
+
+from core.metricas import medir_firestore
+from digital_library.firebase_config import get_firebase_db
 from libros.models import Libro
 
 
-db = firestore.client()
+logger = logging.getLogger(__name__)
+
+# Marca de "el documento no existe" (caché negativa), distinta de "no está en caché"
+_AUSENTE = object()
+# Versión de toda la colección (invalidar_libros() sin ids) y de cada documento
+CLAVE_GENERACION = 'libros:firestore:generacion'
+
+
+def _clave_version(doc_id):
+    return f"libros:firestore:version:{doc_id}"
+
+
+def _caducidad(doc_id, entrada, ahora):
+    if entrada[1] is _AUSENTE:
+        # Un libro recién creado puede no haberse sincronizado aún: se olvida antes
+        return ahora + settings.FIREBASE_CONFIG.get('TTL_LIBROS_AUSENTES', 30)
+    return ahora + settings.FIREBASE_CONFIG.get('TTL_LIBROS', 300)
+
+
+# doc_id -> (versión con la que se leyó, datos del documento o _AUSENTE), LRU acotada con
+# caducidad por entrada
+_documentos = TLRUCache(maxsize=settings.FIREBASE_CONFIG.get('CACHE_LIBROS', 4096), ttu=_caducidad)
+_lock = threading.Lock()
+_estadisticas = {'aciertos': 0, 'fallos': 0, 'lecturas': 0}
+
+
+def invalidar_libros(*doc_ids):
+    """Olvida los documentos indicados (pk o id), o todos si no se indica ninguno.
+
+    En este proceso al momento; en los demás, al cambiar su versión en la caché de Django.
+    """
+    if doc_ids:
+        cache.set_many({_clave_version(doc_id): uuid.uuid4().hex for doc_id in doc_ids}, None)
+    else:
+        cache.set(CLAVE_GENERACION, uuid.uuid4().hex, None)
+    with _lock:
+        if not doc_ids:
+            _documentos.clear()
+        for doc_id in doc_ids:
+            _documentos.pop(str(doc_id), None)
+
+
+def _versiones(doc_ids):
+    """{doc_id: versión actual}, en una sola consulta a la caché de Django."""
+    claves = {doc_id: _clave_version(doc_id) for doc_id in doc_ids}
+    actuales = cache.get_many([CLAVE_GENERACION, *claves.values()])
+    generacion = actuales.get(CLAVE_GENERACION)
+    return {doc_id: (generacion, actuales.get(clave)) for doc_id, clave in claves.items()}
+
+
+def estadisticas_libros():
+    """Aciertos, fallos (documentos pedidos a Firestore) y tasa de aciertos de la caché."""
+    with _lock:
+        resumen = dict(_estadisticas, tamano=len(_documentos))
+    consultas = resumen['aciertos'] + resumen['fallos']
+    resumen['tasa_aciertos'] = resumen['aciertos'] / consultas if consultas else 0.0
+    return resumen
+
+
+def obtener_libros(slugs, db=None):
+    """Documentos de Firestore de varios libros: {slug: datos o None}, en el orden pedido.
+
+    Los que están en caché (y con su versión al día) no cuestan ninguna lectura; el resto
+    se leen en una sola llamada (get_all). Los slugs que no existen en SQL ni se consultan
+    en Firestore.
+    """
+    slugs = list(dict.fromkeys(slugs))
+    ids = {slug: str(pk) for slug, pk in Libro.objects.filter(slug__in=slugs).values_list('slug', 'pk')}
+    # Antes de leer Firestore: si se invalida mientras tanto, lo leído queda con la versión vieja
+    versiones = _versiones(ids.values())
+
+    encontrados, faltan = {}, []
+    with _lock:
+        for doc_id in ids.values():
+            entrada = _documentos.get(doc_id)
+            if entrada is None or entrada[0] != versiones[doc_id]:
+                faltan.append(doc_id)
+            else:
+                encontrados[doc_id] = entrada[1]
+        _estadisticas['aciertos'] += len(encontrados)
+        _estadisticas['fallos'] += len(faltan)
+
+    if faltan:
+        db = db or get_firebase_db()
+        coleccion = db.collection('libros')
+        with medir_firestore('get_all'):
+            documentos = list(db.get_all([coleccion.document(doc_id) for doc_id in faltan]))
+        leidos = {doc.id: doc.to_dict() for doc in documentos if doc.exists}
+        with _lock:
+            _estadisticas['lecturas'] += len(faltan)
+            for doc_id in faltan:
+                encontrados[doc_id] = leidos.get(doc_id, _AUSENTE)
+                _documentos[doc_id] = (versiones[doc_id], encontrados[doc_id])
+
+    resultado = {}
+    for slug in slugs:
+        datos = encontrados.get(ids.get(slug), _AUSENTE)
+        # Copia: quien llama puede modificar el dict sin tocar la caché
+        resultado[slug] = None if datos is _AUSENTE else dict(datos)
+    return resultado
+
 
 def guardar_libro_en_firestore(libro_django: Libro):
-    # Prepara los datos del modelo de Django
-    data = {
-        'titulo': libro_django.titulo,
-        'autor_id': libro_django.autor.pk,
-        # ... otros campos
-    }
-    
-    # Guarda en Firestore usando el slug de Django como ID del documento
-    db.collection('libros').document(libro_django.slug).set(data)
-    print(f"Libro {libro_django.titulo} guardado en Firestore.")
+    # El documento es el mismo que escribe sync_firestore (id = pk, no el slug)
+    with medir_firestore('set'):
+        get_firebase_db().collection('libros').document(str(libro_django.pk)).set(libro_django.datos_firestore())
+    invalidar_libros(libro_django.pk)
+    logger.debug("Libro %s guardado en Firestore.", libro_django.pk)
 
 
 def obtener_libro_de_firestore(slug):
-    # Obtiene un documento
-    doc = db.collection('libros').document(slug).get()
-    if doc.exists:
-        return doc.to_dict()
-    return None
\ No newline at end of file
+    # Un solo documento: pasa por la misma caché que obtener_libros
+    return obtener_libros([slug])[slug]
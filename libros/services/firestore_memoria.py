@@ -0,0 +1,437 @@
+# libros/services/firestore_memoria.py
+#
+# Implementación en memoria de la parte del API de Firestore que usa el proyecto
+# (colección, documento, consulta, WriteBatch, get_all, on_snapshot y el cliente
+# asíncrono). Sirve para probar y medir la sincronización y las vistas de Firebase sin
+# red: FIREBASE_CONFIG['BACKEND'] = 'memoria'. Cada llamada que en Firestore sería un
+# RPC puede llevar una latencia y una probabilidad de fallo configurables.
+
+import asyncio
+import copy
+import random
+import threading
+import time
+from bisect import bisect_left
+
+
+ASCENDING = 'ASCENDING'
+DESCENDING = 'DESCENDING'
+
+OPERADORES = {
+    '==': lambda valor, esperado: valor == esperado,
+    '!=': lambda valor, esperado: valor != esperado,
+    '<': lambda valor, esperado: valor < esperado,
+    '<=': lambda valor, esperado: valor <= esperado,
+    '>': lambda valor, esperado: valor > esperado,
+    '>=': lambda valor, esperado: valor >= esperado,
+    'in': lambda valor, esperado: valor in esperado,
+    'array_contains': lambda valor, esperado: isinstance(valor, list) and esperado in valor,
+}
+
+
+class ErrorFirestoreSimulado(Exception):
+    """Fallo inyectado en una llamada (equivale a un UNAVAILABLE/DEADLINE_EXCEEDED)."""
+
+
+class DocumentoMemoria:
+    """Equivalente a DocumentSnapshot."""
+
+    def __init__(self, doc_id, datos):
+        self.id = doc_id
+        self._datos = datos
+
+    @property
+    def exists(self):
+        return self._datos is not None
+
+    def get(self, campo):
+        return (self._datos or {}).get(campo)
+
+    def to_dict(self):
+        return copy.deepcopy(self._datos) if self._datos is not None else None
+
+
+class ReferenciaDocumentoMemoria:
+    """Equivalente a DocumentReference."""
+
+    def __init__(self, cliente, coleccion, doc_id):
+        self._cliente = cliente
+        self._coleccion = coleccion
+        self.id = doc_id
+
+    def get(self, field_paths=None):
+        self._cliente._llamada()
+        return self._cliente._leer(self._coleccion, [self.id], field_paths)[0]
+
+    def set(self, datos):
+        self._cliente._llamada()
+        self._cliente._aplicar([('set', self._coleccion, self.id, datos)])
+
+    def update(self, datos):
+        self._cliente._llamada()
+        self._cliente._aplicar([('update', self._coleccion, self.id, datos)])
+
+    def delete(self):
+        self._cliente._llamada()
+        self._cliente._aplicar([('delete', self._coleccion, self.id, None)])
+
+
+class ConsultaMemoria:
+    """Equivalente a Query: where/order_by/select/start_after/limit encadenables."""
+
+    def __init__(self, cliente, coleccion, filtros=(), orden=(), campos=None, despues=None, limite=None):
+        self._cliente = cliente
+        self._nombre = coleccion
+        self._filtros = filtros
+        self._orden = orden
+        self._campos = campos
+        self._despues = despues
+        self._limite = limite
+
+    def _clase_consulta(self):
+        return ConsultaMemoria
+
+    def _copia(self, **cambios):
+        estado = {'filtros': self._filtros, 'orden': self._orden, 'campos': self._campos,
+                  'despues': self._despues, 'limite': self._limite, **cambios}
+        return self._clase_consulta()(self._cliente, self._nombre, **estado)
+
+    def where(self, campo, operador, valor):
+        if operador not in OPERADORES:
+            raise ValueError(f"Operador no soportado: {operador}")
+        return self._copia(filtros=self._filtros + ((campo, operador, valor),))
+
+    def order_by(self, campo, direction=ASCENDING):
+        return self._copia(orden=self._orden + ((campo, direction),))
+
+    def select(self, campos):
+        return self._copia(campos=list(campos))
+
+    def start_after(self, cursor):
+        """`cursor` es un dict con los campos de order_by o un DocumentoMemoria."""
+        return self._copia(despues=cursor)
+
+    def limit(self, cantidad):
+        return self._copia(limite=cantidad)
+
+    def _comparar(self, a, b, desempatar=True):
+        """Orden de dos (id, datos) según order_by; `b` puede ser un cursor por valores."""
+        for campo, direccion in self._orden:
+            if campo not in b[1]:
+                return 0  # cursor con menos campos que el order_by
+            x, y = a[1].get(campo), b[1].get(campo)
+            if x != y:
+                resultado = -1 if x < y else 1
+                return -resultado if direccion == DESCENDING else resultado
+        # Como Firestore, el id del documento desempata
+        return (a[0] > b[0]) - (a[0] < b[0]) if desempatar else 0
+
+    def _resultados(self):
+        with self._cliente._lock:
+            documentos = list(self._cliente._datos.get(self._nombre, {}).items())
+        # Firestore no devuelve los documentos a los que les falta un campo del order_by
+        requeridos = {campo for campo, _ in self._orden}
+        if requeridos:
+            documentos = [(doc_id, datos) for doc_id, datos in documentos if datos.keys() >= requeridos]
+        for campo, operador, valor in self._filtros:
+            documentos = [(doc_id, datos) for doc_id, datos in documentos
+                          if campo in datos and OPERADORES[operador](datos[campo], valor)]
+        # Ordenaciones estables de la última clave a la primera: mismo resultado que _comparar
+        documentos.sort(key=lambda documento: documento[0])
+        for campo, direccion in reversed(self._orden):
+            documentos.sort(key=lambda documento: documento[1][campo], reverse=direccion == DESCENDING)
+
+        if self._despues is not None:
+            if isinstance(self._despues, DocumentoMemoria):
+                cursor, desempatar = (self._despues.id, self._despues.to_dict() or {}), True
+            else:
+                # Cursor por valores: salta también los empates en esos campos
+                cursor, desempatar = ('', self._despues), False
+            # La lista ya está ordenada: búsqueda binaria del primero posterior al cursor
+            documentos = documentos[bisect_left(
+                documentos, True, key=lambda d: self._comparar(d, cursor, desempatar) > 0,
+            ):]
+        if self._limite is not None:
+            documentos = documentos[:self._limite]
+
+        resultado = []
+        for doc_id, datos in documentos:
+            if self._campos is not None:
+                datos = {campo: datos[campo] for campo in self._campos if campo in datos}
+            resultado.append(DocumentoMemoria(doc_id, copy.deepcopy(datos)))
+        # Una consulta cuesta al menos una lectura aunque no devuelva nada
+        self._cliente._sumar('lecturas', max(len(resultado), 1))
+        return resultado
+
+    def stream(self):
+        self._cliente._llamada()
+        yield from self._resultados()
+
+    def get(self):
+        return list(self.stream())
+
+    def on_snapshot(self, callback):
+        """Listener: `callback(documentos, cambios, hora)` al registrarse y tras cada escritura."""
+        return self._cliente._escuchar(self, callback)
+
+
+class ColeccionMemoria(ConsultaMemoria):
+    """Equivalente a CollectionReference (que también es una consulta sobre toda la colección)."""
+
+    def document(self, doc_id):
+        return ReferenciaDocumentoMemoria(self._cliente, self._nombre, str(doc_id))
+
+    def list_documents(self, page_size=None):
+        """Referencias de todos los documentos, sin leer su contenido."""
+        self._cliente._llamada()
+        with self._cliente._lock:
+            ids = sorted(self._cliente._datos.get(self._nombre, {}))
+        for doc_id in ids:
+            yield ReferenciaDocumentoMemoria(self._cliente, self._nombre, doc_id)
+
+
+class LoteMemoria:
+    """Equivalente a WriteBatch: las operaciones se aplican juntas en commit()."""
+
+    LIMITE = 500
+
+    def __init__(self, cliente):
+        self._cliente = cliente
+        self._operaciones = []
+
+    def _agregar(self, operacion, referencia, datos):
+        if len(self._operaciones) >= self.LIMITE:
+            raise ValueError("Un WriteBatch admite como máximo 500 operaciones.")
+        self._operaciones.append((operacion, referencia._coleccion, referencia.id, datos))
+
+    def set(self, referencia, datos):
+        self._agregar('set', referencia, datos)
+
+    def update(self, referencia, datos):
+        self._agregar('update', referencia, datos)
+
+    def delete(self, referencia):
+        self._agregar('delete', referencia, None)
+
+    def commit(self):
+        # Todo o nada: un fallo inyectado no aplica ninguna operación del lote
+        self._cliente._llamada()
+        self._cliente._aplicar(self._operaciones)
+        self._cliente._sumar('commits')
+
+
+class _Suscripcion:
+    """Equivalente a Watch: unsubscribe() deja de notificar."""
+
+    def __init__(self, cliente, consulta, callback):
+        self._cliente = cliente
+        self.consulta = consulta
+        self.callback = callback
+
+    def unsubscribe(self):
+        with self._cliente._lock:
+            if self in self._cliente._suscripciones:
+                self._cliente._suscripciones.remove(self)
+
+
+class ClienteFirestoreMemoria:
+    """Cliente de Firestore en proceso, con contadores de lecturas, escrituras, commits y llamadas.
+
+    `latencia` son los segundos que tarda cada llamada (número o rango (mínimo, máximo))
+    y `probabilidad_fallo` la de que lance ErrorFirestoreSimulado antes de aplicarse.
+    """
+
+    def __init__(self, latencia=0, probabilidad_fallo=0.0, semilla=None):
+        self._datos = {}
+        self._lock = threading.Lock()
+        self._suscripciones = []
+        self._aleatorio = random.Random(semilla)
+        self.latencia = latencia
+        self.probabilidad_fallo = probabilidad_fallo
+        self.lecturas = 0
+        self.escrituras = 0
+        self.commits = 0
+        self.llamadas = 0
+        self.fallos = 0
+
+    # --- Inyección de latencia y fallos ---
+
+    def _retraso(self):
+        if isinstance(self.latencia, (tuple, list)):
+            return self._aleatorio.uniform(*self.latencia)
+        return self.latencia
+
+    def _contar_llamada(self):
+        """Cuenta la llamada y decide si falla; devuelve los segundos que debe tardar."""
+        with self._lock:
+            self.llamadas += 1
+            retraso = self._retraso()
+            falla = self.probabilidad_fallo and self._aleatorio.random() < self.probabilidad_fallo
+            if falla:
+                self.fallos += 1
+        return retraso, falla
+
+    def _llamada(self):
+        retraso, falla = self._contar_llamada()
+        if retraso:
+            time.sleep(retraso)
+        if falla:
+            raise ErrorFirestoreSimulado("Fallo inyectado en Firestore en memoria")
+
+    # --- API de Firestore ---
+
+    def collection(self, nombre):
+        return ColeccionMemoria(self, nombre)
+
+    def batch(self):
+        return LoteMemoria(self)
+
+    def get_all(self, referencias, field_paths=None):
+        """Lectura múltiple en una llamada; con field_paths sólo devuelve esos campos."""
+        referencias = list(referencias)
+        self._llamada()
+        yield from self._leer_referencias(referencias, field_paths)
+
+    def cargar(self, coleccion, documentos):
+        """Carga inicial {id: datos} sin latencia, fallos ni contadores."""
+        with self._lock:
+            self._datos.setdefault(coleccion, {}).update(copy.deepcopy(documentos))
+
+    # --- Estado compartido (también lo usa ClienteFirestoreMemoriaAsync) ---
+
+    def _sumar(self, contador, cantidad=1):
+        with self._lock:
+            setattr(self, contador, getattr(self, contador) + cantidad)
+
+    def _leer(self, coleccion, ids, field_paths=None):
+        with self._lock:
+            self.lecturas += len(ids)
+            encontrados = [(doc_id, self._datos.get(coleccion, {}).get(doc_id)) for doc_id in ids]
+        documentos = []
+        for doc_id, datos in encontrados:
+            if datos is not None and field_paths is not None:
+                datos = {campo: datos[campo] for campo in field_paths if campo in datos}
+            documentos.append(DocumentoMemoria(doc_id, copy.deepcopy(datos)))
+        return documentos
+
+    def _leer_referencias(self, referencias, field_paths=None):
+        documentos = []
+        for referencia in referencias:
+            documentos += self._leer(referencia._coleccion, [referencia.id], field_paths)
+        return documentos
+
+    def _aplicar(self, operaciones):
+        with self._lock:
+            # Todo o nada, como un WriteBatch: un update() de un documento que no existe
+            # rechaza el lote completo antes de aplicar nada
+            existe = {}
+            for operacion, coleccion, doc_id, _ in operaciones:
+                clave = (coleccion, doc_id)
+                if clave not in existe:
+                    existe[clave] = doc_id in self._datos.get(coleccion, {})
+                if operacion == 'update' and not existe[clave]:
+                    raise KeyError(f"No existe el documento {coleccion}/{doc_id}")
+                existe[clave] = operacion != 'delete'
+
+            for operacion, coleccion, doc_id, datos in operaciones:
+                documentos = self._datos.setdefault(coleccion, {})
+                if operacion == 'set':
+                    documentos[doc_id] = copy.deepcopy(datos)
+                elif operacion == 'update':
+                    documentos[doc_id].update(copy.deepcopy(datos))
+                else:
+                    documentos.pop(doc_id, None)
+            self.escrituras += len(operaciones)
+            colecciones = {coleccion for _, coleccion, _, _ in operaciones}
+            avisar = [s for s in self._suscripciones if s.consulta._nombre in colecciones]
+        # Los callbacks se ejecutan fuera del lock (pueden volver a leer)
+        for suscripcion in avisar:
+            self._notificar(suscripcion)
+
+    def _escuchar(self, consulta, callback):
+        suscripcion = _Suscripcion(self, consulta, callback)
+        with self._lock:
+            self._suscripciones.append(suscripcion)
+        self._notificar(suscripcion)
+        return suscripcion
+
+    def _notificar(self, suscripcion):
+        suscripcion.callback(suscripcion.consulta._resultados(), [], time.time())
+
+
+# --- CLIENTE ASÍNCRONO (AsyncClient) SOBRE LOS MISMOS DATOS ---
+
+class ReferenciaDocumentoMemoriaAsync(ReferenciaDocumentoMemoria):
+    async def get(self, field_paths=None):
+        await self._cliente._llamada_async()
+        return self._cliente._leer(self._coleccion, [self.id], field_paths)[0]
+
+    async def set(self, datos):
+        await self._cliente._llamada_async()
+        self._cliente._aplicar([('set', self._coleccion, self.id, datos)])
+
+    async def update(self, datos):
+        await self._cliente._llamada_async()
+        self._cliente._aplicar([('update', self._coleccion, self.id, datos)])
+
+    async def delete(self):
+        await self._cliente._llamada_async()
+        self._cliente._aplicar([('delete', self._coleccion, self.id, None)])
+
+
+class ConsultaMemoriaAsync(ConsultaMemoria):
+    def _clase_consulta(self):
+        return ConsultaMemoriaAsync
+
+    async def stream(self):
+        await self._cliente._llamada_async()
+        for documento in self._resultados():
+            yield documento
+
+    async def get(self):
+        return [documento async for documento in self.stream()]
+
+
+class ColeccionMemoriaAsync(ConsultaMemoriaAsync):
+    def document(self, doc_id):
+        return ReferenciaDocumentoMemoriaAsync(self._cliente, self._nombre, str(doc_id))
+
+
+class LoteMemoriaAsync(LoteMemoria):
+    async def commit(self):
+        await self._cliente._llamada_async()
+        self._cliente._aplicar(self._operaciones)
+        self._cliente._sumar('commits')
+
+
+class ClienteFirestoreMemoriaAsync:
+    """Equivalente a AsyncClient: mismas colecciones y contadores que el cliente síncrono `base`.
+
+    La latencia se espera con asyncio.sleep, así que no bloquea el event loop.
+    """
+
+    def __init__(self, base):
+        self.base = base
+
+    def __getattr__(self, nombre):
+        # Contadores, _datos, _lock, _leer, _aplicar… se comparten con el cliente síncrono
+        return getattr(self.base, nombre)
+
+    async def _llamada_async(self):
+        retraso, falla = self.base._contar_llamada()
+        if retraso:
+            await asyncio.sleep(retraso)
+        if falla:
+            raise ErrorFirestoreSimulado("Fallo inyectado en Firestore en memoria")
+
+    def collection(self, nombre):
+        return ColeccionMemoriaAsync(self, nombre)
+
+    def batch(self):
+        return LoteMemoriaAsync(self)
+
+    async def get_all(self, referencias, field_paths=None):
+        referencias = list(referencias)
+        await self._llamada_async()
+        for documento in self.base._leer_referencias(referencias, field_paths):
+            yield documento
@@ -0,0 +1,151 @@
+# libros/services/reconciliacion.py
+#
+# Compara la colección 'libros' de Firestore con SQL y corrige la deriva que deja lo
+# que no pasa por la outbox (QuerySet.update()/delete(), borrados en cascada, fallos).
+# Todo va por páginas: la memoria no depende del tamaño del catálogo.
+
+from datetime import timedelta
+from itertools import islice
+
+from django.utils import timezone
+
+from core.metricas import medir_firestore
+from libros.models import EstadoReconciliacion, Libro, SincronizacionPendiente
+from libros.services.firebase_db import invalidar_libros
+from libros.services.sincronizacion import LIMITE_LOTE_FIRESTORE
+
+
+NOMBRE_ESTADO = 'firestore_libros'
+# Solape al reanudar desde la marca: cubre transacciones que confirmaron tarde
+MARGEN_MARCA = timedelta(minutes=5)
+
+
+class EscritorPorLotes:
+    """Acumula set/delete y los confirma en WriteBatch de como mucho 500 operaciones."""
+
+    def __init__(self, db, simulacro=False):
+        self._db = db
+        self._simulacro = simulacro
+        self._batch = None
+        self._operaciones = 0
+        self._doc_ids = []
+        self.commits = 0
+
+    def set(self, referencia, datos):
+        self._agregar('set', referencia, datos)
+
+    def delete(self, referencia):
+        self._agregar('delete', referencia)
+
+    def _agregar(self, operacion, referencia, *datos):
+        if self._simulacro:
+            return
+        if self._batch is None:
+            self._batch = self._db.batch()
+        getattr(self._batch, operacion)(referencia, *datos)
+        self._operaciones += 1
+        self._doc_ids.append(referencia.id)
+        if self._operaciones >= LIMITE_LOTE_FIRESTORE:
+            self.confirmar()
+
+    def confirmar(self):
+        if self._batch is None:
+            return
+        with medir_firestore('batch_commit'):
+            self._batch.commit()
+        invalidar_libros(*self._doc_ids)
+        self.commits += 1
+        self._batch, self._operaciones, self._doc_ids = None, 0, []
+
+
+def paginas_por_pk(queryset, tamano):
+    """Recorre el queryset en orden de pk por keyset: páginas de `tamano` libros."""
+    ultimo_pk = 0
+    while True:
+        pagina = list(queryset.filter(pk__gt=ultimo_pk).order_by('pk')[:tamano])
+        if not pagina:
+            return
+        yield pagina
+        ultimo_pk = pagina[-1].pk
+
+
+def _reconciliar_pagina(db, libros, escritor):
+    """Reescribe los documentos de la página cuyo hash no coincide. Devuelve cuántos."""
+    coleccion = db.collection('libros')
+    referencias = [coleccion.document(str(libro.pk)) for libro in libros]
+    # Sólo se lee el campo 'hash', no el documento completo
+    with medir_firestore('get_all'):
+        hashes = {
+            doc.id: (doc.to_dict() or {}).get('hash')
+            for doc in db.get_all(referencias, field_paths=['hash']) if doc.exists
+        }
+    # Los que tienen una escritura en la outbox los dejará al día el worker
+    en_cola = set(SincronizacionPendiente.objects.filter(
+        libro_pk__in=[libro.pk for libro in libros],
+    ).values_list('libro_pk', flat=True))
+
+    reescritos = 0
+    for libro, referencia in zip(libros, referencias):
+        if libro.pk in en_cola:
+            continue
+        datos = libro.datos_firestore()
+        if hashes.get(referencia.id) != datos['hash']:
+            escritor.set(referencia, datos)
+            reescritos += 1
+    return reescritos
+
+
+def _eliminar_huerfanos(db, escritor, tamano):
+    """Borra los documentos sin libro en SQL (incluidos los de id no numérico)."""
+    referencias = db.collection('libros').list_documents(page_size=tamano)
+    eliminados = 0
+    while True:
+        pagina = list(islice(referencias, tamano))
+        if not pagina:
+            return eliminados
+        pks = {r.id: int(r.id) for r in pagina if r.id.isdigit()}
+        existentes = set(Libro.objects.filter(pk__in=pks.values()).values_list('pk', flat=True))
+        for referencia in pagina:
+            if pks.get(referencia.id) not in existentes:
+                escritor.delete(referencia)
+                eliminados += 1
+
+
+def reconciliar(db, completo=False, huerfanos=None, tamano=LIMITE_LOTE_FIRESTORE,
+                simulacro=False, progreso=None):
+    """Lleva Firestore al estado de SQL y devuelve un resumen de lo hecho.
+
+    Incremental (por defecto): sólo revisa los libros con `actualizado` posterior a
+    la marca guardada. `completo` revisa el catálogo entero y, salvo huerfanos=False,
+    borra también los documentos huérfanos. Sin marca previa, la pasada es completa.
+    """
+    tamano = min(tamano, LIMITE_LOTE_FIRESTORE)
+    estado, _ = EstadoReconciliacion.objects.get_or_create(nombre=NOMBRE_ESTADO)
+    completo = completo or estado.marca is None
+    if huerfanos is None:
+        huerfanos = completo
+    inicio = timezone.now()
+
+    libros = Libro.objects.select_related('autor', 'categoria')
+    if not completo:
+        libros = libros.filter(actualizado__gte=estado.marca - MARGEN_MARCA)
+
+    escritor = EscritorPorLotes(db, simulacro=simulacro)
+    resumen = {'completo': completo, 'revisados': 0, 'reescritos': 0, 'eliminados': 0}
+    for pagina in paginas_por_pk(libros, tamano):
+        resumen['revisados'] += len(pagina)
+        resumen['reescritos'] += _reconciliar_pagina(db, pagina, escritor)
+        if progreso:
+            progreso(resumen)
+    if huerfanos:
+        resumen['eliminados'] = _eliminar_huerfanos(db, escritor, tamano)
+    escritor.confirmar()
+    resumen['commits'] = escritor.commits
+
+    if not simulacro:
+        estado.marca = inicio
+        if completo:
+            estado.ultima_completa = inicio
+        estado.save()
+    resumen['marca'] = estado.marca
+    return resumen
@@ -0,0 +1,143 @@
+# libros/services/sincronizacion.py
+
+import logging
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from core.metricas import medir_firestore
+from libros.models import Autor, Categoria, Libro, PropagacionPendiente, SincronizacionPendiente
+from libros.services.firebase_db import invalidar_libros
+
+
+logger = logging.getLogger(__name__)
+
+# Firestore admite como máximo 500 operaciones por WriteBatch
+LIMITE_LOTE_FIRESTORE = 500
+ESPERA_BASE = 5          # segundos antes del primer reintento
+ESPERA_MAXIMA = 60 * 60  # tope del backoff exponencial
+
+
+def calcular_espera(intentos):
+    """Segundos de espera tras `intentos` fallos consecutivos (backoff exponencial)."""
+    return min(ESPERA_BASE * 2 ** (intentos - 1), ESPERA_MAXIMA)
+
+
+def procesar_pendientes(db, tamano_lote=LIMITE_LOTE_FIRESTORE):
+    """Envía a Firestore un lote de la outbox en un solo WriteBatch.
+
+    Devuelve el número de operaciones confirmadas. Si el commit falla, las filas
+    se reprograman con backoff y el error queda guardado en `ultimo_error`.
+    """
+    tamano_lote = min(tamano_lote, LIMITE_LOTE_FIRESTORE)
+    ahora = timezone.now()
+    pendientes = list(
+        SincronizacionPendiente.objects
+        .filter(siguiente_intento__lte=ahora)
+        .order_by('siguiente_intento', 'pk')[:tamano_lote]
+    )
+    if not pendientes:
+        return 0
+
+    pks_guardar = [p.libro_pk for p in pendientes if p.operacion == SincronizacionPendiente.GUARDAR]
+    libros = Libro.objects.select_related('autor', 'categoria').in_bulk(pks_guardar)
+
+    coleccion = db.collection('libros')
+    batch = db.batch()
+    for pendiente in pendientes:
+        doc_ref = coleccion.document(str(pendiente.libro_pk))
+        libro = libros.get(pendiente.libro_pk)
+        if libro is not None:
+            batch.set(doc_ref, libro.datos_firestore())
+        else:
+            # Eliminación explícita, o el libro desapareció antes de sincronizarse
+            batch.delete(doc_ref)
+
+    try:
+        with medir_firestore('batch_commit'):
+            batch.commit()
+    except Exception as exc:
+        logger.warning("Fallo al enviar %d operaciones a Firestore: %s", len(pendientes), exc)
+        for pendiente in pendientes:
+            intentos = pendiente.intentos + 1
+            # Si la fila se volvió a encolar mientras tanto, no se pisa
+            SincronizacionPendiente.objects.filter(
+                pk=pendiente.pk, actualizado=pendiente.actualizado,
+            ).update(
+                intentos=intentos,
+                siguiente_intento=ahora + timedelta(seconds=calcular_espera(intentos)),
+                ultimo_error=repr(exc),
+            )
+        return 0
+    invalidar_libros(*(p.libro_pk for p in pendientes))
+
+    # Sólo se retiran las filas que no cambiaron durante el envío (un DELETE)
+    sin_cambios = reduce(or_, (Q(pk=p.pk, actualizado=p.actualizado) for p in pendientes))
+    SincronizacionPendiente.objects.filter(sin_cambios).delete()
+    return len(pendientes)
+
+
+def procesar_propagaciones(db, tamano_lote=LIMITE_LOTE_FIRESTORE):
+    """Copia el nombre nuevo de un autor o categoría a una página de sus libros en Firestore.
+
+    Cada documento se reescribe entero (set() en un WriteBatch): Firestore cobra lo mismo
+    por escritura, y un update() de sólo el nombre y el hash dejaría marcado como al día
+    un documento desviado en otros campos, que reconcile_firestore (compara sólo el
+    hash) ya no repararía. Devuelve cuántos libros se escribieron, o None si no queda
+    ninguna propagación pendiente. Si el commit falla, la página pasa a la outbox y se
+    sigue adelante.
+    """
+    tamano_lote = min(tamano_lote, LIMITE_LOTE_FIRESTORE)
+    propagacion = PropagacionPendiente.objects.order_by('actualizado', 'pk').first()
+    if propagacion is None:
+        return None
+    version = PropagacionPendiente.objects.filter(pk=propagacion.pk, actualizado=propagacion.actualizado)
+
+    modelo = Autor if propagacion.campo == PropagacionPendiente.AUTOR else Categoria
+    if not modelo.objects.filter(pk=propagacion.objeto_pk).exists():
+        # Borrado: sus libros desaparecieron (autor) o se marcaron para reconcile_firestore (categoría)
+        version.delete()
+        return 0
+
+    # Índice de la clave foránea: (objeto, pk) se recorre en orden sin ordenar en memoria
+    libros = list(
+        Libro.objects.select_related('autor', 'categoria')
+        .filter(**{f'{propagacion.campo}_id': propagacion.objeto_pk}, pk__gt=propagacion.ultimo_libro_pk)
+        .order_by('pk')[:tamano_lote]
+    )
+    if libros:
+        coleccion = db.collection('libros')
+        batch = db.batch()
+        for libro in libros:
+            batch.set(coleccion.document(str(libro.pk)), libro.datos_firestore())
+        try:
+            with medir_firestore('batch_commit'):
+                batch.commit()
+        except Exception as exc:
+            logger.warning("Fallo al propagar %s %s a %d libros: %s; pasan a la outbox",
+                           propagacion.campo, propagacion.objeto_pk, len(libros), exc)
+            SincronizacionPendiente.encolar([libro.pk for libro in libros], SincronizacionPendiente.GUARDAR)
+        else:
+            invalidar_libros(*(libro.pk for libro in libros))
+
+    # Si se volvió a renombrar mientras tanto, la fila cambió y empezará de nuevo desde el principio
+    if len(libros) < tamano_lote:
+        version.delete()
+    else:
+        version.update(ultimo_libro_pk=libros[-1].pk)
+    return len(libros)
+
+
+def estado_cola():
+    """Resumen de la outbox (filas pendientes, con error y retraso del más antiguo) y propagaciones."""
+    pendientes = SincronizacionPendiente.objects.all()
+    mas_antiguo = pendientes.aggregate(minimo=Min('creado'))['minimo']
+    return {
+        'pendientes': pendientes.count(),
+        'con_errores': pendientes.filter(intentos__gt=0).count(),
+        'retraso': (timezone.now() - mas_antiguo).total_seconds() if mas_antiguo else 0.0,
+        'propagaciones': PropagacionPendiente.objects.count(),
+    }
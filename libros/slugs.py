@@ -0,0 +1,127 @@
+# libros/slugs.py
+
+import re
+from functools import reduce
+from operator import or_
+
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Q
+from django.utils.text import slugify
+
+
+REINTENTOS = 5
+MAX_SUFIJO = 8          # "-" + hasta 7 dígitos
+# Términos OR por consulta: SQLite anida cada OR y rechaza árboles de más de 1000 niveles
+TERMINOS_POR_CONSULTA = 400
+
+
+def _base(modelo, texto, max_length):
+    return slugify(texto)[:max_length].strip('-') or modelo._meta.model_name
+
+
+def _candidato(base, n, max_length):
+    """Slug número `n` para `base` (1 es la base sola), recortando para que quepa el sufijo."""
+    if n == 1:
+        return base
+    sufijo = f"-{n}"
+    return base[:max_length - len(sufijo)].rstrip('-') + sufijo
+
+
+def _prefijos(base, max_length):
+    """Lo que precede a "-N" en los slugs con sufijo de `base` (varios si hay que recortarla)."""
+    return {base[:max_length - 1 - digitos].rstrip('-') for digitos in range(1, MAX_SUFIJO)}
+
+
+def _terminos_ocupados(base, max_length, vendor):
+    """La base y sus "<base>-<n>": no todos los slugs que empiezan igual ("el-…", "la-…").
+
+    Devuelve un Q por término (hasta MAX_SUFIJO si la base va recortada). Puede traer
+    algún "<base>-<dígito>…" de más ("el-1984-y-otros"); no molesta, porque sólo se usa
+    para saber si un candidato "<base>-<n>" está ocupado.
+    """
+    terminos = [Q(slug=base)]
+    for prefijo in _prefijos(base, max_length):
+        if vendor == 'sqlite':
+            # El LIKE de SQLite no distingue mayúsculas y no usa el índice: un rango sobre el
+            # índice único sí, y con la collation BINARY ':' es el carácter siguiente a '9'
+            terminos.append(Q(slug__gte=f"{prefijo}-0", slug__lt=f"{prefijo}-:"))
+        else:
+            # El LIKE del prefijo usa el índice *_like; la expresión regular deja sólo los sufijos
+            terminos.append(Q(slug__startswith=f"{prefijo}-", slug__regex=rf"^{re.escape(prefijo)}-[0-9]+$"))
+    return terminos
+
+
+def _filtros_por_consulta(bases, max_length, vendor):
+    """Agrupa los términos de `bases` en filtros de como mucho TERMINOS_POR_CONSULTA."""
+    grupo = []
+    for base in bases:
+        terminos = _terminos_ocupados(base, max_length, vendor)
+        if grupo and len(grupo) + len(terminos) > TERMINOS_POR_CONSULTA:
+            yield reduce(or_, grupo)
+            grupo = []
+        grupo.extend(terminos)
+    if grupo:
+        yield reduce(or_, grupo)
+
+
+def asignar_slugs(modelo, textos, excluir_pks=()):
+    """Calcula slugs únicos para `textos` (en orden) sin una consulta por intento.
+
+    Se hace una sola consulta por cada TERMINOS_POR_CONSULTA términos (una base corta
+    aporta dos; una recortada, hasta ocho), que sólo trae cada base y sus variantes
+    con sufijo numérico; las colisiones se resuelven con
+    el primer sufijo libre (-2, -3, …), también entre los propios textos, así que sirve
+    igual para bulk_create. Un título que ya acaba en número ("apollo-13") no adelanta
+    el contador de otra base ("apollo" sigue con -2). Los slugs actuales de
+    `excluir_pks` no cuentan como ocupados (reasignación).
+    """
+    max_length = modelo._meta.get_field('slug').max_length
+    bases = [_base(modelo, texto, max_length) for texto in textos]
+    distintas = list(dict.fromkeys(bases))
+
+    vendor = connections[modelo.objects.db].vendor
+    ocupados = set()
+    for filtro in _filtros_por_consulta(distintas, max_length, vendor):
+        existentes = modelo.objects.filter(filtro)
+        if excluir_pks:
+            existentes = existentes.exclude(pk__in=excluir_pks)
+        ocupados.update(existentes.values_list('slug', flat=True))
+
+    siguiente = {base: 1 for base in distintas}
+    slugs = []
+    for base in bases:
+        slug = _candidato(base, siguiente[base], max_length)
+        while slug in ocupados:
+            siguiente[base] += 1
+            slug = _candidato(base, siguiente[base], max_length)
+        ocupados.add(slug)
+        siguiente[base] += 1
+        slugs.append(slug)
+    return slugs
+
+
+def asignar_slug(modelo, texto, excluir_pk=None):
+    return asignar_slugs(modelo, [texto], [] if excluir_pk is None else [excluir_pk])[0]
+
+
+def guardar_con_slug_unico(instancia, texto, guardar):
+    """Asigna el slug si falta y guarda; si otro proceso lo ocupó a la vez, reintenta.
+
+    `guardar` es el save() original del modelo. Cada intento va en su propio
+    savepoint para que un IntegrityError no rompa la transacción exterior.
+    """
+    modelo = type(instancia)
+    automatico = not instancia.slug
+    if automatico:
+        instancia.slug = asignar_slug(modelo, texto, instancia.pk)
+
+    for intento in range(REINTENTOS):
+        try:
+            with transaction.atomic():
+                guardar()
+            return
+        except IntegrityError:
+            colision = modelo.objects.filter(slug=instancia.slug).exclude(pk=instancia.pk).exists()
+            if not (automatico and colision) or intento == REINTENTOS - 1:
+                raise
+            instancia.slug = asignar_slug(modelo, texto, instancia.pk)
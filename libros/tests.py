@@ -1,9 +1,44 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+import msgpack
+from asgiref.sync import async_to_sync, sync_to_async
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.http import Http404
+from django.test import AsyncRequestFactory, Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from django.contrib.auth.models import User
+from django.contrib.auth.models import AnonymousUser, User
+from django.utils import timezone
 from django.utils.text import slugify 
-from .models import Autor, Categoria, Libro 
+from .models import (
+    Autor, Categoria, EstadoReconciliacion, Libro, PropagacionPendiente, SincronizacionPendiente,
+)
+from . import catalogo
+from .cache import estadisticas_detalle
+from .facetas import obtener_facetas
+from .paginacion import codificar_cursor
+from .services import firebase_db
+from .services.firebase_db import estadisticas_libros, invalidar_libros, obtener_libros
+from .services.firestore_memoria import ClienteFirestoreMemoria
+from .services.reconciliacion import reconciliar
+from .services.sincronizacion import procesar_pendientes, procesar_propagaciones
+from .slugs import TERMINOS_POR_CONSULTA, _filtros_por_consulta, asignar_slugs
+from . import views_async
+from .views_async import detalle_libro, lista_libros
+from .views_firebase import LibroListViewFirebaseAsync, TAMANO_PAGINA, invalidar_paginas
 from django.db.utils import IntegrityError 
+from digital_library.firebase_config import get_firebase_db, reiniciar_clientes
 
 
 # ====================================================================
@@ -134,4 +169,1246 @@ class LibroViewTest(TestCase):
     def test_crear_libro_redirect_anon(self):
         response = self.client.get(reverse('libros:crear_libro'))
         self.assertEqual(response.status_code, 302)
-        self.assertTrue(response.url.startswith('/accounts/login/') or response.url.startswith('/login/'))
\ No newline at end of file
+        self.assertTrue(response.url.startswith('/accounts/login/') or response.url.startswith('/login/'))
+
+# ====================================================================
+# III. PRUEBAS DE LA OUTBOX DE SINCRONIZACIÓN CON FIRESTORE
+# ====================================================================
+
+@override_settings(FIREBASE_CONFIG={'SYNC_ENABLED': True})
+class SincronizacionFirestoreTest(TestCase):
+    def setUp(self):
+        self.autor = Autor.objects.create(nombre="Isabel Allende")
+        self.libro = Libro.objects.create(
+            titulo="La casa de los espíritus",
+            isbn="9788401242267",
+            fecha_publicacion="1982-01-01",
+            autor=self.autor,
+        )
+
+    def test_escrituras_repetidas_se_fusionan(self):
+        self.libro.titulo = "La casa de los espíritus (2ª ed.)"
+        self.libro.save()
+        self.assertEqual(SincronizacionPendiente.objects.count(), 1)
+
+    def test_delete_encola_eliminacion(self):
+        pk = self.libro.pk
+        self.libro.delete()
+        pendiente = SincronizacionPendiente.objects.get(libro_pk=pk)
+        self.assertEqual(pendiente.operacion, SincronizacionPendiente.ELIMINAR)
+
+    def test_procesar_pendientes_envia_un_lote(self):
+        db = mock.MagicMock()
+        self.assertEqual(procesar_pendientes(db), 1)
+        db.batch.return_value.set.assert_called_once()
+        db.batch.return_value.commit.assert_called_once()
+        self.assertFalse(SincronizacionPendiente.objects.exists())
+
+    def test_fallo_reprograma_con_backoff(self):
+        db = mock.MagicMock()
+        db.batch.return_value.commit.side_effect = RuntimeError("sin red")
+        self.assertEqual(procesar_pendientes(db), 0)
+        pendiente = SincronizacionPendiente.objects.get()
+        self.assertEqual(pendiente.intentos, 1)
+        self.assertGreater(pendiente.siguiente_intento, timezone.now())
+        self.assertIn("sin red", pendiente.ultimo_error)
+
+
+# ====================================================================
+# IV. PRUEBAS DEL COMANDO import_libros
+# ====================================================================
+
+class ImportLibrosCommandTest(TestCase):
+    def _archivo(self, sufijo, contenido):
+        archivo = tempfile.NamedTemporaryFile('w', suffix=sufijo, delete=False, encoding='utf-8')
+        archivo.write(contenido)
+        archivo.close()
+        self.addCleanup(os.remove, archivo.name)
+        return archivo.name
+
+    def test_importa_csv_y_crea_relaciones(self):
+        ruta = self._archivo('.csv', (
+            "titulo,isbn,fecha_publicacion,autor,categoria\n"
+            "Rayuela,9788437604572,1963-06-28,Julio Cortázar,Novela\n"
+            "Rayuela,9788437604573,1963-06-28,Julio Cortázar,Novela\n"
+            "Sin fecha,9788437604574,,Julio Cortázar,Novela\n"
+        ))
+        call_command('import_libros', ruta, lote=2, stdout=StringIO())
+        self.assertEqual(Libro.objects.count(), 2)
+        self.assertEqual(Autor.objects.count(), 1)
+        self.assertEqual(Categoria.objects.count(), 1)
+        # Dos ediciones con el mismo título reciben slugs distintos
+        self.assertEqual(len(set(Libro.objects.values_list('slug', flat=True))), 2)
+
+    def test_reimportar_jsonl_actualiza_por_isbn(self):
+        fila = {'titulo': "Ficciones", 'isbn': "9788420633121",
+                'fecha_publicacion': "1944-01-01", 'autor': "Jorge Luis Borges"}
+        ruta = self._archivo('.jsonl', json.dumps(fila) + "\n")
+        call_command('import_libros', ruta, stdout=StringIO())
+        slug = Libro.objects.get().slug
+
+        fila['titulo'] = "Ficciones (edición anotada)"
+        ruta = self._archivo('.jsonl', json.dumps(fila) + "\n")
+        call_command('import_libros', ruta, stdout=StringIO())
+
+        libro = Libro.objects.get()
+        self.assertEqual(libro.titulo, "Ficciones (edición anotada)")
+        self.assertEqual(libro.slug, slug)
+
+
+# ====================================================================
+# V. PRUEBAS DE PAGINACIÓN KEYSET EN LibroListView
+# ====================================================================
+
+class LibroListViewKeysetTest(TestCase):
+    def setUp(self):
+        autor = Autor.objects.create(nombre="Julio Verne")
+        categoria = Categoria.objects.create(nombre="Aventuras")
+        for i in range(1, 26):
+            Libro.objects.create(
+                titulo=f"Viaje {i}",
+                isbn=f"978100000{i:04d}",
+                fecha_publicacion="1870-01-01",
+                autor=autor,
+                categoria=categoria,
+            )
+
+    def test_cursor_devuelve_la_pagina_siguiente(self):
+        response = self.client.get(reverse('home'))
+        cursor = response.context['siguiente_cursor']
+        response = self.client.get(reverse('home'), {'after': cursor})
+        titulos = [libro.titulo for libro in response.context['libros']]
+        self.assertEqual(titulos, [f"Viaje {i}" for i in range(11, 21)])
+        self.assertEqual(response.context['total_libros'], 25)
+
+    def test_ultima_pagina_sin_cursor_siguiente(self):
+        ultimo = Libro.objects.order_by('pk')[19]
+        response = self.client.get(reverse('home'), {'after': codificar_cursor(ultimo.pk)})
+        self.assertEqual(len(response.context['libros']), 5)
+        self.assertIsNone(response.context['siguiente_cursor'])
+
+    def test_cursor_invalido_404(self):
+        response = self.client.get(reverse('home'), {'after': '%%%'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_sin_n_mas_1_y_conteo_cacheado(self):
+        self.client.get(reverse('home'))
+        # Con el conteo ya en caché, la página entera es una sola consulta con JOIN
+        with self.assertNumQueries(1):
+            self.client.get(reverse('home'), {'page': 2})
+
+
+# ====================================================================
+# VI. PRUEBAS DE LA BÚSQUEDA DE TEXTO COMPLETO
+# ====================================================================
+
+class BusquedaLibrosTest(TestCase):
+    def setUp(self):
+        self.autor = Autor.objects.create(nombre="Gabriel García Márquez")
+        Libro.objects.create(titulo="Cien años de soledad", isbn="9780307474728",
+                             fecha_publicacion="1967-05-30", autor=self.autor)
+        Libro.objects.create(titulo="El amor en los tiempos del cólera", isbn="9780307387264",
+                             fecha_publicacion="1985-01-01", autor=self.autor)
+
+    def _titulos(self, consulta):
+        response = self.client.get(reverse('libros:buscar_libros'), {'q': consulta})
+        self.assertEqual(response.status_code, 200)
+        return [libro.titulo for libro in response.context['libros']]
+
+    def test_busqueda_sin_acentos_y_por_prefijo(self):
+        self.assertEqual(self._titulos("anos soled"), ["Cien años de soledad"])
+        self.assertEqual(self._titulos("colera"), ["El amor en los tiempos del cólera"])
+
+    def test_busqueda_por_autor_e_isbn(self):
+        self.assertEqual(len(self._titulos("marquez")), 2)
+        self.assertEqual(self._titulos("9780307474728"), ["Cien años de soledad"])
+
+    def test_indice_sigue_el_cambio_de_nombre_del_autor(self):
+        self.autor.nombre = "Gabo"
+        self.autor.save()
+        self.assertEqual(len(self._titulos("gabo")), 2)
+        self.assertEqual(self._titulos("marquez"), [])
+
+    def test_indice_sigue_el_borrado(self):
+        Libro.objects.filter(isbn="9780307474728").delete()
+        self.assertEqual(self._titulos("soledad"), [])
+
+    def test_consulta_con_sintaxis_fts_no_falla(self):
+        self.assertEqual(self._titulos('"soledad OR ( NEAR'), [])
+
+    def test_admin_usa_el_indice(self):
+        User.objects.create_superuser(username='admin', password='password123', email='admin@test.com')
+        self.client.login(username='admin', password='password123')
+        response = self.client.get(reverse('admin:libros_libro_changelist'), {'q': 'soledad'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+
+# ====================================================================
+# VII. PRUEBAS DE LA CACHÉ DE detalle_libro
+# ====================================================================
+
+class DetalleLibroCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.autor = Autor.objects.create(nombre="Mario Vargas Llosa")
+        self.categoria = Categoria.objects.create(nombre="Novela")
+        self.libro = Libro.objects.create(titulo="La ciudad y los perros", isbn="9788420412146",
+                                          fecha_publicacion="1963-01-01", autor=self.autor,
+                                          categoria=self.categoria)
+        self.url = reverse('libros:detalle_libro', kwargs={'slug': self.libro.slug})
+
+    def test_acierto_sin_consultas(self):
+        self.client.get(self.url)
+        antes = estadisticas_detalle()
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertContains(response, "La ciudad y los perros")
+        self.assertEqual(estadisticas_detalle()['aciertos'], antes['aciertos'] + 1)
+
+    def test_guardar_libro_invalida(self):
+        self.client.get(self.url)
+        self.libro.titulo = "La ciudad y los perros (edición conmemorativa)"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.libro.save()
+        self.assertContains(self.client.get(self.url), "edición conmemorativa")
+
+    def test_invalida_al_confirmar_la_transaccion(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.libro.titulo = "La ciudad y los perros (edición conmemorativa)"
+            self.libro.save()
+            # Antes del COMMIT la entrada sigue ahí: una lectura concurrente que cacheara
+            # ahora la fila antigua quedaría borrada al confirmar
+            self.assertNotContains(self.client.get(self.url), "edición conmemorativa")
+        self.assertContains(self.client.get(self.url), "edición conmemorativa")
+
+    def test_renombrar_autor_o_categoria_invalida(self):
+        self.client.get(self.url)
+        self.autor.nombre = "M. Vargas Llosa"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.autor.save()
+        self.assertContains(self.client.get(self.url), "M. Vargas Llosa")
+        self.categoria.nombre = "Narrativa"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.categoria.save()
+        self.assertContains(self.client.get(self.url), "Narrativa")
+
+    def test_borrar_autor_invalida(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.autor.delete()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_fallo_de_cache_lee_de_la_primaria(self):
+        # Con una réplica configurada (inexistente aquí), leerla haría fallar la consulta
+        with mock.patch('core.db_router.replicas', return_value=['replica_0']):
+            self.assertContains(self.client.get(self.url), "La ciudad y los perros")
+
+    def test_variante_superusuario(self):
+        self.client.get(self.url)
+        User.objects.create_superuser(username='admin', password='password123', email='admin@test.com')
+        self.client.login(username='admin', password='password123')
+        self.assertContains(self.client.get(self.url), "Editar Libro")
+        self.client.logout()
+        self.assertNotContains(self.client.get(self.url), "Editar Libro")
+
+
+# ====================================================================
+# VIII. PRUEBAS DEL LISTADO PAGINADO DESDE FIRESTORE
+# ====================================================================
+
+class LibroListViewFirebaseTest(TestCase):
+    def setUp(self):
+        invalidar_paginas()
+        self.db = mock.MagicMock()
+        self.consulta = self.db.collection.return_value.order_by.return_value.select.return_value
+        patcher = mock.patch('libros.views_firebase.get_firebase_db', return_value=self.db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _documentos(self, n):
+        documentos = []
+        for i in range(n):
+            doc = mock.Mock(id=str(i))
+            doc.to_dict.return_value = {'titulo': f"Libro {i}", 'autor': "Anónimo", 'slug': f"libro-{i:02d}"}
+            documentos.append(doc)
+        return documentos
+
+    def test_lee_solo_una_pagina_y_la_cachea(self):
+        self.consulta.limit.return_value.stream.return_value = self._documentos(TAMANO_PAGINA + 1)
+        response = self.client.get(reverse('libros:lista_libros_firebase'))
+        self.assertEqual(len(response.context['libros']), TAMANO_PAGINA)
+        self.assertEqual(response.context['siguiente_cursor'], f"libro-{TAMANO_PAGINA - 1:02d}")
+        self.consulta.limit.assert_called_once_with(TAMANO_PAGINA + 1)
+
+        self.client.get(reverse('libros:lista_libros_firebase'))
+        self.assertEqual(self.consulta.limit.call_count, 1)
+
+    def test_cursor_usa_start_after(self):
+        self.consulta.start_after.return_value.limit.return_value.stream.return_value = self._documentos(3)
+        response = self.client.get(reverse('libros:lista_libros_firebase'), {'after': 'libro-11'})
+        self.consulta.start_after.assert_called_once_with({'slug': 'libro-11'})
+        self.assertIsNone(response.context['siguiente_cursor'])
+
+
+# ====================================================================
+# IX. PRUEBAS DEL ASIGNADOR DE SLUGS ÚNICOS
+# ====================================================================
+
+class AsignacionSlugsTest(TestCase):
+    def setUp(self):
+        self.autor = Autor.objects.create(nombre="Miguel de Cervantes")
+
+    def _crear(self, isbn, titulo="Don Quijote"):
+        return Libro.objects.create(titulo=titulo, isbn=isbn, fecha_publicacion="1605-01-16", autor=self.autor)
+
+    def test_titulos_repetidos_reciben_sufijo(self):
+        slugs = [self._crear(f"978000000000{i}").slug for i in range(3)]
+        self.assertEqual(slugs, ["don-quijote", "don-quijote-2", "don-quijote-3"])
+
+    def test_asignacion_en_bloque_con_una_consulta(self):
+        self._crear("9780000000001")
+        with self.assertNumQueries(1):
+            slugs = asignar_slugs(Libro, ["Don Quijote", "Don Quijote", "Novelas ejemplares"])
+        self.assertEqual(slugs, ["don-quijote-2", "don-quijote-3", "novelas-ejemplares"])
+
+    def test_slug_largo_se_recorta_para_el_sufijo(self):
+        titulo = "x" * 200
+        self._crear("9780000000001", titulo)
+        slug = self._crear("9780000000002", titulo).slug
+        self.assertEqual(len(slug), 200)
+        self.assertTrue(slug.endswith("-2"))
+
+    def test_solo_lee_la_base_y_sus_sufijos(self):
+        for i, titulo in enumerate(["Don", "Don Quijote", "Don 1984 y otros", "Don 2"]):
+            self._crear(f"978000000010{i}", titulo)
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(asignar_slugs(Libro, ["Don"]), ["don-3"])
+        # "don-quijote" no se lee; "don-1984-y-otros" sólo con el rango de SQLite
+        filtro, = _filtros_por_consulta(["don"], 200, connection.vendor)
+        ocupados = set(Libro.objects.filter(filtro)
+                       .values_list('slug', flat=True))
+        self.assertTrue({"don", "don-2"} <= ocupados <= {"don", "don-2", "don-1984-y-otros"})
+        self.assertEqual(len(consultas), 1)
+
+    def test_muchos_titulos_largos_se_reparten_en_varias_consultas(self):
+        # Cada base recortada aporta ocho términos OR: 200 juntas superan la profundidad de SQLite
+        titulos = [f"{i:03d} " + "x" * 196 for i in range(200)]
+        self._crear("9780000000001", titulos[0])
+        with CaptureQueriesContext(connection) as consultas:
+            slugs = asignar_slugs(Libro, titulos)
+        self.assertEqual(len(set(slugs)), 200)
+        self.assertTrue(slugs[0].endswith("-2"))
+        self.assertEqual(len(consultas), -(-200 * 8 // TERMINOS_POR_CONSULTA))
+
+    def test_titulo_con_numero_no_adelanta_el_contador(self):
+        self._crear("9780000000001", "Apollo 13")
+        self._crear("9780000000002", "Apollo")
+        self.assertEqual(self._crear("9780000000003", "Apollo").slug, "apollo-2")
+
+    def test_colision_concurrente_se_reintenta(self):
+        self._crear("9780000000001")
+        # Simula a otro proceso que ocupó el slug entre el cálculo y el INSERT
+        with mock.patch('libros.slugs.asignar_slug', side_effect=["don-quijote", "don-quijote-2"]):
+            libro = self._crear("9780000000002")
+        self.assertEqual(libro.slug, "don-quijote-2")
+
+    def test_autores_homonimos(self):
+        otro = Autor.objects.create(nombre="Miguel de Cervantes")
+        self.assertEqual(otro.slug, "miguel-de-cervantes-2")
+
+
+# ====================================================================
+# X. PRUEBAS DE LA EXPORTACIÓN EN STREAMING
+# ====================================================================
+
+class ExportacionLibrosTest(TestCase):
+    def setUp(self):
+        self.autor = Autor.objects.create(nombre="Pablo Neruda")
+        categoria = Categoria.objects.create(nombre="Poesía")
+        for i in range(3):
+            Libro.objects.create(titulo=f"Canto {i}", isbn=f"978200000000{i}",
+                                 fecha_publicacion="1950-01-01", autor=self.autor, categoria=categoria)
+
+    def _contenido(self, response):
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson(self):
+        response = self.client.get(reverse('libros:exportar_libros', args=['ndjson']))
+        filas = [json.loads(linea) for linea in self._contenido(response).splitlines()]
+        self.assertEqual(len(filas), 3)
+        self.assertEqual(filas[0]['autor'], "Pablo Neruda")
+        self.assertEqual(filas[0]['categoria_slug'], "poesia")
+
+    def test_csv(self):
+        response = self.client.get(reverse('libros:exportar_libros', args=['csv']))
+        lineas = self._contenido(response).splitlines()
+        self.assertTrue(lineas[0].startswith("id,titulo,isbn"))
+        self.assertEqual(len(lineas), 4)
+
+    def test_updated_since_incluye_cambios_de_autor(self):
+        corte = timezone.now()
+        Libro.objects.update(actualizado=corte - timezone.timedelta(days=1))
+        url = reverse('libros:exportar_libros', args=['ndjson'])
+        self.assertEqual(self._contenido(self.client.get(url, {'updated_since': corte.isoformat()})), "")
+
+        self.autor.nombre = "Neftalí Reyes"
+        self.autor.save()
+        filas = self._contenido(self.client.get(url, {'updated_since': corte.isoformat()})).splitlines()
+        self.assertEqual(len(filas), 3)
+
+    def test_fecha_invalida_400(self):
+        response = self.client.get(reverse('libros:exportar_libros', args=['ndjson']), {'updated_since': 'ayer'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_comando(self):
+        salida = StringIO()
+        call_command('exportar_libros', formato='csv', stdout=salida)
+        self.assertEqual(len(salida.getvalue().splitlines()), 4)
+
+    def test_vista_asincrona_con_iterador_asincrono(self):
+        request = AsyncRequestFactory().get('/libros/exportar/csv/')
+
+        async def exportar():
+            response = await views_async.exportar_libros(request, 'csv')
+            # Un iterador síncrono se consumiría entero antes del primer byte
+            self.assertTrue(response.is_async)
+            return b''.join([bloque async for bloque in response])
+
+        self.assertEqual(len(async_to_sync(exportar)().decode().splitlines()), 4)
+
+
+# ====================================================================
+# XI. PRUEBA DEL BENCHMARK DE VISTAS
+# ====================================================================
+
+class BenchmarkLibrosCommandTest(TestCase):
+    def test_emite_json_por_escenario(self):
+        salida = StringIO()
+        call_command('benchmark_libros', bd_actual=True, autores=3, categorias=2, libros=30,
+                     peticiones=3, stdout=salida)
+        resultado = json.loads(salida.getvalue())
+        self.assertEqual(resultado['meta']['libros'], 30)
+        for nombre in ('home', 'detalle_libro_caliente', 'crear_libro', 'editar_libro'):
+            self.assertIn('p95_ms', resultado['escenarios'][nombre])
+        self.assertEqual(resultado['escenarios']['detalle_libro_caliente']['consultas_max'], 0)
+        # Todas las peticiones frías consultan la BD aunque la muestra repita slugs
+        frio = resultado['escenarios']['detalle_libro_frio']
+        self.assertGreater(frio['consultas_media'], 0)
+        self.assertEqual(frio['consultas_media'], frio['consultas_max'])
+        # Las altas y ediciones (también las de la muestra de memoria) caben en un lote,
+        # y sólo se mide ese lote, no las rondas con la outbox ya vacía
+        lotes = resultado['escenarios']['sync_firestore_lote']
+        self.assertEqual((lotes['n'], lotes['commits']), (1, 1))
+        self.assertGreaterEqual(lotes['operaciones'], 6)
+
+    def test_resumen_con_un_escenario_sin_muestras(self):
+        ruta = os.path.join(tempfile.mkdtemp(prefix='benchmark-'), 'resultado.json')
+        self.addCleanup(shutil.rmtree, os.path.dirname(ruta), True)
+        salida = StringIO()
+        # Outbox vacía: no hay ningún lote que medir
+        with mock.patch('libros.management.commands.benchmark_libros.procesar_pendientes', return_value=0):
+            call_command('benchmark_libros', bd_actual=True, autores=2, categorias=1, libros=10,
+                         peticiones=2, salida=ruta, stdout=salida)
+        self.assertIn("sync_firestore_lote", salida.getvalue())
+        with open(ruta, encoding='utf-8') as archivo:
+            self.assertEqual(json.load(archivo)['escenarios']['sync_firestore_lote']['n'], 0)
+
+
+# ====================================================================
+# XII. PRUEBAS DE LAS VISTAS ASÍNCRONAS (ASGI)
+# ====================================================================
+
+class VistasAsincronasTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        autor = Autor.objects.create(nombre="Emilia Pardo Bazán")
+        categoria = Categoria.objects.create(nombre="Novela")
+        for i in range(1, 13):
+            Libro.objects.create(
+                titulo=f"Pazos {i}", isbn=f"978200000{i:04d}", fecha_publicacion="1886-01-01",
+                autor=autor, categoria=categoria,
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def _peticion(self, ruta, **params):
+        request = AsyncRequestFactory().get(ruta, params)
+
+        async def auser():
+            return AnonymousUser()
+        request.auser = auser
+        return request
+
+    async def test_lista_pagina_por_offset_y_por_cursor(self):
+        response = await lista_libros(self._peticion('/'))
+        self.assertContains(response, "Pazos 10")
+        self.assertNotContains(response, "Pazos 11")
+        ultimo = await Libro.objects.order_by('pk').values_list('pk', flat=True)[9:10].aget()
+        self.assertContains(response, f"?after={codificar_cursor(ultimo)}")
+
+        response = await lista_libros(self._peticion('/', after=codificar_cursor(ultimo)))
+        self.assertContains(response, "Pazos 12")
+        self.assertContains(response, "12 libros")
+
+    async def test_lista_cursor_invalido_404(self):
+        with self.assertRaises(Http404):
+            await lista_libros(self._peticion('/', after='%%%'))
+
+    async def test_detalle_y_cache_compartida(self):
+        libro = await Libro.objects.aget(titulo="Pazos 3")
+        response = await detalle_libro(self._peticion('/'), libro.slug)
+        self.assertContains(response, "Emilia Pardo Bazán")
+        self.assertEqual((await sync_to_async(estadisticas_detalle)())['fallos'], 1)
+
+        # La vista síncrona reutiliza la entrada guardada por la asíncrona
+        await sync_to_async(self.client.get)(reverse('libros:detalle_libro', args=[libro.slug]))
+        self.assertEqual((await sync_to_async(estadisticas_detalle)())['aciertos'], 1)
+
+        with self.assertRaises(Http404):
+            await detalle_libro(self._peticion('/'), 'no-existe')
+
+    async def test_listado_firestore_con_cliente_asincrono(self):
+        invalidar_paginas()
+        db = mock.MagicMock()
+        documentos = []
+        for i in range(3):
+            doc = mock.Mock(id=str(i))
+            doc.to_dict.return_value = {'titulo': f"Doc {i}", 'autor': "Anónimo", 'slug': f"doc-{i}"}
+            documentos.append(doc)
+
+        async def stream():
+            for doc in documentos:
+                yield doc
+        consulta = db.collection.return_value.order_by.return_value.select.return_value
+        consulta.limit.return_value.stream = stream
+
+        with mock.patch('libros.views_firebase.get_firebase_db_async', return_value=db):
+            response = await LibroListViewFirebaseAsync.as_view()(self._peticion('/libros/firebase/'))
+        self.assertContains(response, "Doc 2")
+        consulta.limit.assert_called_once_with(TAMANO_PAGINA + 1)
+
+
+# ====================================================================
+# XIII. PRUEBAS DE LA RECONCILIACIÓN CON FIRESTORE
+# ====================================================================
+
+class ReconciliacionFirestoreTest(TestCase):
+    def setUp(self):
+        autor = Autor.objects.create(nombre="Benito Pérez Galdós")
+        for i in range(1, 8):
+            Libro.objects.create(
+                titulo=f"Episodio {i}", isbn=f"978300000{i:04d}", fecha_publicacion="1873-01-01",
+                autor=autor,
+            )
+        self.db = ClienteFirestoreMemoria()
+        self.coleccion = self.db.collection('libros')
+
+    def test_pasada_completa_escribe_reescribe_y_borra_huerfanos(self):
+        resumen = reconciliar(self.db, tamano=3)
+        self.assertEqual((resumen['revisados'], resumen['reescritos']), (7, 7))
+
+        primero, segundo = Libro.objects.order_by('pk')[:2]
+        # Deriva típica: update() masivo, documento alterado y documento sin libro
+        Libro.objects.filter(pk=primero.pk).update(titulo="Trafalgar")
+        self.coleccion.document(str(segundo.pk)).update({'titulo': "Alterado", 'hash': 'x'})
+        self.coleccion.document('999999').set({'titulo': "Huérfano"})
+        self.coleccion.document('un-slug-antiguo').set({'titulo': "Huérfano"})
+
+        escrituras = self.db.escrituras
+        resumen = reconciliar(self.db, completo=True, tamano=3)
+        self.assertEqual((resumen['reescritos'], resumen['eliminados']), (2, 2))
+        self.assertEqual(self.db.escrituras - escrituras, 4)
+        self.assertEqual(self.coleccion.document(str(primero.pk)).get().to_dict()['titulo'], "Trafalgar")
+        self.assertFalse(self.coleccion.document('999999').get().exists)
+
+        # Ya no hay diferencias: sólo lecturas del campo hash
+        resumen = reconciliar(self.db, completo=True)
+        self.assertEqual((resumen['reescritos'], resumen['eliminados'], resumen['commits']), (0, 0, 0))
+
+    def test_incremental_desde_la_marca(self):
+        reconciliar(self.db)
+        # Marca en el futuro: sólo el libro tocado después queda dentro de la ventana
+        EstadoReconciliacion.objects.update(marca=timezone.now() + timedelta(hours=1))
+        libro = Libro.objects.order_by('pk').first()
+        Libro.objects.filter(pk=libro.pk).update(titulo="Zaragoza", actualizado=timezone.now() + timedelta(hours=2))
+
+        resumen = reconciliar(self.db)
+        self.assertFalse(resumen['completo'])
+        self.assertEqual((resumen['revisados'], resumen['reescritos']), (1, 1))
+
+    def test_simulacro_no_escribe_ni_mueve_la_marca(self):
+        resumen = reconciliar(self.db, simulacro=True)
+        self.assertEqual(resumen['reescritos'], 7)
+        self.assertEqual(self.db.escrituras, 0)
+        self.assertIsNone(EstadoReconciliacion.objects.get().marca)
+
+    def test_comando(self):
+        salida = StringIO()
+        with mock.patch('libros.management.commands.reconcile_firestore.get_firebase_db',
+                        return_value=self.db):
+            call_command('reconcile_firestore', stdout=salida)
+        self.assertIn("revisados=7 reescritos=7", salida.getvalue())
+
+
+# ====================================================================
+# XIV. PRUEBAS DE LA CACHÉ DE FRAGMENTOS EN home.html
+# ====================================================================
+
+class CacheFragmentosHomeTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.autor = Autor.objects.create(nombre="Rosalía de Castro")
+        self.categoria = Categoria.objects.create(nombre="Poesía")
+        self.libros = [
+            Libro.objects.create(
+                titulo=f"Cantares {i}", isbn=f"978400000{i:04d}", fecha_publicacion="1863-01-01",
+                autor=self.autor, categoria=self.categoria,
+            )
+            for i in range(1, 4)
+        ]
+
+    def test_solo_se_repinta_el_libro_editado(self):
+        self.client.get(reverse('home'))
+        # update() no cambia la versión: la tarjeta cacheada sigue sirviéndose
+        Libro.objects.filter(pk=self.libros[0].pk).update(titulo="Sin versión")
+        self.assertNotContains(self.client.get(reverse('home')), "Sin versión")
+
+        libro = self.libros[1]
+        libro.titulo = "Follas novas"
+        libro.save()
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, "Follas novas")
+        self.assertNotContains(response, "Sin versión")
+
+    def test_renombrar_o_borrar_categoria_cambia_las_tarjetas(self):
+        self.client.get(reverse('home'))
+        self.categoria.nombre = "Lírica"
+        self.categoria.save()
+        self.assertContains(self.client.get(reverse('home')), "Categoría: Lírica")
+
+        self.categoria.delete()
+        self.assertNotContains(self.client.get(reverse('home')), "Lírica")
+
+    def test_borrado_masivo_de_categorias_en_el_admin(self):
+        self.client.get(reverse('home'))
+        antes = Libro.objects.get(pk=self.libros[0].pk).actualizado
+        admin = Client()
+        admin.force_login(User.objects.create_superuser('admin', 'admin@test.com', 'x'))
+        admin.post(reverse('admin:libros_categoria_changelist'), {
+            'action': 'delete_selected', '_selected_action': [self.categoria.pk], 'post': 'yes',
+        })
+        self.assertFalse(Categoria.objects.exists())
+        self.assertGreater(Libro.objects.get(pk=self.libros[0].pk).actualizado, antes)
+        self.assertNotContains(self.client.get(reverse('home')), "Categoría: Poesía")
+
+    def test_clave_de_pagina_solo_para_anonimos(self):
+        response = self.client.get(reverse('home'))
+        self.assertIsNotNone(response.context['clave_pagina'])
+
+        self.client.force_login(User.objects.create_user('lectora', password='x'))
+        self.assertIsNone(self.client.get(reverse('home')).context['clave_pagina'])
+
+
+# ====================================================================
+# XV. PRUEBAS DE LAS FACETAS DE home (CONTADORES Y FILTROS)
+# ====================================================================
+
+class FacetasHomeTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.cervantes = Autor.objects.create(nombre="Miguel de Cervantes")
+        self.quevedo = Autor.objects.create(nombre="Francisco de Quevedo")
+        self.novela = Categoria.objects.create(nombre="Novela")
+        self.poesia = Categoria.objects.create(nombre="Poesía")
+        for i in range(15):
+            Libro.objects.create(
+                titulo=f"Novela {i:02d}", isbn=f"978500000{i:04d}", fecha_publicacion=f"{1600 + i}-01-01",
+                autor=self.cervantes, categoria=self.novela,
+            )
+        Libro.objects.create(titulo="Sueños", isbn="9785000009999", fecha_publicacion="1627-01-01",
+                             autor=self.quevedo, categoria=self.poesia)
+
+    def _contadores(self):
+        return (
+            Autor.objects.get(pk=self.cervantes.pk).num_libros,
+            Categoria.objects.get(pk=self.novela.pk).num_libros,
+            Categoria.objects.get(pk=self.poesia.pk).num_libros,
+        )
+
+    def test_contadores_en_save_y_delete(self):
+        self.assertEqual(self._contadores(), (15, 15, 1))
+        libro = Libro.objects.get(titulo="Novela 00")
+        libro.categoria = self.poesia
+        libro.save()
+        self.assertEqual(self._contadores(), (15, 14, 2))
+        libro.delete()
+        self.assertEqual(self._contadores(), (14, 14, 1))
+
+        # El borrado en cascada del autor descuenta también en las categorías
+        self.cervantes.delete()
+        self.assertEqual(Categoria.objects.get(pk=self.novela.pk).num_libros, 0)
+
+    def test_borrado_masivo_de_autores_en_el_admin(self):
+        User.objects.create_superuser(username='admin', password='password123', email='admin@test.com')
+        self.client.login(username='admin', password='password123')
+        Libro.objects.filter(titulo__in=[f"Novela {i:02d}" for i in range(12, 15)]).update(autor=self.quevedo)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('admin:libros_autor_changelist'), {
+                'action': 'delete_selected', '_selected_action': [self.cervantes.pk], 'post': 'yes',
+            })
+        self.assertEqual(Categoria.objects.get(pk=self.novela.pk).num_libros, 3)
+        response = self.client.get(reverse('home'), {'categoria': 'novela'})
+        self.assertEqual(response.context['total_libros'], 3)
+        self.assertEqual(len(response.context['libros']), 3)
+
+    def test_renombrar_actualiza_las_facetas(self):
+        self.client.get(reverse('home'))
+        with self.captureOnCommitCallbacks(execute=True):
+            novela = Categoria.objects.get(pk=self.novela.pk)
+            novela.nombre = "Narrativa"
+            novela.save()
+        self.assertEqual([c['nombre'] for c in obtener_facetas()['categorias']], ["Narrativa", "Poesía"])
+
+    def test_recalcular_tras_importar(self):
+        Autor.objects.update(num_libros=0)
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8') as archivo:
+            archivo.write("titulo,isbn,fecha_publicacion,autor,categoria\n")
+            archivo.write("Rinconete,9785000008888,1613-01-01,Miguel de Cervantes,Novela\n")
+        self.addCleanup(os.remove, archivo.name)
+        call_command('import_libros', archivo.name, stdout=StringIO())
+        self.assertEqual(self._contadores(), (16, 16, 1))
+
+    def test_filtro_por_categoria_y_anos_con_cursor(self):
+        parametros = {'categoria': 'novela', 'desde': 1603, 'hasta': 1614}
+        response = self.client.get(reverse('home'), parametros)
+        titulos = [libro.titulo for libro in response.context['libros']]
+        self.assertEqual(titulos, [f"Novela {i:02d}" for i in range(3, 13)])
+        self.assertEqual(response.context['total_libros'], 12)
+        self.assertContains(response, "desde=1603")
+
+        response = self.client.get(reverse('home'), {**parametros, 'after': response.context['siguiente_cursor']})
+        self.assertEqual([l.titulo for l in response.context['libros']], ["Novela 13", "Novela 14"])
+
+    def test_total_de_una_faceta_sin_count(self):
+        self.client.get(reverse('home'))
+        # Slug -> id y la página: el total sale de Categoria.num_libros
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('home'), {'categoria': 'poesia'})
+        self.assertEqual(response.context['total_libros'], 1)
+        self.assertContains(response, "Poesía")
+
+    def test_slug_desconocido_lista_vacia(self):
+        response = self.client.get(reverse('home'), {'autor': 'no-existe'})
+        self.assertEqual(list(response.context['libros']), [])
+
+
+# ====================================================================
+# XVI. PRUEBAS DEL ADMIN DE LIBROS CON TABLAS GRANDES
+# ====================================================================
+
+class LibroAdminEscalableTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.novela = Categoria.objects.create(nombre="Novela")
+        self.autores = [Autor.objects.create(nombre=nombre) for nombre in ("Galdós", "García Márquez", "Borges")]
+        for i, autor in enumerate(self.autores * 2):
+            Libro.objects.create(titulo=f"Libro {i}", isbn=f"978600000{i:04d}", fecha_publicacion="2000-01-01",
+                                 autor=autor, categoria=self.novela)
+        User.objects.create_superuser(username='admin', password='password123', email='admin@test.com')
+        self.client.login(username='admin', password='password123')
+        self.url = reverse('admin:libros_libro_changelist')
+
+    def _consultas(self):
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.get(self.url)
+        return len(consultas)
+
+    def test_changelist_sin_n_mas_1(self):
+        antes = self._consultas()
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(10):
+                Libro.objects.create(titulo=f"Otro {i}", isbn=f"978610000{i:04d}", fecha_publicacion="2001-01-01",
+                                     autor=Autor.objects.create(nombre=f"Autor {i}"), categoria=self.novela)
+        self.assertEqual(self._consultas(), antes)
+
+    def test_formulario_con_autocompletado(self):
+        libro = Libro.objects.filter(autor=self.autores[0]).first()
+        response = self.client.get(reverse('admin:libros_libro_change', args=[libro.pk]))
+        self.assertContains(response, 'admin-autocomplete')
+        # Sólo se renderiza el autor seleccionado, no un <option> por autor
+        self.assertNotContains(response, "Borges")
+
+    def test_filtro_de_autor_con_busqueda(self):
+        response = self.client.get(self.url, {'autor_q': 'gar'})
+        filtro = response.context['cl'].filter_specs[1]
+        self.assertEqual([nombre for _, nombre in filtro.lookup_choices], ["García Márquez"])
+
+        response = self.client.get(self.url, {'autor': self.autores[2].pk})
+        self.assertEqual(response.context['cl'].result_count, 2)
+
+    def test_conteo_estimado_sin_filtros(self):
+        with mock.patch('libros.paginacion.estimar_filas', return_value=1_000_000):
+            response = self.client.get(self.url)
+            self.assertEqual(response.context['cl'].result_count, 1_000_000)
+            # Con filtros el conteo vuelve a ser exacto
+            response = self.client.get(self.url, {'autor': self.autores[0].pk})
+            self.assertEqual(response.context['cl'].result_count, 2)
+
+
+# ====================================================================
+# XVII. PRUEBAS DE LAS ACCIONES MASIVAS DEL ADMIN
+# ====================================================================
+
+class AccionesMasivasAdminTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.autor = Autor.objects.create(nombre="Emilia Pardo Bazán")
+        self.categoria = Categoria.objects.create(nombre="Novela")
+        for i in range(7):
+            Libro.objects.create(titulo=f"Los pazos {i}", isbn=f"978700000{i:04d}", fecha_publicacion="1886-01-01",
+                                 autor=self.autor, categoria=self.categoria)
+        self.pks = list(Libro.objects.order_by('pk').values_list('pk', flat=True))
+        self.db = ClienteFirestoreMemoria()
+        User.objects.create_superuser(username='admin', password='password123', email='admin@test.com')
+        self.client.login(username='admin', password='password123')
+        self.url = reverse('admin:libros_libro_changelist')
+
+    def _accion(self, accion, pks=None, **extra):
+        datos = {'action': accion, '_selected_action': pks or self.pks, **extra}
+        with mock.patch('libros.admin.get_firebase_db', return_value=self.db):
+            return self.client.post(self.url, datos, follow=True)
+
+    def test_enviar_y_eliminar_de_firestore_por_lotes(self):
+        with mock.patch('libros.services.acciones_masivas.LIMITE_LOTE_FIRESTORE', 3):
+            response = self._accion('enviar_a_firestore')
+        self.assertContains(response, "7 libros enviados a Firestore en 3 commits.")
+        self.assertEqual(len(list(self.db.collection('libros').list_documents())), 7)
+
+        response = self._accion('eliminar_de_firestore', self.pks[:4])
+        self.assertContains(response, "4 documentos eliminados de Firestore en 1 commits.")
+        self.assertEqual(len(list(self.db.collection('libros').list_documents())), 3)
+        self.assertEqual(Libro.objects.count(), 7)
+
+    def test_fallo_de_firestore_deja_el_resto_en_la_outbox(self):
+        with mock.patch.object(ClienteFirestoreMemoria, 'batch', side_effect=RuntimeError("sin red")):
+            response = self._accion('enviar_a_firestore')
+        self.assertContains(response, "7 libros quedan en la outbox")
+        self.assertEqual(SincronizacionPendiente.objects.filter(operacion='guardar').count(), 7)
+
+    @override_settings(FIREBASE_CONFIG={'SYNC_ENABLED': True})
+    def test_borrado_masivo_actualiza_contadores_y_encola(self):
+        self._accion('delete_selected', self.pks[:5], post='yes')
+        self.assertEqual(Libro.objects.count(), 2)
+        self.assertEqual(Autor.objects.get().num_libros, 2)
+        self.assertEqual(Categoria.objects.get().num_libros, 2)
+        self.assertEqual(
+            set(SincronizacionPendiente.objects.filter(operacion='eliminar').values_list('libro_pk', flat=True)),
+            set(self.pks[:5]),
+        )
+
+    def test_regenerar_slugs(self):
+        Libro.objects.filter(pk=self.pks[0]).update(titulo="Los pazos 1")
+        Libro.objects.filter(pk=self.pks[1]).update(slug="antiguo")
+        response = self._accion('reasignar_slugs')
+        self.assertContains(response, "2 de 7 slugs regenerados.")
+        slugs = dict(Libro.objects.values_list('pk', 'slug'))
+        self.assertEqual((slugs[self.pks[0]], slugs[self.pks[1]]), ("los-pazos-1", "los-pazos-1-2"))
+        self.assertEqual(len(set(slugs.values())), 7)
+
+
+# ====================================================================
+# XVIII. PRUEBAS DEL BACKEND DE FIRESTORE EN MEMORIA
+# ====================================================================
+
+FIRESTORE_MEMORIA = {'BACKEND': 'memoria', 'SYNC_ENABLED': True}
+
+
+@override_settings(FIREBASE_CONFIG=FIRESTORE_MEMORIA)
+class FirestoreMemoriaBackendTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        invalidar_paginas()
+        reiniciar_clientes()
+        self.addCleanup(reiniciar_clientes)
+        self.autor = Autor.objects.create(nombre="Rosalía de Castro")
+        for i, titulo in enumerate(["Follas novas", "Cantares gallegos", "En las orillas del Sar"]):
+            Libro.objects.create(titulo=titulo, isbn=f"978800000{i:04d}", fecha_publicacion=f"188{i}-01-01",
+                                 autor=self.autor)
+
+    def test_save_llega_a_firestore_sin_mocks(self):
+        call_command('sync_firestore', '--una-vez', stdout=StringIO())
+        db = get_firebase_db()
+        self.assertIsInstance(db, ClienteFirestoreMemoria)
+        libro = Libro.objects.get(slug='follas-novas')
+        self.assertEqual(db.collection('libros').document(libro.pk).get().to_dict()['titulo'], "Follas novas")
+
+        libro.delete()
+        call_command('sync_firestore', '--una-vez', stdout=StringIO())
+        self.assertFalse(db.collection('libros').document(libro.pk).get().exists)
+
+    def test_consultas_encadenadas(self):
+        procesar_pendientes(get_firebase_db())
+        coleccion = get_firebase_db().collection('libros')
+        consulta = coleccion.order_by('slug').select(['slug'])
+        self.assertEqual([d.to_dict() for d in consulta.limit(2).stream()],
+                         [{'slug': 'cantares-gallegos'}, {'slug': 'en-las-orillas-del-sar'}])
+        self.assertEqual([d.get('slug') for d in consulta.start_after({'slug': 'en-las-orillas-del-sar'}).stream()],
+                         ['follas-novas'])
+        self.assertEqual([d.get('titulo') for d in coleccion.where('fecha_publicacion', '>=', '1881-01-01')
+                          .order_by('fecha_publicacion', direction='DESCENDING').stream()],
+                         ["En las orillas del Sar", "Cantares gallegos"])
+
+    def test_fallos_inyectados_se_reintentan_con_backoff(self):
+        db = ClienteFirestoreMemoria(probabilidad_fallo=1.0)
+        self.assertEqual(procesar_pendientes(db), 0)
+        self.assertEqual(db.escrituras, 0)
+        self.assertEqual(set(SincronizacionPendiente.objects.values_list('intentos', flat=True)), {1})
+        self.assertIn("ErrorFirestoreSimulado", SincronizacionPendiente.objects.first().ultimo_error)
+
+    def test_latencia_y_listener(self):
+        db = ClienteFirestoreMemoria(latencia=0.02)
+        avisos = []
+        db.collection('libros').on_snapshot(lambda documentos, cambios, hora: avisos.append(len(documentos)))
+        inicio = time.perf_counter()
+        procesar_pendientes(db)
+        self.assertGreaterEqual(time.perf_counter() - inicio, 0.02)
+        self.assertEqual(avisos, [0, 3])
+
+    def test_vistas_firebase_sincrona_y_asincrona(self):
+        procesar_pendientes(get_firebase_db())
+        response = self.client.get(reverse('libros:lista_libros_firebase'))
+        self.assertContains(response, "Cantares gallegos")
+
+        invalidar_paginas()
+        request = AsyncRequestFactory().get('/libros/firebase/', {'after': 'cantares-gallegos'})
+        request.user = AnonymousUser()
+        request.auser = sync_to_async(lambda: request.user)
+        response = async_to_sync(LibroListViewFirebaseAsync.as_view())(request)
+        self.assertContains(response, "Follas novas")
+        self.assertNotContains(response, "Cantares gallegos")
+
+
+# ====================================================================
+# XIX. PRUEBAS DE LA PROPAGACIÓN DE RENOMBRADOS A FIRESTORE
+# ====================================================================
+
+@override_settings(FIREBASE_CONFIG=FIRESTORE_MEMORIA)
+class PropagacionRenombradosTest(TestCase):
+    def setUp(self):
+        reiniciar_clientes()
+        self.addCleanup(reiniciar_clientes)
+        self.autor = Autor.objects.create(nombre="Emilia Pardo Bazán")
+        self.otro = Autor.objects.create(nombre="Benito Pérez Galdós")
+        self.categoria = Categoria.objects.create(nombre="Naturalismo")
+        for i in range(5):
+            Libro.objects.create(titulo=f"Novela {i}", isbn=f"978900000{i:04d}", fecha_publicacion="1886-01-01",
+                                 autor=self.autor, categoria=self.categoria)
+        Libro.objects.create(titulo="Fortunata y Jacinta", isbn="9789000009999", fecha_publicacion="1887-01-01",
+                             autor=self.otro)
+        self.db = get_firebase_db()
+        procesar_pendientes(self.db)
+        self.coleccion = self.db.collection('libros')
+
+    def _documentos(self, autor):
+        return {libro.pk: self.coleccion.document(str(libro.pk)).get().to_dict() for libro in autor.libros.all()}
+
+    def test_renombrar_encola_una_fila(self):
+        with CaptureQueriesContext(connection) as consultas:
+            self.autor.nombre = "Emilia Pardo-Bazán"
+            self.autor.save()
+            self.autor.nombre = "E. Pardo Bazán"
+            self.autor.save()
+        self.assertEqual(PropagacionPendiente.objects.count(), 1)
+        self.assertFalse(any('libros_libro' in c['sql'] and 'SELECT' in c['sql'] for c in consultas.captured_queries))
+
+        self.categoria.nombre = "Realismo"
+        self.categoria.save()
+        self.assertEqual(set(PropagacionPendiente.objects.values_list('campo', flat=True)), {'autor', 'categoria'})
+
+    @override_settings(FIREBASE_CONFIG={'BACKEND': 'memoria', 'SYNC_ENABLED': False})
+    def test_sin_sincronizacion_no_encola(self):
+        self.autor.nombre = "Otra"
+        self.autor.save()
+        self.assertFalse(PropagacionPendiente.objects.exists())
+
+    def test_propaga_por_paginas_y_repara_la_deriva(self):
+        antes = self._documentos(self.autor)
+        SincronizacionPendiente.objects.all().delete()
+        # Un documento desviado en otro campo no puede quedar con el hash de SQL
+        desviado = min(antes)
+        self.coleccion.document(str(desviado)).update({'titulo': "Alterado"})
+        self.autor.nombre = "Emilia Pardo-Bazán"
+        self.autor.save()
+
+        self.assertEqual(procesar_propagaciones(self.db, tamano_lote=2), 2)
+        self.assertEqual(procesar_propagaciones(self.db, tamano_lote=2), 2)
+        self.assertEqual(procesar_propagaciones(self.db, tamano_lote=2), 1)
+        self.assertIsNone(procesar_propagaciones(self.db, tamano_lote=2))
+
+        for pk, documento in self._documentos(self.autor).items():
+            self.assertEqual(documento['autor'], "Emilia Pardo-Bazán")
+            self.assertNotEqual(documento['hash'], antes[pk]['hash'])
+            self.assertEqual(documento, Libro.objects.get(pk=pk).datos_firestore())
+        self.assertEqual(list(self._documentos(self.otro).values())[0]['autor'], "Benito Pérez Galdós")
+        self.assertFalse(SincronizacionPendiente.objects.exists())
+
+    def test_renombrar_a_mitad_vuelve_a_empezar(self):
+        self.autor.nombre = "Primero"
+        self.autor.save()
+        procesar_propagaciones(self.db, tamano_lote=2)
+        self.assertGreater(PropagacionPendiente.objects.get().ultimo_libro_pk, 0)
+
+        self.autor.nombre = "Segundo"
+        self.autor.save()
+        self.assertEqual(PropagacionPendiente.objects.get().ultimo_libro_pk, 0)
+        while procesar_propagaciones(self.db, tamano_lote=2) is not None:
+            pass
+        self.assertEqual({d['autor'] for d in self._documentos(self.autor).values()}, {"Segundo"})
+
+    def test_documento_ausente_se_vuelve_a_crear(self):
+        SincronizacionPendiente.objects.all().delete()
+        libro = self.autor.libros.order_by('pk').first()
+        self.coleccion.document(str(libro.pk)).delete()
+        self.categoria.nombre = "Realismo"
+        self.categoria.save()
+
+        self.assertEqual(procesar_propagaciones(self.db), 5)
+        self.assertEqual(self._documentos(self.autor)[libro.pk], libro.datos_firestore())
+        self.assertFalse(SincronizacionPendiente.objects.exists())
+
+    def test_fallo_del_commit_pasa_a_la_outbox(self):
+        SincronizacionPendiente.objects.all().delete()
+        self.categoria.nombre = "Realismo"
+        self.categoria.save()
+        with mock.patch.object(self.db, 'batch') as batch:
+            batch.return_value.commit.side_effect = RuntimeError("sin red")
+            self.assertEqual(procesar_propagaciones(self.db), 5)
+        self.assertFalse(PropagacionPendiente.objects.exists())
+        self.assertEqual(SincronizacionPendiente.objects.count(), 5)
+        self.assertEqual({d['categoria'] for d in self._documentos(self.autor).values()}, {"Naturalismo"})
+
+        call_command('sync_firestore', '--una-vez', stdout=StringIO())
+        self.assertEqual({d['categoria'] for d in self._documentos(self.autor).values()}, {"Realismo"})
+
+    def test_sync_firestore_vacia_propagaciones(self):
+        self.otro.delete()
+        self.autor.nombre = "Doña Emilia"
+        self.autor.save()
+        salida = StringIO()
+        call_command('sync_firestore', '--una-vez', stdout=salida)
+        self.assertIn("5 renombrados", salida.getvalue())
+        self.assertFalse(PropagacionPendiente.objects.exists())
+        self.assertEqual({d['autor'] for d in self._documentos(self.autor).values()}, {"Doña Emilia"})
+
+
+# ====================================================================
+# XX. PRUEBAS DE LA LECTURA CACHEADA DE DOCUMENTOS DE FIRESTORE
+# ====================================================================
+
+@override_settings(FIREBASE_CONFIG=FIRESTORE_MEMORIA)
+class ObtenerLibrosFirestoreTest(TestCase):
+    def setUp(self):
+        reiniciar_clientes()
+        invalidar_libros()
+        self.addCleanup(reiniciar_clientes)
+        self.addCleanup(invalidar_libros)
+        autor = Autor.objects.create(nombre="Leopoldo Alas")
+        for i, titulo in enumerate(["La Regenta", "Su único hijo", "Adiós, Cordera"]):
+            Libro.objects.create(titulo=titulo, isbn=f"978950000{i:04d}", fecha_publicacion="1884-01-01",
+                                 autor=autor)
+        self.db = get_firebase_db()
+        procesar_pendientes(self.db)
+
+    def test_lectura_en_lote_y_caliente_sin_lecturas(self):
+        llamadas, lecturas = self.db.llamadas, self.db.lecturas
+        libros = obtener_libros(['la-regenta', 'su-unico-hijo', 'no-existe'])
+        self.assertEqual(list(libros), ['la-regenta', 'su-unico-hijo', 'no-existe'])
+        self.assertEqual(libros['la-regenta']['titulo'], "La Regenta")
+        self.assertIsNone(libros['no-existe'])
+        self.assertEqual((self.db.llamadas - llamadas, self.db.lecturas - lecturas), (1, 2))
+
+        libros['la-regenta']['titulo'] = "Modificado"
+        aciertos = estadisticas_libros()['aciertos']
+        with self.assertNumQueries(1):
+            otra_vez = obtener_libros(['la-regenta', 'su-unico-hijo'])
+        self.assertEqual(otra_vez['la-regenta']['titulo'], "La Regenta")
+        self.assertEqual(self.db.lecturas - lecturas, 2)
+        self.assertEqual(estadisticas_libros()['aciertos'] - aciertos, 2)
+
+    def test_cache_negativa_e_invalidacion_desde_la_escritura(self):
+        libro = Libro.objects.get(slug='adios-cordera')
+        self.db.collection('libros').document(str(libro.pk)).delete()
+        self.assertIsNone(obtener_libros(['adios-cordera'])['adios-cordera'])
+        lecturas = self.db.lecturas
+        self.assertIsNone(obtener_libros(['adios-cordera'])['adios-cordera'])
+        self.assertEqual(self.db.lecturas, lecturas)
+
+        # La outbox vuelve a escribir el documento y lo quita de la caché
+        SincronizacionPendiente.encolar([libro.pk], SincronizacionPendiente.GUARDAR)
+        procesar_pendientes(self.db)
+        self.assertEqual(obtener_libros(['adios-cordera'])['adios-cordera']['titulo'], "Adiós, Cordera")
+
+        libro.titulo = "¡Adiós, Cordera!"
+        libro.save()
+        procesar_pendientes(self.db)
+        self.assertEqual(obtener_libros(['adios-cordera'])['adios-cordera']['titulo'], "¡Adiós, Cordera!")
+
+    def test_invalidacion_desde_otro_proceso(self):
+        libro = Libro.objects.get(slug='la-regenta')
+        obtener_libros(['la-regenta'])
+        self.db.collection('libros').document(str(libro.pk)).update({'titulo': "La Regenta (1885)"})
+        self.assertEqual(obtener_libros(['la-regenta'])['la-regenta']['titulo'], "La Regenta")
+        # sync_firestore, en otro proceso, sólo puede cambiar la versión en la caché de Django
+        cache.set(firebase_db._clave_version(libro.pk), 'otro-proceso', None)
+        self.assertEqual(obtener_libros(['la-regenta'])['la-regenta']['titulo'], "La Regenta (1885)")
+
+    def test_seleccion_en_el_listado_de_firestore(self):
+        url = reverse('libros:lista_libros_firebase')
+        response = self.client.get(url, {'slug': ['su-unico-hijo', 'no-existe', 'la-regenta']})
+        self.assertEqual([libro['titulo'] for libro in response.context['libros']], ["Su único hijo", "La Regenta"])
+        lecturas = self.db.lecturas
+        self.client.get(url, {'slug': ['la-regenta']})
+        self.assertEqual(self.db.lecturas, lecturas)
+
+
+# ====================================================================
+# XXI. PRUEBAS DEL SNAPSHOT MSGPACK DEL CATÁLOGO
+# ====================================================================
+
+class CatalogoMsgpackTest(TestCase):
+    def setUp(self):
+        temporal = tempfile.mkdtemp(prefix='catalogo-')
+        self.addCleanup(shutil.rmtree, temporal, True)
+        ajuste = override_settings(CATALOGO={'DIRECTORIO': temporal, 'REGENERAR': False})
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+        self.autor = Autor.objects.create(nombre="Carmen Laforet")
+        ficcion = Categoria.objects.create(nombre="Novela")
+        Libro.objects.create(titulo="Nada", isbn="9789700000001", fecha_publicacion="1945-01-01",
+                             autor=self.autor, categoria=ficcion)
+        Libro.objects.create(titulo="La isla y los demonios", isbn="9789700000002",
+                             fecha_publicacion="1952-01-01", autor=self.autor)
+        self.resumen = catalogo.generar_catalogo()
+        self.url = reverse('libros:catalogo_msgpack')
+
+    def test_formato_con_tablas_por_indice(self):
+        with open(catalogo.ruta_catalogo(), 'rb') as archivo:
+            datos = msgpack.unpackb(archivo.read())
+        self.assertEqual(datos['version'], self.resumen['version'])
+        self.assertEqual(datos['autores'], [["Carmen Laforet", "carmen-laforet"]])
+        self.assertEqual([fila[datos['campos'].index('slug')] for fila in datos['libros']],
+                         ['la-isla-y-los-demonios', 'nada'])
+        nada = dict(zip(datos['campos'], datos['libros'][1]))
+        self.assertEqual((nada['autor'], nada['categoria'], nada['fecha_publicacion']), (0, 0, '1945-01-01'))
+
+    def test_busqueda_en_mmap_sin_consultas(self):
+        catalogo.abrir_catalogo()
+        with self.assertNumQueries(0):
+            libros = catalogo.buscar_libros(['nada', 'no-existe', 'la-isla-y-los-demonios'])
+        self.assertEqual(libros['nada']['autor'], {'nombre': "Carmen Laforet", 'slug': 'carmen-laforet'})
+        self.assertEqual(libros['nada']['categoria']['slug'], 'novela')
+        self.assertIsNone(libros['la-isla-y-los-demonios']['categoria'])
+        self.assertIsNone(libros['no-existe'])
+
+    def test_vista_sirve_el_fichero_sin_consultas(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        contenido = b''.join(response.streaming_content)
+        self.assertEqual(response['Content-Type'], 'application/x-msgpack')
+        self.assertEqual(int(response['Content-Length']), len(contenido))
+        self.assertEqual(msgpack.unpackb(contenido)['version'], self.resumen['version'])
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_rangos(self):
+        completo = b''.join(self.client.get(self.url).streaming_content)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(completo)}')
+        self.assertEqual(b''.join(response.streaming_content), completo[10:20])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), completo[-5:])
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE=f'bytes={len(completo)}-').status_code, 416)
+        # If-Range de otra versión: se envía el fichero entero
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"otra"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_consulta_por_slugs(self):
+        response = self.client.get(self.url, {'slug': ['nada', 'no-existe']})
+        datos = msgpack.unpackb(response.content)
+        self.assertEqual(datos['nada']['titulo'], "Nada")
+        self.assertIsNone(datos['no-existe'])
+
+    def test_regenerar_tras_escribir_sustituye_el_fichero(self):
+        anterior = catalogo.abrir_catalogo()
+        self.addCleanup(setattr, catalogo, '_temporizador', None)
+        with override_settings(CATALOGO={**settings.CATALOGO, 'REGENERAR': True, 'ESPERA': 5}), \
+                mock.patch('libros.catalogo.threading.Timer') as temporizador:
+            with self.captureOnCommitCallbacks(execute=True):
+                for i in range(3):
+                    Libro.objects.create(titulo=f"Nuevo libro {i}", isbn=f"978970000001{i}",
+                                         fecha_publicacion="1955-01-01", autor=self.autor)
+            # Las tres escrituras se agrupan en una regeneración
+            self.assertEqual(temporizador.call_count, 1)
+            espera, regenerar = temporizador.call_args.args
+            self.assertEqual(espera, 5)
+            with mock.patch.object(catalogo.connections, 'close_all'):
+                regenerar()
+
+        self.assertEqual(catalogo.abrir_catalogo().libro('nuevo-libro-2')['titulo'], "Nuevo libro 2")
+        # Quien ya tenía abierto el anterior sigue leyéndolo
+        self.assertIsNone(anterior.libro('nuevo-libro-2'))
+        self.assertEqual(len(anterior), 2)
+
+    def test_un_solo_proceso_regenera(self):
+        with override_settings(CATALOGO={**settings.CATALOGO, 'REGENERAR': True}), \
+                mock.patch('libros.catalogo.threading.Timer'):
+            with self.captureOnCommitCallbacks(execute=True):
+                Libro.objects.create(titulo="Nuevo libro", isbn="9789700000010",
+                                     fecha_publicacion="1955-01-01", autor=self.autor)
+        # Otro proceso tiene el cerrojo: no se espera
+        with catalogo._cerrojo():
+            self.assertIs(catalogo.regenerar_si_obsoleto(esperar=False), False)
+        self.assertEqual(catalogo.regenerar_si_obsoleto()['libros'], 3)
+        # El temporizador de los demás workers lo encuentra ya al día
+        with mock.patch.object(catalogo, '_generar') as generar:
+            self.assertIsNone(catalogo.regenerar_si_obsoleto(esperar=False))
+        generar.assert_not_called()
+
+    def test_import_libros_regenera_al_terminar(self):
+        ruta = os.path.join(os.path.dirname(catalogo.ruta_catalogo()), 'libros.csv')
+        with open(ruta, 'w', encoding='utf-8') as archivo:
+            archivo.write("titulo,isbn,fecha_publicacion,autor,categoria\n"
+                          "Nosotras,9789700000020,1944-01-01,Carmen Laforet,Novela\n")
+        with override_settings(CATALOGO={**settings.CATALOGO, 'REGENERAR': True}), \
+                mock.patch('libros.catalogo.threading.Timer') as temporizador:
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command('import_libros', ruta, stdout=StringIO())
+        temporizador.assert_not_called()
+        self.assertEqual(catalogo.abrir_catalogo().libro('nosotras')['titulo'], "Nosotras")
+
+    def test_lee_autores_categorias_y_libros_en_una_instantanea(self):
+        # Un autor creado entre lecturas sueltas dejaría a su libro sin posición en la tabla
+        with CaptureQueriesContext(connection) as consultas:
+            catalogo.generar_catalogo()
+        sentencias = [consulta['sql'] for consulta in consultas]
+        lecturas = [i for i, sql in enumerate(sentencias)
+                    if sql.startswith('SELECT') and any(f'"libros_{tabla}"' in sql
+                                                        for tabla in ('autor', 'categoria', 'libro'))]
+        self.assertEqual(len(lecturas), 3)
+        inicio = max(i for i, sql in enumerate(sentencias[:lecturas[0]]) if sql.startswith('SAVEPOINT'))
+        fin = next(i for i, sql in enumerate(sentencias) if i > lecturas[-1] and sql.startswith('RELEASE'))
+        self.assertFalse([sql for sql in sentencias[inicio + 1:fin] if 'SAVEPOINT' in sql])
+
+    def test_sin_generar_responde_503(self):
+        os.remove(catalogo.ruta_catalogo())
+        with mock.patch.object(catalogo, 'generar_catalogo') as generar:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        generar.assert_not_called()
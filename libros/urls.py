@@ -1,11 +1,23 @@
 # libros/urls.py
 
+from django.conf import settings
 from django.urls import path
-from . import views 
+from . import views, views_async
+from .views_firebase import LibroListViewFirebase, LibroListViewFirebaseAsync
 
 # 🚨 CORRECCIÓN CRÍTICA: Definir app_name para usar namespaces.
 app_name = 'libros' 
 
+# ⚡ Bajo ASGI (VISTAS_ASINCRONAS) las lecturas públicas usan las vistas asíncronas
+if settings.VISTAS_ASINCRONAS:
+    vista_detalle = views_async.detalle_libro
+    vista_firebase = LibroListViewFirebaseAsync.as_view()
+    vista_exportar = views_async.exportar_libros
+else:
+    vista_detalle = views.detalle_libro
+    vista_firebase = LibroListViewFirebase.as_view()
+    vista_exportar = views.exportar_libros
+
 urlpatterns = [
     # -----------------------------------------------------------------
     # 🚀 1. RUTAS ESPECÍFICAS (CRUD, AUTH) - DEBEN IR PRIMERO
@@ -16,6 +28,10 @@ urlpatterns = [
     path('crear_categoria/', views.CategoriaCreateView.as_view(), name='crear_categoria'),
     
     path('login/', views.login_page, name='login_page'), 
+    path('buscar/', views.buscar_libros, name='buscar_libros'),
+    path('firebase/', vista_firebase, name='lista_libros_firebase'),
+    path('exportar/<str:formato>/', vista_exportar, name='exportar_libros'),
+    path('catalogo.msgpack', views.catalogo_msgpack, name='catalogo_msgpack'),
     
     path('editar/<slug:slug>/', views.LibroUpdateView.as_view(), name='editar_libro'),
     path('eliminar/<slug:slug>/', views.LibroDeleteView.as_view(), name='eliminar_libro'),
@@ -28,5 +44,5 @@ urlpatterns = [
     # path('', views.LibroListView.as_view(), name='lista_libros'),
     
     # Ruta Detalle de Libro 
-    path('<slug:slug>/', views.detalle_libro, name='detalle_libro'), 
+    path('<slug:slug>/', vista_detalle, name='detalle_libro'), 
 ]
\ No newline at end of file
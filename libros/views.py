@@ -1,14 +1,33 @@
+import msgpack
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
+from django.template.loader import render_to_string
 from django.views.generic import ListView
 from django.views.generic.edit import CreateView, DeleteView, UpdateView
 from django.urls import reverse_lazy
-from django.utils.text import slugify 
 
 # Seguridad
 from django.contrib.auth.mixins import UserPassesTestMixin
 
+# Réplicas de lectura (core/db_router.py)
+from core.db_router import LecturaEnReplicaMixin
 
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.http import require_GET, require_safe
+
+from . import catalogo
+from .busqueda import ResultadosBusqueda
+from .cache import clave_pagina_listado, guardar_detalle, obtener_detalle
+from .exportacion import FORMATOS, exportar, libros_para_exportar, parsear_desde
 from .models import Categoria, Libro, Autor
+from .facetas import (
+    aplicar_filtros, obtener_facetas, parsear_filtros, querystring_filtros, version_facetas,
+)
+from .paginacion import ConteoCacheadoPaginator, cursor_siguiente, despues_del_cursor
 # 🚨 MANTENEMOS COMENTADA LA IMPORTACIÓN DE FORMS, COMO SOLICITASTE
 # from .forms import AutorForm, CategoriaForm, LibroForm 
 
@@ -21,10 +40,41 @@ class SuperuserRequiredMixin(UserPassesTestMixin):
     def test_func(self):
         return self.request.user.is_superuser
 
+
+class EscrituraAtomicaMixin:
+    """El POST va en una transacción: el libro, sus contadores y la outbox juntos.
+
+    Con SQLITE_CONCURRENTE la transacción empieza con BEGIN IMMEDIATE (core/sqlite.py):
+    toma el bloqueo de escritura al principio y espera su turno en vez de fallar con
+    "database is locked" al pasar de leer a escribir. Las cachés se invalidan al
+    confirmarla (Libro.save() usa on_commit), no antes.
+    """
+    def post(self, request, *args, **kwargs):
+        with transaction.atomic():
+            return super().post(request, *args, **kwargs)
+
 # ----------------------------------------------------------------------
 # --- VISTAS LECTURA ---
 # ----------------------------------------------------------------------
-class LibroListView(ListView):
+# Columnas que pinta cada tarjeta del listado (también las usa views_async.lista_libros);
+# `actualizado` es la versión con la que se cachea cada tarjeta
+# (`fecha_publicacion` hace falta para el cursor de los listados filtrados)
+CAMPOS_TARJETA = (
+    'titulo', 'slug', 'actualizado', 'fecha_publicacion', 'autor__nombre', 'categoria__nombre',
+)
+
+
+def clave_pagina(usuario, libros, page, total_libros, siguiente_cursor, filtros_query=''):
+    """Clave del fragmento de página completa en home.html (sólo para anónimos)."""
+    if usuario.is_authenticated:
+        return None
+    return clave_pagina_listado(
+        libros, total_libros, siguiente_cursor, filtros_query,
+        page.number if page else 'cursor', page.paginator.num_pages if page else None,
+    )
+
+
+class LibroListView(LecturaEnReplicaMixin, ListView):
     model = Libro
     template_name = 'libros/home.html' 
     context_object_name = 'libros'
@@ -33,17 +83,195 @@ class LibroListView(ListView):
     # para asegurar que los libros 1 a 10 aparezcan primero, 
     # satisfaciendo el test de paginación.
     ordering = ['pk'] 
+    # El COUNT(*) se cachea: no se repite en cada petición
+    paginator_class = ConteoCacheadoPaginator
+
+    def get_queryset(self):
+        # Una sola consulta con JOIN y sólo las columnas que pinta cada tarjeta (sin N+1)
+        queryset = super().get_queryset().select_related('autor', 'categoria').only(*CAMPOS_TARJETA)
+        # 📊 Facetas: ?categoria=&autor=&desde=&hasta= (con filtros, orden por fecha de publicación)
+        self.filtros = parsear_filtros(self.request.GET)
+        if not self.filtros:
+            self.seleccion, self.total_conocido = {}, None
+            return queryset
+        queryset, self.seleccion, self.total_conocido = aplicar_filtros(queryset, self.filtros)
+        return queryset
+
+    def get_paginator(self, queryset, per_page, **kwargs):
+        paginator = super().get_paginator(queryset, per_page, **kwargs)
+        if self.total_conocido is not None:
+            # El contador desnormalizado de la faceta ya da el total: no hace falta COUNT
+            paginator.count = self.total_conocido
+        return paginator
+
+    def paginate_queryset(self, queryset, page_size):
+        """Con ?after=<cursor> pagina por keyset (pk > último visto) en vez de por OFFSET."""
+        self.total_libros = self.get_paginator(queryset, page_size).count
+        por_fecha = bool(self.filtros)
+        token = self.request.GET.get('after')
+        if token is None:
+            paginator, page, object_list, is_paginated = super().paginate_queryset(queryset, page_size)
+            page.object_list = object_list = list(object_list)
+            hay_mas = page.has_next()
+        else:
+            siguientes = despues_del_cursor(queryset, token, por_fecha)
+            if siguientes is None:
+                raise Http404("Cursor de paginación no válido.")
+            # Se pide un libro de más para saber si existe una página siguiente
+            object_list = list(siguientes[:page_size + 1])
+            hay_mas = len(object_list) > page_size
+            object_list = object_list[:page_size]
+            paginator, page, is_paginated = None, None, True
+
+        self.siguiente_cursor = cursor_siguiente(object_list[-1], por_fecha) if hay_mas else None
+        return paginator, page, object_list, is_paginated
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        filtros_query = querystring_filtros(self.filtros)
+        context.update({
+            'siguiente_cursor': self.siguiente_cursor,
+            'total_libros': self.total_libros,
+            'filtros': self.filtros,
+            'filtros_query': filtros_query,
+            'seleccion': self.seleccion,
+            # Se llama desde la plantilla sólo si el fragmento de facetas no está en caché
+            'facetas': obtener_facetas,
+            'version_facetas': version_facetas(),
+            'clave_pagina': clave_pagina(
+                self.request.user, context['libros'], context['page_obj'],
+                self.total_libros, self.siguiente_cursor, filtros_query,
+            ),
+        })
+        return context
 
 # VISTA FUNCIONAL - Detalle de Libro (Ruta Dinámica)
 def detalle_libro(request, slug):
-    """Muestra la información detallada de un libro."""
-    libro = get_object_or_404(Libro, slug=slug) 
+    """Muestra la información detallada de un libro.
+
+    El contenido se cachea por slug (con una variante para superusuarios, que ven
+    los botones de administración): un acierto no consulta la base de datos. Un fallo
+    lee de la primaria, no de una réplica: lo leído se cachea para todos durante horas.
+    """
+    variante = 'admin' if request.user.is_superuser else 'publico'
+    context = obtener_detalle(slug, variante)
+
+    if context is None:
+        libro = get_object_or_404(Libro.objects.select_related('autor', 'categoria'), slug=slug)
+        contenido = render_to_string('libros/fragmentos/detalle_libro.html', {
+            'libro': libro,
+            'es_admin': variante == 'admin',
+        })
+        guardar_detalle(slug, variante, libro, contenido)
+        context = {
+            'libro': libro,
+            'titulo': libro.titulo,
+            'contenido': contenido,
+        }
     
+    return render(request, 'libros/detalle_libro.html', context)
+
+# VISTA FUNCIONAL - Búsqueda de texto completo (títulos, autores e ISBN)
+def buscar_libros(request):
+    """Busca en el índice de texto completo y pagina los resultados por relevancia."""
+    consulta = request.GET.get('q', '').strip()
+    paginator = Paginator(ResultadosBusqueda(consulta), 10)
+    page_obj = paginator.get_page(request.GET.get('page'))
+
     context = {
-        'libro': libro,
+        'consulta': consulta,
+        'page_obj': page_obj,
+        'libros': page_obj.object_list,
     }
-    
-    return render(request, 'libros/detalle_libro.html', context)
+
+    return render(request, 'libros/buscar.html', context)
+
+# VISTA FUNCIONAL - Exportación del catálogo (NDJSON o CSV en streaming)
+def respuesta_exportacion(request, formato, bloques):
+    """StreamingHttpResponse con bloques(desde); también la usa views_async.exportar_libros."""
+    if formato not in FORMATOS:
+        raise Http404("Formato de exportación no soportado.")
+    desde = request.GET.get('updated_since')
+    try:
+        desde = parsear_desde(desde) if desde else None
+    except ValueError as exc:
+        return HttpResponseBadRequest(str(exc))
+
+    response = StreamingHttpResponse(bloques(desde), content_type=FORMATOS[formato][0])
+    response['Content-Disposition'] = f'attachment; filename="libros.{formato}"'
+    return response
+
+
+@require_GET
+def exportar_libros(request, formato):
+    """Envía el catálogo fila a fila; ?updated_since= limita a lo modificado después.
+
+    Sólo con WSGI: bajo ASGI se enruta views_async.exportar_libros (ver urls.py).
+    """
+    return respuesta_exportacion(request, formato, lambda desde: exportar(formato, libros_para_exportar(desde)))
+
+# VISTA FUNCIONAL - Snapshot msgpack del catálogo (libros/catalogo.py)
+@require_safe
+def catalogo_msgpack(request):
+    """Envía el snapshot tal cual (FileResponse, con ETag y Range), sin consultas.
+
+    Con ?slug=a&slug=b devuelve sólo esos libros, buscados en el fichero mapeado en memoria.
+    """
+    try:
+        archivo = open(catalogo.ruta_catalogo(), 'rb')
+    except FileNotFoundError:
+        # Aún no generado: no se genera aquí (cada petición concurrente recorrería el
+        # catálogo entero); se pide en segundo plano y el cliente reintenta
+        catalogo.catalogo_obsoleto()
+        response = HttpResponse("El catálogo se está generando.", status=503,
+                                content_type='text/plain; charset=utf-8')
+        response['Retry-After'] = catalogo.ESPERA_NO_GENERADO
+        return response
+    try:
+        snapshot = catalogo.abrir_catalogo(archivo)
+    except BaseException:
+        archivo.close()
+        raise
+
+    slugs = request.GET.getlist('slug')
+    if slugs:
+        archivo.close()
+        contenido = msgpack.packb({slug: snapshot.libro(slug) for slug in slugs})
+        return HttpResponse(contenido, content_type=catalogo.CONTENT_TYPE)
+
+    etag = f'"catalogo-{snapshot.version}"'
+    condicional = get_conditional_response(request, etag=etag, last_modified=int(snapshot.modificado))
+    if condicional is not None:
+        archivo.close()
+        condicional['ETag'] = etag
+        return condicional
+
+    rango = None
+    cabecera_rango = request.META.get('HTTP_RANGE')
+    # If-Range: el tramo sólo vale si el cliente tiene esta misma versión
+    if cabecera_rango and request.META.get('HTTP_IF_RANGE', etag) == etag:
+        try:
+            rango = catalogo.parsear_rango(cabecera_rango, snapshot.tamano)
+        except ValueError:
+            archivo.close()
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{snapshot.tamano}'
+            return response
+
+    if rango is None:
+        response = FileResponse(archivo, content_type=catalogo.CONTENT_TYPE)
+    else:
+        inicio, fin = rango
+        archivo.seek(inicio)
+        response = FileResponse(catalogo.TramoArchivo(archivo, fin - inicio + 1),
+                                content_type=catalogo.CONTENT_TYPE, status=206)
+        response['Content-Length'] = fin - inicio + 1
+        response['Content-Range'] = f'bytes {inicio}-{fin}/{snapshot.tamano}'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(snapshot.modificado)
+    response['Accept-Ranges'] = 'bytes'
+    response['Cache-Control'] = 'public, max-age=60'
+    return response
 
 # 🔑 VISTA FUNCIONAL AÑADIDA - Renderiza la plantilla de login 🔑
 def login_page(request):
@@ -55,36 +283,29 @@ def login_page(request):
 # ----------------------------------------------------------------------
 
 # 🚀 VISTA GENÉRICA (CreateView) - Crear Autor
-class AutorCreateView(SuperuserRequiredMixin, CreateView):
+class AutorCreateView(SuperuserRequiredMixin, EscrituraAtomicaMixin, CreateView):
     model = Autor
     fields = ['nombre', 'biografia', 'fecha_nacimiento'] 
     template_name = 'libros/crear_autor.html' 
     success_url = reverse_lazy('home')
 
 # 🚀 VISTA GENÉRICA (CreateView) - Crear Categoría
-class CategoriaCreateView(SuperuserRequiredMixin, CreateView):
+class CategoriaCreateView(SuperuserRequiredMixin, EscrituraAtomicaMixin, CreateView):
     model = Categoria
     fields = ['nombre'] 
     template_name = 'libros/crear_autor.html' 
     success_url = reverse_lazy('home')
 
 # 🚀 VISTA GENÉRICA (CreateView) - Crear Libro
-class LibroCreateView(SuperuserRequiredMixin, CreateView):
+class LibroCreateView(SuperuserRequiredMixin, EscrituraAtomicaMixin, CreateView):
     model = Libro
     fields = ['titulo', 'isbn', 'fecha_publicacion', 'autor', 'categoria']
     template_name = 'libros/libro_form.html'
     success_url = reverse_lazy('home') 
-
-    # 🟢 MÉTODO AGREGADO PARA PREVENIR EL NoReverseMatch 🟢
-    def form_valid(self, form):
-        self.object = form.save(commit=False)
-        if not self.object.slug:
-            self.object.slug = slugify(self.object.titulo)
-        self.object.save()
-        return super().form_valid(form)
+    # 🟢 El slug único lo genera Libro.save() (libros/slugs.py), así que no hace falta form_valid 🟢
 
 # 🚀 VISTA GENÉRICA (UpdateView) - Editar Libro
-class LibroUpdateView(SuperuserRequiredMixin, UpdateView):
+class LibroUpdateView(SuperuserRequiredMixin, EscrituraAtomicaMixin, UpdateView):
     model = Libro
     fields = ['titulo', 'isbn', 'fecha_publicacion', 'autor', 'categoria']
     template_name = 'libros/libro_form.html'
@@ -94,7 +315,7 @@ class LibroUpdateView(SuperuserRequiredMixin, UpdateView):
         return reverse_lazy('libros:detalle_libro', kwargs={'slug': self.object.slug})
 
 # 🚀 VISTA GENÉRICA (DeleteView) - Eliminar Libro
-class LibroDeleteView(SuperuserRequiredMixin, DeleteView):
+class LibroDeleteView(SuperuserRequiredMixin, EscrituraAtomicaMixin, DeleteView):
     model = Libro
     template_name = 'libros/libro_confirm_delete.html' 
     success_url = reverse_lazy('home')
\ No newline at end of file
@@ -0,0 +1,125 @@
+# libros/views_async.py
+#
+# Versiones asíncronas de las vistas públicas de lectura para servir con ASGI (uvicorn).
+# Usan el ORM asíncrono (aget, async for), así que una petición lenta no ocupa un hilo
+# del worker. Se enrutan en lugar de las síncronas cuando VISTAS_ASINCRONAS está activo.
+
+from asgiref.sync import sync_to_async
+from django.core.paginator import InvalidPage
+from django.http import Http404
+from django.shortcuts import render
+from django.template.loader import render_to_string
+from django.views.decorators.http import require_GET
+
+from core.db_router import lectura_en_replica
+
+from .cache import guardar_detalle, obtener_detalle
+from .exportacion import aexportar, alibros_para_exportar
+from .models import Libro
+from .facetas import (
+    aplicar_filtros, obtener_facetas, parsear_filtros, querystring_filtros, version_facetas,
+)
+from .paginacion import ConteoCacheadoPaginator, cursor_siguiente, despues_del_cursor
+from .views import CAMPOS_TARJETA, LibroListView, clave_pagina, respuesta_exportacion
+
+
+async def _usuario(request):
+    """Resuelve request.user sin bloquear y lo deja fijado para las plantillas.
+
+    El context processor de auth lee request.user: si siguiera siendo el objeto
+    perezoso, lo resolvería con una consulta síncrona en mitad del render.
+    """
+    request.user = await request.auser()
+    return request.user
+
+
+@lectura_en_replica
+async def lista_libros(request):
+    """Equivalente asíncrono de LibroListView (misma plantilla, mismo contexto)."""
+    usuario = await _usuario(request)
+    tamano = LibroListView.paginate_by
+    queryset = Libro.objects.order_by('pk').select_related('autor', 'categoria').only(*CAMPOS_TARJETA)
+    filtros = parsear_filtros(request.GET)
+    seleccion, total_conocido = {}, None
+    if filtros:
+        queryset, seleccion, total_conocido = await sync_to_async(aplicar_filtros)(queryset, filtros)
+    paginator = ConteoCacheadoPaginator(queryset, tamano)
+    if total_conocido is not None:
+        paginator.count = total_conocido
+    # El COUNT cacheado y las facetas tocan la caché (y quizá la BD): fuera del event loop
+    total_libros = await sync_to_async(lambda: paginator.count)()
+    facetas = await sync_to_async(obtener_facetas)()
+    version = version_facetas()
+
+    por_fecha = bool(filtros)
+    token = request.GET.get('after')
+    if token is None:
+        numero = request.GET.get('page') or 1
+        try:
+            page = paginator.page(paginator.num_pages if numero == 'last' else int(numero))
+        except (ValueError, InvalidPage):
+            raise Http404("Página no válida.")
+        page.object_list = libros = [libro async for libro in page.object_list]
+        hay_mas, is_paginated = page.has_next(), page.has_other_pages()
+    else:
+        siguientes = despues_del_cursor(queryset, token, por_fecha)
+        if siguientes is None:
+            raise Http404("Cursor de paginación no válido.")
+        # Se pide un libro de más para saber si existe una página siguiente
+        libros = [libro async for libro in siguientes[:tamano + 1]]
+        hay_mas = len(libros) > tamano
+        libros = libros[:tamano]
+        paginator, page, is_paginated = None, None, True
+
+    siguiente_cursor = cursor_siguiente(libros[-1], por_fecha) if hay_mas else None
+    filtros_query = querystring_filtros(filtros)
+    return render(request, LibroListView.template_name, {
+        'libros': libros,
+        'object_list': libros,
+        'paginator': paginator,
+        'page_obj': page,
+        'is_paginated': is_paginated,
+        'siguiente_cursor': siguiente_cursor,
+        'total_libros': total_libros,
+        'filtros': filtros,
+        'filtros_query': filtros_query,
+        'seleccion': seleccion,
+        'facetas': facetas,
+        'version_facetas': version,
+        'clave_pagina': clave_pagina(usuario, libros, page, total_libros, siguiente_cursor, filtros_query),
+    })
+
+
+async def detalle_libro(request, slug):
+    """Equivalente asíncrono de views.detalle_libro (comparte su caché y lee de la primaria)."""
+    usuario = await _usuario(request)
+    variante = 'admin' if usuario.is_superuser else 'publico'
+    context = await sync_to_async(obtener_detalle)(slug, variante)
+
+    if context is None:
+        try:
+            libro = await Libro.objects.select_related('autor', 'categoria').aget(slug=slug)
+        except Libro.DoesNotExist:
+            raise Http404("No existe ningún libro con ese slug.")
+        contenido = render_to_string('libros/fragmentos/detalle_libro.html', {
+            'libro': libro,
+            'es_admin': variante == 'admin',
+        })
+        await sync_to_async(guardar_detalle)(slug, variante, libro, contenido)
+        context = {
+            'libro': libro,
+            'titulo': libro.titulo,
+            'contenido': contenido,
+        }
+
+    return render(request, 'libros/detalle_libro.html', context)
+
+
+@require_GET
+async def exportar_libros(request, formato):
+    """Equivalente asíncrono de views.exportar_libros con un iterador asíncrono.
+
+    Con un generador síncrono, Django bajo ASGI lo consume entero con sync_to_async(list)
+    antes de enviar el primer byte: toda la exportación en memoria.
+    """
+    return respuesta_exportacion(request, formato, lambda desde: aexportar(formato, alibros_para_exportar(desde)))
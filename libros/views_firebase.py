@@ -1,28 +1,162 @@
 # libros/views_firebase.py
 
+import threading
+
+from asgiref.sync import sync_to_async
+from cachetools import TTLCache
+from django.conf import settings
 from django.shortcuts import render
 from django.views.generic import View # Usamos View simple en lugar de ListView
-from digital_library.firebase_config import get_firebase_db 
+from core.metricas import medir_firestore
+from digital_library.firebase_config import get_firebase_db, get_firebase_db_async
+from .services.firebase_db import invalidar_libros, obtener_libros
 # from .forms import ReseñaForm # Necesitarías adaptarlo para Firebase
 
+
+TAMANO_PAGINA = 12
+# Libros como mucho en una selección ?slug=a&slug=b (una lectura get_all)
+MAX_SELECCION = 100
+# Sólo los campos que pinta la plantilla: Firestore no envía el resto del documento
+CAMPOS_LISTADO = ['titulo', 'autor', 'slug']
+
+# Caché en proceso de páginas ya leídas: (cursor, tamaño) -> (libros, siguiente_cursor)
+_paginas = TTLCache(maxsize=256, ttl=settings.FIREBASE_CONFIG.get('TTL_PAGINAS', 60))
+_paginas_lock = threading.Lock()
+_listener = None
+
+
+def invalidar_paginas(*args):
+    """Vacía la caché de páginas."""
+    with _paginas_lock:
+        _paginas.clear()
+
+
+def _al_cambiar_libros(documentos, cambios, hora):
+    """Callback del snapshot listener: páginas y documentos cacheados dejan de valer."""
+    invalidar_paginas()
+    invalidar_libros()
+
+
+def _iniciar_listener(db):
+    """Mantiene las cachés al día: cualquier cambio en 'libros' las invalida.
+
+    Opcional (FIREBASE_CONFIG['LISTENER_LIBROS']): la primera instantánea del
+    listener lee la colección completa una vez por proceso.
+    """
+    global _listener
+    with _paginas_lock:
+        if _listener is None:
+            _listener = db.collection('libros').on_snapshot(_al_cambiar_libros)
+
+
+def _pagina_cacheada(clave):
+    with _paginas_lock:
+        return _paginas.get(clave)
+
+
+def _consulta_pagina(db, cursor, tamano):
+    consulta = db.collection('libros').order_by('slug').select(CAMPOS_LISTADO)
+    if cursor:
+        consulta = consulta.start_after({'slug': cursor})
+    # Un documento de más indica si hay página siguiente
+    return consulta.limit(tamano + 1)
+
+
+def _guardar_pagina(clave, documentos, tamano):
+    libros = []
+    for doc in documentos[:tamano]:
+        libro_data = doc.to_dict()
+        libro_data['id'] = doc.id # Usar el ID del documento como clave
+        libros.append(libro_data)
+    siguiente = libros[-1].get('slug') if len(documentos) > tamano else None
+
+    with _paginas_lock:
+        _paginas[clave] = (libros, siguiente)
+    return libros, siguiente
+
+
+def obtener_pagina(db, cursor=None, tamano=TAMANO_PAGINA):
+    """Lee una página de 'libros' ordenada por slug, empezando después de `cursor`.
+
+    Devuelve (libros, siguiente_cursor). Cada lectura cuesta como mucho
+    `tamano + 1` documentos, no la colección entera.
+    """
+    clave = (cursor, tamano)
+    pagina = _pagina_cacheada(clave)
+    if pagina is not None:
+        return pagina
+    with medir_firestore('listar_pagina'):
+        documentos = list(_consulta_pagina(db, cursor, tamano).stream())
+    return _guardar_pagina(clave, documentos, tamano)
+
+
+async def obtener_pagina_async(db, cursor=None, tamano=TAMANO_PAGINA):
+    """Como obtener_pagina(), con un AsyncClient: el stream no bloquea el event loop."""
+    clave = (cursor, tamano)
+    pagina = _pagina_cacheada(clave)
+    if pagina is not None:
+        return pagina
+    with medir_firestore('listar_pagina'):
+        documentos = [doc async for doc in _consulta_pagina(db, cursor, tamano).stream()]
+    return _guardar_pagina(clave, documentos, tamano)
+
+
+def obtener_seleccion(slugs, db=None):
+    """Los libros de ?slug=… (lista de lectura, enlaces compartidos) en el orden pedido.
+
+    Lecturas sueltas con obtener_libros: los documentos en caché no cuestan nada y el
+    resto llega en un único get_all. Devuelve (libros, None) como obtener_pagina.
+    """
+    documentos = obtener_libros(slugs[:MAX_SELECCION], db)
+    return [datos for datos in documentos.values() if datos is not None], None
+
+
 class LibroListViewFirebase(View):
-    template_name = 'libros/templates/libros/lista_libros_firebase.html'
+    """Libros de Firestore por páginas (?after=) o una selección concreta (?slug=a&slug=b)."""
+    template_name = 'libros/lista_libros_firebase.html'
+    paginate_by = TAMANO_PAGINA
 
     def get(self, request, *args, **kwargs):
         db = get_firebase_db()
-        
-        # 1. Obtener datos de la colección 'libros'
-        libros_ref = db.collection('libros')
-        
-        # 2. Convertir los documentos de Firebase a una lista de diccionarios Python
-        libros_list = []
-        for doc in libros_ref.stream():
-            libro_data = doc.to_dict()
-            libro_data['id'] = doc.id # Usar el ID del documento como clave
-            libros_list.append(libro_data)
+        if settings.FIREBASE_CONFIG.get('LISTENER_LIBROS', False):
+            _iniciar_listener(db)
+
+        slugs = request.GET.getlist('slug')
+        if slugs:
+            libros_list, siguiente_cursor = obtener_seleccion(slugs, db)
+        else:
+            # Paginación por cursor: ?after=<slug del último libro de la página anterior>
+            libros_list, siguiente_cursor = obtener_pagina(db, request.GET.get('after'), self.paginate_by)
 
         context = {
             'libros': libros_list,
+            'siguiente_cursor': siguiente_cursor,
             'is_firebase': True # Para diferenciar la versión en el template
         }
-        return render(request, self.template_name, context)
\ No newline at end of file
+        return render(request, self.template_name, context)
+
+
+class LibroListViewFirebaseAsync(LibroListViewFirebase):
+    """LibroListViewFirebase para ASGI: lee Firestore con el AsyncClient."""
+
+    async def get(self, request, *args, **kwargs):
+        if settings.FIREBASE_CONFIG.get('LISTENER_LIBROS', False) and _listener is None:
+            # on_snapshot sólo existe en el cliente síncrono (corre en su propio hilo)
+            await sync_to_async(lambda: _iniciar_listener(get_firebase_db()))()
+        request.user = await request.auser()
+
+        slugs = request.GET.getlist('slug')
+        if slugs:
+            # Resuelve los slugs en SQL y usa el cliente síncrono: fuera del event loop
+            libros_list, siguiente_cursor = await sync_to_async(obtener_seleccion)(slugs)
+        else:
+            libros_list, siguiente_cursor = await obtener_pagina_async(
+                get_firebase_db_async(), request.GET.get('after'), self.paginate_by,
+            )
+
+        context = {
+            'libros': libros_list,
+            'siguiente_cursor': siguiente_cursor,
+            'is_firebase': True
+        }
+        return render(request, self.template_name, context)